@@ -0,0 +1,126 @@
+"""
+Latency analyzer for streams encoded with ENCODING__TIMESTAMP_SEI=true: reads an FLV/RTMP stream (or any input PyAV
+opens: a recorded file, MPEG-TS over tcp://, HLS), extracts the timestamp SEI of every video frame and reports
+latency distributions and gaps.
+- processing: encode time - ingest time, the worker's own delay (from the SEI alone, valid for files too).
+- ingest_to_here / encode_to_here: arrival at this reader - the SEI times, for live inputs only. The reader's clock
+  must be synchronised with the worker's (NTP); run it next to each hop (Nginx relay, a player) to split the delay.
+- gaps: frame numbers missing between consecutive frames (dropped upstream of this reader), restarts of the frame
+  counter (worker restarted) and stalls where consecutive frames arrive (live) or were encoded more than --stall-ms
+  apart.
+Run with: uv run python scripts/analyze_latency.py rtmp://localhost/live/stream --duration 60 [--output latency.json]
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from itertools import pairwise
+from typing import Any
+
+from stream_workers import demux, encode
+from stream_workers.bench_stats import summarize
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Sample:
+    stamp: encode.FrameTimestamp
+    arrival: float  # wall clock when this reader got the frame
+
+
+def read_samples(url: str, duration: float, max_frames: int) -> tuple[list[Sample], int]:
+    """Timestamped frames read from url for up to duration seconds / max_frames (0 = no limit); plus frames without SEI."""
+    container = demux.open_input(url, timeout=(10.0, 10.0))
+    samples: list[Sample] = []
+    unstamped = 0
+    deadline = time.monotonic() + duration if duration > 0 else None
+    try:
+        for packet in container.demux(video=0):
+            if not packet.size:
+                continue
+            stamp = encode.read_timestamp_sei(bytes(packet))
+            if stamp is None:
+                unstamped += 1
+            else:
+                samples.append(Sample(stamp, time.time()))
+            if (max_frames and len(samples) >= max_frames) or (deadline is not None and time.monotonic() >= deadline):
+                break
+    finally:
+        container.close()
+    return samples, unstamped
+
+
+def find_gaps(samples: list[Sample], stall_seconds: float, live: bool) -> dict[str, Any]:
+    """Missing frame numbers, counter restarts and stalls between consecutive samples (in reading order)."""
+    missing = 0
+    restarts = 0
+    stalls: list[dict[str, float]] = []
+    for a, b in pairwise(samples):
+        step = b.stamp.frame - a.stamp.frame
+        if step <= 0:
+            restarts += 1
+            continue
+        missing += step - 1
+        delta = b.arrival - a.arrival if live else b.stamp.encode_time - a.stamp.encode_time
+        if delta > stall_seconds:
+            stalls.append({"frame": b.stamp.frame, "seconds": round(delta, 3)})
+    return {
+        "missing_frames": missing,
+        "restarts": restarts,
+        "stalls": len(stalls),
+        "longest_stalls": sorted(stalls, key=lambda s: -s["seconds"])[:10],
+    }
+
+
+def analyze(samples: list[Sample], unstamped: int, stall_seconds: float, live: bool) -> dict[str, Any]:
+    elapsed = samples[-1].arrival - samples[0].arrival if len(samples) > 1 else 0.0
+    latencies = {"processing": [s.stamp.processing_seconds for s in samples]}
+    if live:
+        latencies["ingest_to_here"] = [s.arrival - s.stamp.ingest_time for s in samples]
+        latencies["encode_to_here"] = [s.arrival - s.stamp.encode_time for s in samples]
+    return {
+        "frames": len(samples),
+        "frames_without_sei": unstamped,
+        "latency": {name: summarize(values, elapsed) for name, values in latencies.items()},
+        "gaps": find_gaps(samples, stall_seconds, live),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Report latency and gaps from the timestamp SEI of a worker stream.")
+    parser.add_argument("url", help="stream URL (rtmp://, tcp://, http://...) or file")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to read a live stream (0 = until it ends)")
+    parser.add_argument("--frames", type=int, default=0, help="stop after this many timestamped frames (0 = no limit)")
+    parser.add_argument("--stall-ms", type=float, default=500.0, help="gap between consecutive frames reported as a stall")
+    parser.add_argument("--output", help="also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    live = demux.is_network_url(args.url)
+    samples, unstamped = read_samples(args.url, args.duration if live else 0.0, args.frames)
+    if not samples:
+        print(f"No timestamp SEI in {unstamped} frames of {args.url} (is ENCODING__TIMESTAMP_SEI=true on the worker?)")
+        return 1
+    report = analyze(samples, unstamped, args.stall_ms / 1000.0, live)
+    print(f"{report['frames']} timestamped frames ({unstamped} without SEI) from {args.url}")
+    for name, result in report["latency"].items():
+        print(
+            f"{name:<16} p50 {result['p50_ms']:>9.1f} ms  p95 {result['p95_ms']:>9.1f} ms  p99 {result['p99_ms']:>9.1f} ms  max {result['max_ms']:>9.1f} ms"
+        )
+    gaps = report["gaps"]
+    print(
+        f"gaps: {gaps['missing_frames']} missing frames, {gaps['restarts']} counter restarts, {gaps['stalls']} stalls > {args.stall_ms:.0f} ms"
+    )
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
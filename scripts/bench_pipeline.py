@@ -0,0 +1,235 @@
+"""
+Benchmarks for the stream worker stages on docker/test_media/sample.mp4 and synthetic frames:
+demux+decode, overlay tile rendering (several ranking/alert sizes), overlay blend (on RGB, and in place on pooled
+yuv420p frames as the Pipeline does), yuv420p <-> RGB conversions, PTS/DTS rewrite, H.264 encode at the configured ENCODING__* settings, and the full Pipeline into a null sink.
+Each benchmark reports throughput and per-frame latency percentiles; results are written as JSON.
+--compare flags benchmarks whose p50 latency or throughput regressed by more than --threshold against a baseline
+(exit code 1), so a change to overlay, encode or pts_dts can be checked before it ships.
+Run with: uv run python scripts/bench_pipeline.py [--frames N] [--output bench_results.json] [--compare bench_baseline.json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
+from datetime import UTC, datetime
+from typing import Any
+
+import av
+from PIL import Image
+
+from config.settings import get_settings
+from stream_workers import demux, encode, file_out, overlay, pts_dts
+from stream_workers.bench_stats import summarize
+from stream_workers.frame_pool import FramePool, YuvTile
+from stream_workers.pipeline import Pipeline
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEDIA = os.path.join(os.path.dirname(__file__), "..", "docker", "test_media", "sample.mp4")
+# (ranking entries, alerts) per overlay render benchmark
+OVERLAY_SIZES = ((0, 1), (10, 1), (10, 10), (10, 30))
+
+
+def _timed(items: Iterator[Any], fn: Callable[[Any], Any]) -> dict[str, float]:
+    latencies = []
+    started = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def decoded_frames(media: str, count: int) -> list[av.VideoFrame]:
+    """count decoded frames, looping the file as needed."""
+    frames: list[av.VideoFrame] = []
+    while len(frames) < count:
+        container = demux.open_input(media)
+        try:
+            for packet in demux.iter_packets(container):
+                for frame in packet.decode():
+                    if isinstance(frame, av.VideoFrame):
+                        frames.append(frame)
+                if len(frames) >= count:
+                    break
+        finally:
+            container.close()
+    return frames[:count]
+
+
+def overlay_state(ranking: int, alerts: int) -> overlay.OverlayState:
+    state = overlay.OverlayState()
+    state.update(
+        [{"position": i, "identifier": f"Donor{i}", "amount": 1000 - i} for i in range(1, ranking + 1)],
+        [{"message": f"PIX received from Donor{i}: R$ {i},00"} for i in range(alerts)],
+        {"url": "https://example.com/pay", "label": "Donate"},
+    )
+    return state
+
+
+def bench_demux_decode(media: str, count: int) -> dict[str, float]:
+    latencies: list[float] = []
+    started = time.perf_counter()
+    while len(latencies) < count:
+        container = demux.open_input(media)
+        try:
+            packets = demux.iter_packets(container)
+            while len(latencies) < count:
+                t0 = time.perf_counter()
+                packet = next(packets, None)
+                if packet is None:
+                    break
+                frames = [f for f in packet.decode() if isinstance(f, av.VideoFrame)]
+                if frames:
+                    latencies.append(time.perf_counter() - t0)
+        finally:
+            container.close()
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def bench_overlay_render(ranking: int, alerts: int, count: int) -> dict[str, float]:
+    state = overlay_state(ranking, alerts)
+    return _timed(iter(range(count)), lambda _i: overlay.render_overlay_layer(state, "full"))
+
+
+def bench_overlay_blend(images: list[Image.Image], tile: Image.Image) -> dict[str, float]:
+    return _timed(iter(images), lambda image: image.paste(tile, (0, 0), tile))
+
+
+def bench_overlay_blend_pooled(frames: list[av.VideoFrame], tile: Image.Image) -> dict[str, float]:
+    pool, yuv_tile = FramePool(frames[0].width, frames[0].height), YuvTile.from_image(tile)
+    return _timed(iter(frames), lambda frame: yuv_tile.blend(pool.copy(frame)[1]))
+
+
+def bench_yuv_to_rgb(frames: list[av.VideoFrame]) -> dict[str, float]:
+    return _timed(iter(frames), lambda frame: frame.to_image())
+
+
+def bench_rgb_to_yuv(images: list[Image.Image]) -> dict[str, float]:
+    return _timed(iter(images), lambda image: av.VideoFrame.from_image(image).reformat(format="yuv420p"))
+
+
+def bench_pts_dts(frames: list[av.VideoFrame]) -> dict[str, float]:
+    state = pts_dts.PTSState()
+    return _timed(iter(frames), state.rewrite)
+
+
+def bench_encode(frames: list[av.VideoFrame]) -> dict[str, float]:
+    settings = get_settings().encoding
+    enc = encode.create_video_encoder(width=frames[0].width, height=frames[0].height, fps=settings.fps, settings=settings)
+    state = pts_dts.PTSState()
+
+    def encode_one(frame: av.VideoFrame) -> None:
+        state.rewrite(frame)
+        encode.encode_frame(enc, frame)
+
+    result = _timed(iter(frames), encode_one)
+    list(enc.encode(None))
+    return result
+
+
+def bench_full_pipeline(media: str, count: int) -> dict[str, float]:
+    """Pipeline (demux -> overlay -> PTS/DTS -> encode) with no outputs; latency from its frame-timing trace."""
+    pipeline = Pipeline("bench", media, [], overlay_state=overlay_state(10, 10), output_file=file_out.NULL_OUTPUT)
+    thread = threading.Thread(target=pipeline.run, daemon=True)
+    started = time.perf_counter()
+    thread.start()
+    while pipeline.frames < count and thread.is_alive():
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    pipeline.stop()
+    thread.join()
+    rows = pipeline.frame_timings.rows(count)
+    return summarize([row[-1] for row in rows], elapsed)
+
+
+def run_all(media: str, count: int) -> dict[str, dict[str, float]]:
+    results: dict[str, dict[str, float]] = {}
+
+    def record(name: str, result: dict[str, float]) -> None:
+        results[name] = result
+        print(f"{name:<28} {result['fps']:>9.1f}/s  p50 {result['p50_ms']:>8.3f} ms  p99 {result['p99_ms']:>8.3f} ms", flush=True)
+
+    record("demux_decode", bench_demux_decode(media, count))
+    frames = decoded_frames(media, count)
+    for ranking, alerts in OVERLAY_SIZES:
+        record(f"overlay_render_r{ranking}_a{alerts}", bench_overlay_render(ranking, alerts, max(20, count // 5)))
+    record("yuv420p_to_rgb", bench_yuv_to_rgb(frames))
+    images = [frame.to_image() for frame in frames]
+    tile = overlay.render_overlay_layer(overlay_state(10, 10), "full")
+    if tile is not None:
+        record("overlay_blend", bench_overlay_blend(images, tile))
+        record("overlay_blend_pooled_yuv", bench_overlay_blend_pooled(frames, tile))
+    record("rgb_to_yuv420p", bench_rgb_to_yuv(images))
+    record("pts_dts_rewrite", bench_pts_dts(decoded_frames(media, count)))
+    record("encode", bench_encode(decoded_frames(media, count)))
+    record("full_pipeline_null_sink", bench_full_pipeline(media, count))
+    return results
+
+
+def compare(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]], threshold: float) -> list[str]:
+    """Regressions: p50 latency up or throughput down by more than threshold (fraction) vs baseline."""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if base["p50_ms"] > 0 and current["p50_ms"] > base["p50_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p50 {base['p50_ms']:.3f} -> {current['p50_ms']:.3f} ms")
+        if base["fps"] > 0 and current["fps"] < base["fps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['fps']:.1f} -> {current['fps']:.1f}/s")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the stream worker stages.")
+    parser.add_argument("--media", default=DEFAULT_MEDIA, help="input file (default: docker/test_media/sample.mp4)")
+    parser.add_argument("--frames", type=int, default=300, help="frames per benchmark")
+    parser.add_argument("--output", default="bench_results.json", help="results file (JSON)")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline results file; exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression as a fraction (default 0.10)")
+    args = parser.parse_args()
+
+    results = run_all(args.media, args.frames)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(UTC).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pyav": av.__version__,
+            "machine": platform.machine(),
+            "cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+            "media": os.path.basename(args.media),
+            "frames": args.frames,
+            "encoding": get_settings().encoding.model_dump(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        if not os.path.exists(args.compare):
+            print(f"No baseline at {args.compare}; skipping comparison")
+            return 0
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print(f"Regressions beyond {args.threshold:.0%} vs {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} vs {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,82 +2,64 @@ import argparse
 import logging
 import os
 import signal
-import subprocess
 import sys
 
 import av
-from PIL import Image
 
 from config.settings import get_settings
 from overlay_api import youtube as youtube_module
 from stream_workers import demux, encode, overlay, pts_dts, rtmp_out
+from stream_workers.frame_pool import FramePool, YuvTileCache
 
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
 
-def _frame_to_pil(frame: av.VideoFrame) -> Image.Image:
-    rgb = frame.reformat(format="rgb24")
-    w, h = rgb.width, rgb.height
-    data = rgb.planes[0].to_bytes()
-    return Image.frombytes("RGB", (w, h), data)
-
-
-def _pil_to_yuv420p_frame(pil_image: Image.Image, width: int, height: int) -> av.VideoFrame:
-    rgb_frame = av.VideoFrame(width, height, format="rgb24")
-    rgb_frame.planes[0].update(pil_image.tobytes())
-    return rgb_frame.reformat(format="yuv420p")
-
-
-def _draw_overlay_on_frame(frame: av.VideoFrame) -> av.VideoFrame:
-    pil = _frame_to_pil(frame)
-    out_pil = overlay.render_overlay_on_image(pil)
-    return _pil_to_yuv420p_frame(out_pil, frame.width, frame.height)
-
-
-def _stop_ffmpeg(proc: subprocess.Popen[bytes] | None) -> None:
-    if proc is None or proc.stdin is None:
-        return
-    try:
-        proc.stdin.close()
-        proc.wait(timeout=5)
-    except Exception:
-        proc.kill()
+def _draw_overlay_on_frame(frame: av.VideoFrame, pool: FramePool, tiles: YuvTileCache) -> av.VideoFrame:
+    """Overlay blended in place on a pooled copy of frame (the tile's yuv420p planes are converted once per version)."""
+    fitted = frame.reformat(width=pool.width, height=pool.height, format="yuv420p")  # frame itself when it matches
+    tile = tiles.get(overlay.get_overlay_version(), overlay.render_overlay_layer)
+    if tile is None:
+        return fitted
+    out, views = pool.copy(fitted)
+    tile.blend(views)
+    return out
 
 
 def _process_file(
     file_path: str,
     enc_cfg: object,
     enc: av.CodecContext | None,
-    rtmp_proc: subprocess.Popen[bytes] | None,
+    fanout: rtmp_out.FanOut,
+    loop: bool,
     shutdown_flag: list[bool],
-) -> tuple[av.CodecContext | None, subprocess.Popen[bytes] | None, bool]:
+) -> tuple[av.CodecContext | None, bool]:
     container = demux.open_input(file_path)
     try:
         video_stream = demux.get_video_stream(container)
         if not video_stream:
             logger.error("No video stream in file")
-            return (enc, rtmp_proc, True)
+            return (enc, True)
         if enc is None:
             enc = encode.create_video_encoder(
                 width=video_stream.width or enc_cfg.default_width,
                 height=video_stream.height or enc_cfg.default_height,
                 fps=enc_cfg.fps,
             )
-        for packet in demux.iter_packets(container):
+        pool, tiles = FramePool(enc.width, enc.height), YuvTileCache()
+        # --loop seeks back within the open file (timestamps keep increasing) instead of reopening it
+        packets = demux.iter_looping_packets(container, video_stream) if loop else demux.iter_packets(container)
+        for packet in packets:
             if shutdown_flag[0]:
-                return (enc, rtmp_proc, True)
+                return (enc, True)
             for frame in packet.decode():
                 if not isinstance(frame, av.VideoFrame):
                     continue
-                overlay_frame = _draw_overlay_on_frame(frame)
+                overlay_frame = _draw_overlay_on_frame(frame, pool, tiles)
                 pts_dts.rewrite_pts_dts(overlay_frame)
                 for pkt in encode.encode_frame(enc, overlay_frame):
-                    if rtmp_proc and rtmp_proc.stdin is not None:
-                        if not rtmp_out.write_packet(rtmp_proc, bytes(pkt)):
-                            rtmp_proc = None
-                            break
-        return (enc, rtmp_proc, False)
+                    fanout.send(rtmp_out.OutputPacket(memoryview(pkt), pkt.is_keyframe))
+        return (enc, False)
     finally:
         container.close()
 
@@ -99,20 +81,15 @@ def run_pipeline(
         )
         return 1
 
-    rtmp_proc = rtmp_out.start_rtmp_process(urls[0])
-    if rtmp_proc is None:
-        logger.error("Failed to start FFmpeg. Is ffmpeg installed?")
-        return 1
+    # One encode, delivered to every channel (each destination has its own FFmpeg and buffer)
+    fanout = rtmp_out.create_fanout(urls)
 
     enc_cfg = get_settings().encoding
     enc: av.CodecContext | None = None
     try:
-        while not shutdown_flag[0]:
-            enc, rtmp_proc, should_exit = _process_file(file_path, enc_cfg, enc, rtmp_proc, shutdown_flag)
-            if should_exit or not loop or shutdown_flag[0]:
-                break
+        _process_file(file_path, enc_cfg, enc, fanout, loop, shutdown_flag)
     finally:
-        _stop_ffmpeg(rtmp_proc)
+        fanout.close()
     return 0
 
 
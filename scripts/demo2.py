@@ -2,23 +2,20 @@ import argparse
 import logging
 import os
 import signal
-import subprocess
 import sys
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import av
-from PIL import Image
 from pydantic import BaseModel, model_validator
 
 from config.settings import EncodingSettings, get_settings
 from overlay_api import youtube as youtube_module
 from stream_workers import demux, encode, overlay, pts_dts, rtmp_out
+from stream_workers.frame_pool import FramePool, YuvTileCache
 
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
-FFMPEG_STOP_TIMEOUT = 5.0
-
 
 class StreamDemoConfig(BaseModel):
     video_file: str
@@ -37,7 +34,9 @@ class StreamDemoConfig(BaseModel):
 @dataclass
 class PipelineState:
     encoder: av.CodecContext | None
-    rtmp_proc: subprocess.Popen[bytes] | None
+    fanout: rtmp_out.FanOut
+    frame_pool: FramePool | None = None
+    tiles: YuvTileCache = field(default_factory=YuvTileCache)
 
 
 class StreamPipeline:
@@ -52,19 +51,16 @@ class StreamPipeline:
             payment_link={"url": self.config.payment_url, "label": self.config.payment_label},
         )
 
-        rtmp_proc = self._start_rtmp()
-        if rtmp_proc is None:
-            logger.error("Failed to start FFmpeg. Is ffmpeg installed?")
+        fanout = self._start_fanout()
+        if fanout is None:
             return 1
 
-        self._state = PipelineState(encoder=None, rtmp_proc=rtmp_proc)
-        while not shutdown[0]:
-            if self._process_file(shutdown) or not self.config.loop:
-                break
-        self._stop_ffmpeg(self._state.rtmp_proc)
+        self._state = PipelineState(encoder=None, fanout=fanout)
+        self._process_file(shutdown)
+        fanout.close()
         return 0
 
-    def _start_rtmp(self) -> subprocess.Popen[bytes] | None:
+    def _start_fanout(self) -> rtmp_out.FanOut | None:
         urls = youtube_module.get_ingestion_urls()
         if not urls:
             logger.error(
@@ -72,13 +68,7 @@ class StreamPipeline:
                 "YOUTUBE__REFRESH_TOKENS (e.g. from /youtube/connect)."
             )
             return None
-        return rtmp_out.start_rtmp_process(urls[0])
-
-    def _stop_ffmpeg(self, proc: subprocess.Popen[bytes] | None) -> None:
-        if proc is None or proc.stdin is None:
-            return
-        proc.stdin.close()
-        proc.wait(timeout=FFMPEG_STOP_TIMEOUT)
+        return rtmp_out.create_fanout(urls)
 
     def _process_file(self, shutdown: list[bool]) -> bool:
         assert self._state is not None
@@ -96,8 +86,14 @@ class StreamPipeline:
                 height=stream.height or c.default_height,
                 fps=c.fps,
             )
-
-        for packet in demux.iter_packets(container):
+            self._state.frame_pool = FramePool(self._state.encoder.width, self._state.encoder.height)
+
+        # --loop seeks back within the open file (timestamps keep increasing) instead of reopening it
+        if self.config.loop:
+            packets = demux.iter_looping_packets(container, stream)
+        else:
+            packets = demux.iter_packets(container)
+        for packet in packets:
             if shutdown[0]:
                 container.close()
                 return True
@@ -110,24 +106,20 @@ class StreamPipeline:
     def _process_frame(self, frame: av.VideoFrame) -> None:
         assert self._state is not None
         encoder = self._state.encoder
-        rtmp_proc = self._state.rtmp_proc
-        if encoder is None or rtmp_proc is None or rtmp_proc.stdin is None:
+        if encoder is None:
             return
 
-        rgb = frame.reformat(format="rgb24")
-        pil = Image.frombytes("RGB", (rgb.width, rgb.height), rgb.planes[0].to_bytes())
-        pil = overlay.render_overlay_on_image(pil)
-        out_rgb = av.VideoFrame(frame.width, frame.height, format="rgb24")
-        out_rgb.planes[0].update(pil.tobytes())
-        out_frame = out_rgb.reformat(format="yuv420p")
+        pool = self._state.frame_pool
+        assert pool is not None
+        out_frame = frame.reformat(width=pool.width, height=pool.height, format="yuv420p")  # frame itself when it matches
+        tile = self._state.tiles.get(overlay.get_overlay_version(), overlay.render_overlay_layer)
+        if tile is not None:
+            out_frame, views = pool.copy(out_frame)
+            tile.blend(views)
         pts_dts.rewrite_pts_dts(out_frame)
 
         for pkt in encode.encode_frame(encoder, out_frame):
-            if self._state.rtmp_proc is None:
-                return
-            if not rtmp_out.write_packet(self._state.rtmp_proc, bytes(pkt)):
-                self._state.rtmp_proc = None
-                return
+            self._state.fanout.send(rtmp_out.OutputPacket(memoryview(pkt), pkt.is_keyframe))
 
 
 def main() -> int:
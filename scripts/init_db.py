@@ -1,5 +1,5 @@
 """
-Create Donor, RankingEntry, PIXAlert, OverlayPaymentLink tables. Run once or as migration.
+Create Donor, RankingEntry, PIXAlert, OverlayPaymentLink, ProcessedStripeEvent tables. Run once or as migration.
 Run with: uv run python scripts/init_db.py
 """
 
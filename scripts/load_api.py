@@ -0,0 +1,396 @@
+"""
+Load generator for the overlay API: drives /stripe-webhook, /donors, /alerts, /ranking, PUT /payment-link and
+GET /overlay with a donation-burst profile, and reports throughput, latency percentiles and error rates per endpoint.
+Webhook payloads are signed locally with a test secret (the API must run with the same STRIPE__WEBHOOK_SECRET);
+a share of them are redeliveries of earlier events, to exercise dedupe.
+Requests are sent open-loop on a schedule, and latency is measured from the scheduled send time, so a slow
+server shows up as latency instead of a lower request rate.
+Meanwhile a poller calls the worker's get_overlay_snapshot() against the same DB (DB__* settings) and checks that
+every snapshot is consistent: one complete ranking generation and a payment link whose url and label belong together.
+Run with: uv run python scripts/load_api.py --start-api --profile burst --duration 60
+"""
+
+import argparse
+import hashlib
+import hmac
+import http.client
+import itertools
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from sqlalchemy.orm import Session
+
+from config.settings import get_settings
+from stream_workers import db
+from stream_workers.bench_stats import summarize
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+TEST_WEBHOOK_SECRET = "whsec_load_test"
+RANKING_SIZE = 10
+DEFAULT_MIX = {"stripe_webhook": 50, "get_overlay": 30, "ranking": 8, "alerts": 6, "donors": 3, "payment_link": 3}
+
+
+@dataclass(frozen=True)
+class LoadProfile:
+    """Request rate over time: base_rps, raised to burst_rps for burst_seconds every burst_every_seconds."""
+
+    base_rps: float
+    burst_rps: float = 0.0
+    burst_seconds: float = 0.0
+    burst_every_seconds: float = 0.0
+    burst_offset_seconds: float = 0.0
+
+    def rate(self, t: float) -> float:
+        if self.burst_rps > 0 and self.burst_every_seconds > 0 and t >= self.burst_offset_seconds:
+            if (t - self.burst_offset_seconds) % self.burst_every_seconds < self.burst_seconds:
+                return self.burst_rps
+        return self.base_rps
+
+
+PROFILES = {
+    "steady": LoadProfile(base_rps=20),
+    # Donation bursts (e.g. a raid or a goal): 40x the base rate for 5 s every 30 s
+    "burst": LoadProfile(base_rps=5, burst_rps=200, burst_seconds=5, burst_every_seconds=30, burst_offset_seconds=5),
+    # One large spike 10 s in
+    "spike": LoadProfile(base_rps=5, burst_rps=500, burst_seconds=3, burst_every_seconds=1e9, burst_offset_seconds=10),
+}
+
+
+def sign_stripe_payload(payload: bytes, secret: str, timestamp: int | None = None) -> str:
+    """Stripe-Signature header value accepted by stripe.Webhook.construct_event for secret."""
+    ts = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), f"{ts}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={ts},v1={signature}"
+
+
+def checkout_completed_event(amount_cents: int) -> dict[str, Any]:
+    session_id = f"cs_test_{uuid.uuid4().hex[:24]}"
+    return {
+        "id": f"evt_load_{uuid.uuid4().hex}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "data": {"object": {"id": session_id, "object": "checkout.session", "amount_total": amount_cents, "customer_email": ""}},
+    }
+
+
+@dataclass
+class EndpointStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: dict[str, int] = field(default_factory=dict)
+
+
+class LoadClient:
+    """Per-thread keep-alive connections to the API and the request builders for each endpoint."""
+
+    def __init__(self, base_url: str, secret: str, api_key: str, duplicate_ratio: float) -> None:
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 80
+        self.secret = secret
+        self.api_key = api_key
+        self.duplicate_ratio = duplicate_ratio
+        self._local = threading.local()
+        self._sent_events: list[bytes] = []
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _request(self, method: str, path: str, body: bytes | None = None, headers: dict[str, str] | None = None) -> int:
+        conn: http.client.HTTPConnection | None = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self._local.conn = conn
+        all_headers = {"Content-Type": "application/json", **(headers or {})}
+        if self.api_key:
+            all_headers["X-API-Key"] = self.api_key
+        try:
+            conn.request(method, path, body=body, headers=all_headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+
+    def _json(self, method: str, path: str, data: Any) -> int:
+        return self._request(method, path, json.dumps(data).encode())
+
+    def stripe_webhook(self) -> int:
+        with self._lock:
+            resend = self._sent_events and random.random() < self.duplicate_ratio
+            payload = random.choice(self._sent_events) if resend else None
+        if payload is None:
+            payload = json.dumps(checkout_completed_event(random.randint(100, 50_000))).encode()
+            with self._lock:
+                self._sent_events.append(payload)
+                del self._sent_events[:-1000]
+        return self._request("POST", "/stripe-webhook", payload, {"Stripe-Signature": sign_stripe_payload(payload, self.secret)})
+
+    def donors(self) -> int:
+        return self._json("POST", "/donors", {"identifier": f"load-{uuid.uuid4().hex[:8]}", "amount": random.randint(1, 500)})
+
+    def alerts(self) -> int:
+        now = datetime.now(UTC)
+        return self._json(
+            "POST",
+            "/alerts",
+            {
+                "message": f"PIX received: R$ {random.randint(1, 500)},00",
+                "show_at": now.isoformat(),
+                "hide_at": (now + timedelta(seconds=random.randint(5, 30))).isoformat(),
+            },
+        )
+
+    def ranking(self) -> int:
+        generation = next(self._counter)
+        entries = [
+            {"position": p, "donor_id": p, "amount": float(1000 - p), "identifier": f"g{generation}-p{p}"}
+            for p in range(1, RANKING_SIZE + 1)
+        ]
+        return self._json("POST", "/ranking", {"entries": entries})
+
+    def payment_link(self) -> int:
+        n = next(self._counter)
+        return self._json("PUT", "/payment-link", {"url": f"https://example.com/pay/{n}", "label": f"L{n}", "active": True})
+
+    def get_overlay(self) -> int:
+        return self._request("GET", "/overlay")
+
+
+def latency_summary(latencies: list[float], elapsed: float) -> dict[str, float]:
+    """bench_stats.summarize with request naming (count and rate instead of frames and fps)."""
+    summary = summarize(latencies, elapsed)
+    return {"requests": summary.pop("frames"), "rps": summary.pop("fps"), **summary}
+
+
+def check_snapshot(snapshot: tuple[list[dict[str, Any]], list[dict[str, Any]], dict[str, Any] | None]) -> list[str]:
+    """Consistency violations in one overlay snapshot (writes by this tool are all-or-nothing)."""
+    ranking, _alerts, link = snapshot
+    problems = []
+    positions = [row["position"] for row in ranking]
+    if positions != sorted(set(positions)):
+        problems.append(f"ranking positions not unique/sorted: {positions}")
+    generations = {str(row["identifier"]).split("-", 1)[0] for row in ranking if str(row["identifier"]).startswith("g")}
+    if len(generations) > 1 or (generations and len(ranking) != RANKING_SIZE):
+        problems.append(f"partial ranking: {len(ranking)} rows from generations {sorted(generations)}")
+    if link is not None and link.get("url", "").startswith("https://example.com/pay/"):
+        if link.get("label") != "L" + link["url"].rsplit("/", 1)[1]:
+            problems.append(f"payment link url/label mismatch: {link}")
+    return problems
+
+
+class SnapshotPoller:
+    """Polls get_overlay_snapshot() like the worker does (faster), recording latency, errors and violations."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.latencies: list[float] = []
+        self.errors = 0
+        self.violations: list[str] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="snapshot-poller", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            try:
+                snapshot = db.get_overlay_snapshot()
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Snapshot failed: %s", e)
+            else:
+                self.latencies.append(time.perf_counter() - started)
+                self.violations.extend(check_snapshot(snapshot))
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def run_load(
+    client: LoadClient, profile: LoadProfile, duration: float, concurrency: int, mix: dict[str, int]
+) -> tuple[dict[str, EndpointStats], float, int]:
+    """Send requests on profile's schedule for duration seconds; returns (stats per endpoint, elapsed, skipped)."""
+    endpoints: dict[str, Callable[[], int]] = {name: getattr(client, name) for name in mix}
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    stats = {name: EndpointStats() for name in names}
+    lock = threading.Lock()
+    in_flight = threading.Semaphore(concurrency * 50)
+    skipped = 0
+
+    def send(name: str, scheduled: float) -> None:
+        try:
+            try:
+                status = endpoints[name]()
+                error = status >= 400
+            except Exception:
+                status, error = 0, True
+            latency = time.perf_counter() - scheduled
+            with lock:
+                entry = stats[name]
+                entry.latencies.append(latency)
+                entry.statuses[str(status)] = entry.statuses.get(str(status), 0) + 1
+                entry.errors += int(error)
+        finally:
+            in_flight.release()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load") as executor:
+        t = 0.0
+        while t < duration:
+            scheduled = started + t
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if in_flight.acquire(blocking=False):
+                executor.submit(send, random.choices(names, weights)[0], scheduled)
+            else:
+                skipped += 1  # client saturated; the report shows it instead of hiding it in the schedule
+            t += 1.0 / max(profile.rate(t), 0.1)
+    return stats, time.perf_counter() - started, skipped
+
+
+def _start_api(port: int, workdir: str) -> subprocess.Popen[bytes]:
+    env = {
+        **os.environ,
+        "API__PORT": str(port),
+        "API__HOST": "127.0.0.1",
+        "API__RUNTIME_DIR": os.path.join(workdir, "runtime"),
+        "STRIPE__WEBHOOK_SECRET": TEST_WEBHOOK_SECRET,
+    }
+    process = subprocess.Popen([sys.executable, "-m", "overlay_api.app"], cwd=workdir, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1).read()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError(f"overlay API exited with code {process.returncode}") from None
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("overlay API did not start within 30 s")
+
+
+def _init_schema() -> None:
+    engine = db.get_engine()
+    db.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        if session.get(db.OverlayPaymentLink, 1) is None:
+            session.add(db.OverlayPaymentLink(id=1, url=None, label=None, active=False))
+            session.commit()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load-test the overlay API and check worker snapshot consistency.")
+    parser.add_argument("--url", default="http://127.0.0.1:5001", help="API base URL (ignored with --start-api)")
+    parser.add_argument("--start-api", action="store_true", help="start the API (gunicorn) locally with the test webhook secret")
+    parser.add_argument("--port", type=int, default=5098, help="port for --start-api")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="burst")
+    parser.add_argument("--rps", type=float, help="override the profile's base request rate")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=32, help="client threads")
+    parser.add_argument("--mix", default=json.dumps(DEFAULT_MIX), help="JSON endpoint weights")
+    parser.add_argument("--duplicates", type=float, default=0.05, help="share of webhook redeliveries")
+    parser.add_argument("--secret", default=TEST_WEBHOOK_SECRET, help="STRIPE__WEBHOOK_SECRET of the API")
+    parser.add_argument("--api-key", default=os.environ.get("API__PAYMENT_LINK_API_KEY", ""))
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="get_overlay_snapshot() poll interval (s)")
+    parser.add_argument("--output", default="load_results.json", help="results file (JSON)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="exit 1 above this error rate")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    profile = PROFILES[args.profile]
+    if args.rps is not None:
+        profile = LoadProfile(args.rps, profile.burst_rps, profile.burst_seconds, profile.burst_every_seconds, profile.burst_offset_seconds)
+    mix = json.loads(args.mix)
+    api = None
+    base_url = args.url
+    if args.start_api:
+        workdir = os.getcwd()
+        if not get_settings().db.user:
+            # SQLite lives at ./overlay.db: API and poller share a scratch directory
+            workdir = tempfile.mkdtemp(prefix="overlay-load-")
+            os.chdir(workdir)
+        _init_schema()
+        api = _start_api(args.port, workdir)
+        base_url = f"http://127.0.0.1:{args.port}"
+        args.secret = TEST_WEBHOOK_SECRET
+
+    client = LoadClient(base_url, args.secret, args.api_key, args.duplicates)
+    poller = SnapshotPoller(args.poll_interval)
+    poller.start()
+    try:
+        stats, elapsed, skipped = run_load(client, profile, args.duration, args.concurrency, mix)
+    finally:
+        poller.stop()
+        if api is not None:
+            api.terminate()
+            api.wait(30)
+
+    endpoints = {}
+    total = errors = 0
+    for name, entry in stats.items():
+        endpoints[name] = {**latency_summary(entry.latencies, elapsed), "errors": entry.errors, "statuses": entry.statuses}
+        total += len(entry.latencies)
+        errors += entry.errors
+        r = endpoints[name]
+        print(
+            f"{name:<16} {r['requests']:>7} req {r['rps']:>8.1f}/s  p50 {r['p50_ms']:>8.1f}  p99 {r['p99_ms']:>8.1f} ms  errors {entry.errors}"
+        )
+    error_rate = errors / total if total else 0.0
+    snapshot = {**latency_summary(poller.latencies, elapsed), "errors": poller.errors, "violations": len(poller.violations)}
+    print(f"{'TOTAL':<16} {total:>7} req {total / elapsed:>8.1f}/s  error rate {error_rate:.2%}  client-skipped {skipped}")
+    print(
+        f"snapshot poller  p50 {snapshot['p50_ms']:.1f}  p99 {snapshot['p99_ms']:.1f} ms  errors {poller.errors}  violations {len(poller.violations)}"
+    )
+    for violation in poller.violations[:10]:
+        print(f"  violation: {violation}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(UTC).isoformat(timespec="seconds"),
+            "url": base_url,
+            "database": "postgresql" if get_settings().db.user else "sqlite",
+            "profile": args.profile,
+            "profile_settings": profile.__dict__,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "mix": mix,
+        },
+        "total": {"requests": total, "rps": round(total / elapsed, 2), "error_rate": round(error_rate, 4), "client_skipped": skipped},
+        "endpoints": endpoints,
+        "snapshot_poller": snapshot,
+        "violations": poller.violations[:100],
+    }
+    with open(output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"Results written to {output}")
+    return 1 if error_rate > args.max_error_rate or poller.violations or poller.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
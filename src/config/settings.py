@@ -3,7 +3,9 @@ Centralized configuration via Pydantic Settings.
 All settings and parameters in one file; env vars use nested delimiter (e.g. DB__HOST, API__PORT).
 """
 
+import json
 from functools import lru_cache
+from typing import Any
 
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -25,7 +27,13 @@ class DbSettings(BaseModel):
 
 
 class EncodingSettings(BaseModel):
-    """H.264 encoding defaults for YouTube Live: CBR 4500k, GOP 2s, high/4.1, zerolatency."""
+    """H.264 encoding defaults for YouTube Live: CBR 4500k, GOP 2s, high/4.1, zerolatency.
+    audio_*: the AAC track when the source audio is not AAC (transcoded) or there is none (silence).
+    timestamp_sei: embed each frame's number, ingest and encode wall-clock times as an H.264 SEI (latency analysis).
+    adaptive_bitrate: follow output backpressure (stream_workers.bitrate): at GOP boundaries the bitrate steps down by
+    bitrate_step_down while the outputs stay congested (lag or backlog over congestion_lag_seconds, writers blocked),
+    never below bitrate_floor_k, and probes back up by bitrate_step_up after bitrate_probe_seconds without backlog,
+    up to bitrate_ceiling_k (0 = cbr_bitrate_k)."""
 
     cbr_bitrate_k: int = 4500
     fps: int = 30
@@ -36,33 +44,160 @@ class EncodingSettings(BaseModel):
     encoder: str = "libx264"
     default_width: int = 1920
     default_height: int = 1080
+    audio_bitrate_k: int = 128
+    audio_sample_rate: int = 48000
+    audio_layout: str = "stereo"
+    timestamp_sei: bool = False
+    adaptive_bitrate: bool = False
+    bitrate_floor_k: int = 1500
+    bitrate_ceiling_k: int = 0
+    bitrate_step_down: float = 0.75
+    bitrate_step_up: float = 1.1
+    congestion_lag_seconds: float = 1.0
+    bitrate_probe_seconds: float = 10.0
 
 
 class ApiSettings(BaseModel):
-    """Overlay API server bind address and port; optional API key for /payment-link (FR-6)."""
+    """Overlay API server bind address and port; optional API key for /payment-link (FR-6).
+    Served by gunicorn (workers x threads, keep-alive, graceful drain) unless dev_server is set.
+    runtime_dir holds the leader lock that keeps background jobs to one worker and the overlay cache generation.
+    overlay_cache_max_age_seconds bounds cached reads when other tools write the DB directly (0 = no bound).
+    write_coalesce_window_ms > 0 merges /ranking and PUT /payment-link bursts into one write per window (dev_server or
+    workers = 1 only: several workers would each coalesce on their own and could commit out of order).
+    slow_request_ms > 0 logs requests slower than that (with their DB time); metrics are dumped under runtime_dir.
+    worker_admin_url (e.g. http://worker:9108) lets GET /preview proxy the worker's output preview ("" = off)."""
 
     host: str = "0.0.0.0"
     port: int = 5001
     payment_link_api_key: str = ""
+    dev_server: bool = False
+    workers: int = 2
+    threads: int = 8
+    keepalive_seconds: int = 5
+    timeout_seconds: int = 60
+    graceful_timeout_seconds: int = 30
+    max_requests: int = 0
+    runtime_dir: str = "/tmp/overlay-api"
+    leader_poll_seconds: float = 5.0
+    retention_days: int = 7
+    overlay_cache_max_age_seconds: float = 0.0
+    write_coalesce_window_ms: int = 0
+    slow_request_ms: int = 0
+    worker_admin_url: str = ""
+
+
+class StreamDefinition(BaseModel):
+    """One pipeline run by the multi-stream supervisor: input (and hot-standby backup inputs), outputs, overlay
+    profile (full, alerts, none), EncodingSettings overrides, and CPUs to pin to (empty = assigned round-robin)."""
+
+    name: str
+    input_url: str
+    backup_input_urls: list[str] = Field(default_factory=list)
+    output_urls: list[str] = Field(default_factory=list)
+    overlay_profile: str = "full"
+    encoding: dict[str, Any] = Field(default_factory=dict)
+    cpus: list[int] = Field(default_factory=list)
+
+    def encoding_settings(self, base: EncodingSettings) -> EncodingSettings:
+        """base with this stream's overrides applied (validated)."""
+        return EncodingSettings.model_validate({**base.model_dump(), **self.encoding})
 
 
 class WorkerSettings(BaseModel):
-    """Stream worker: overlay refresh interval, default input URL, source retry, and optional RTMP output."""
+    """Stream worker: overlay refresh interval, default input URL, source retry, and optional RTMP output.
+    backup_input_urls (JSON list) are kept open as hot standbys: when the active input delivers nothing for
+    input_stall_timeout_seconds the stream switches to a healthy one, and back to the primary once it has been
+    healthy for input_failback_seconds.
+    Inputs open with bounded probing (input_probesize bytes, input_analyzeduration_ms), open/read timeouts and, for
+    network inputs, optional input_low_delay (fflags nobuffer); reconnects back off exponentially with jitter from
+    source_retry_interval_seconds up to source_retry_max_seconds and skip probing when the stream is unchanged.
+    File inputs loop in place (seek, not reopen); input_mmap reads them through a memory map.
+    source_audio passes the input's AAC through (other codecs are transcoded); false always sends a silent track.
+    output_urls (JSON list) fans the encoded stream out to several destinations besides rtmp_output_url;
+    each gets an output_buffer_bytes buffer and reconnects with backoff up to output_reconnect_max_seconds.
+    output_socket_buffer_bytes > 0 bounds the kernel send buffer of tcp:// destinations, so congestion shows up as
+    backlog (and reaches the adaptive bitrate) instead of queueing unseen in the socket (0 = kernel default).
+    streams (JSON list) or streams_file (JSON file) define the pipelines run by the multi-stream supervisor;
+    overlay_tile_max_width/height bound the shared-memory overlay tile it publishes to them.
+    admin_host/admin_port serve /metrics (Prometheus text) from the worker or supervisor; admin_port 0 disables it.
+    On demand (SIGUSR1 / SIGUSR2 or /debug/*), profiles and the trace of the last frame_trace_size frames go to profile_dir.
+    output_file (a .flv/.mp4/.mkv/.ts path, or "null") makes main.py write the stream there instead of RTMP, unpaced
+    unless output_realtime; it stops after max_frames or max_seconds of output and writes a run summary to summary_file.
+    Every preview_interval_seconds (0 = off) a preview_width JPEG/WebP of the output is served on the admin /preview."""
 
     overlay_refresh_interval_seconds: int = 8
     default_input_url: str = "rtsp://localhost:554/stream"
-    source_retry_interval_seconds: float = 5.0
+    source_retry_interval_seconds: float = 0.5
+    source_retry_max_seconds: float = 30.0
+    input_probesize: int = 1_000_000
+    input_analyzeduration_ms: int = 1000
+    input_open_timeout_seconds: float = 5.0
+    input_read_timeout_seconds: float = 5.0
+    input_low_delay: bool = False
+    input_mmap: bool = False
+    source_audio: bool = True
+    backup_input_urls: list[str] = Field(default_factory=list)
+    input_stall_timeout_seconds: float = 0.5
+    input_failback_seconds: float = 10.0
     rtmp_output_url: str = ""
+    output_urls: list[str] = Field(default_factory=list)
+    output_buffer_bytes: int = 4_000_000
+    output_write_timeout_seconds: float = 10.0
+    output_reconnect_max_seconds: float = 30.0
+    output_socket_buffer_bytes: int = 0
+    output_stats_log_seconds: float = 60.0
+    streams: list[StreamDefinition] = Field(default_factory=list)
+    streams_file: str = ""
+    supervisor_status_log_seconds: float = 30.0
+    supervisor_restart_max_seconds: float = 60.0
+    overlay_tile_max_width: int = 1280
+    overlay_tile_max_height: int = 720
+    admin_host: str = "0.0.0.0"
+    admin_port: int = 9108
+    profile_dir: str = "/tmp/worker-profiles"
+    profile_seconds: float = 10.0
+    profile_interval_ms: float = 10.0
+    frame_trace_size: int = 10000
+    output_file: str = ""
+    output_realtime: bool = False
+    max_frames: int = 0
+    max_seconds: float = 0.0
+    summary_file: str = ""
+    preview_interval_seconds: float = 5.0
+    preview_width: int = 320
+    preview_format: str = "jpeg"
+    preview_quality: int = 70
+
+    def stream_definitions(self) -> list[StreamDefinition]:
+        """streams, or the JSON list in streams_file when streams is empty."""
+        if self.streams or not self.streams_file:
+            return list(self.streams)
+        with open(self.streams_file, encoding="utf-8") as f:
+            return [StreamDefinition.model_validate(item) for item in json.load(f)]
+
+    def destination_urls(self) -> list[str]:
+        """rtmp_output_url followed by output_urls, without duplicates or blanks."""
+        urls = [self.rtmp_output_url.strip(), *(u.strip() for u in self.output_urls)]
+        return list(dict.fromkeys(u for u in urls if u))
 
 
 class YouTubeSettings(BaseModel):
-    """YouTube Live: OAuth client and per-channel refresh tokens (JSON). Push config path for overlay API."""
+    """YouTube Live: OAuth client and per-channel refresh tokens (JSON). Push config path for overlay API.
+    Channels are provisioned in parallel (provision_max_workers), each with its own provision_timeout_seconds.
+    Access tokens are cached until token_expiry_margin_seconds before expiry, refreshed in background earlier.
+    push_control_url switches push updates from nginx reloads to per-push add/drop calls on a control endpoint."""
 
     client_id: str = ""
     client_secret: str = ""
     refresh_tokens: str = ""  # JSON: {"UCxxx":"refresh_token1",...}
     push_conf_path: str = "/etc/nginx/conf.d/youtube_push.conf"
     refresh_interval_seconds: int = 300
+    provision_max_workers: int = 8
+    provision_timeout_seconds: float = 30.0
+    token_expiry_margin_seconds: float = 60.0
+    token_early_refresh_seconds: float = 300.0
+    push_control_url: str = ""
+    push_control_app: str = "out"
 
 
 class StripeSettings(BaseModel):
@@ -2,92 +2,126 @@
 Stream worker entrypoint: demux → overlay → PTS/DTS rewrite → encode.
 On source unavailability: hold last frame until source returns; recover automatically (spec).
 Overlay: periodic read from DB (5–10 s); when DB unreachable keep last known (spec).
+Headless mode (WORKER__OUTPUT_FILE): write to a local file or null output and print a run summary at the end.
 """
 
 import logging
+import signal
 import sys
 import threading
 import time
 
-import av
-
 from config.settings import get_settings
-from stream_workers import demux, encode, overlay, pts_dts, rtmp_out
+from stream_workers import file_out, metrics, profiling
+from stream_workers.admin import metrics_route, start_admin_server
+from stream_workers.overlay_renderer import OverlayRenderer
+from stream_workers.pipeline import Pipeline
+from stream_workers.preview import preview_route
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Stub overlay data until DB connected; then refresh loop updates it
-overlay.set_overlay_data(
-    [{"position": i, "identifier": f"Donor{i}", "amount": 100 - i} for i in range(1, 11)],
-    [{"message": "PIX received from Donor1"}],
-)
-
-_last_frame_holder: list[av.VideoFrame | None] = [None]
-
 
-def _overlay_refresh_loop() -> None:
+def _overlay_refresh_loop(renderer: OverlayRenderer) -> None:
     """Periodic overlay state read from DB; on failure keep last known (contract)."""
     try:
         from stream_workers import db as db_module
     except ImportError:
         return
+    refresh_seconds = metrics.OVERLAY_REFRESH_SECONDS.labels()
     while True:
         time.sleep(get_settings().worker.overlay_refresh_interval_seconds)
+        renderer.ensure_running()
+        started = time.perf_counter()
         try:
-            ranking, alerts, payment_link = db_module.get_overlay_snapshot()
-            overlay.set_overlay_data(ranking, alerts, payment_link)
+            renderer.submit(db_module.get_overlay_snapshot())
         except Exception as e:
+            metrics.OVERLAY_DB_FAILURES.labels().inc()
             logger.debug("Overlay DB unreachable, keeping last known: %s", e)
+        refresh_seconds.observe(time.perf_counter() - started)
+
+
+def _report_summary(pipeline: Pipeline, wall_seconds: float, cpu_seconds: float) -> None:
+    """Log the headless run summary and write it as JSON to WORKER__SUMMARY_FILE (if set)."""
+    summary = file_out.summarize_run(
+        frames=pipeline.frames,
+        fps=pipeline.encoding.fps,
+        wall_seconds=wall_seconds,
+        cpu_seconds=cpu_seconds,
+        frames_dropped=pipeline.frames_dropped,
+        packets_dropped=sum(st.packets_dropped for st in pipeline.fanout.stats()) if pipeline.fanout is not None else 0,
+        bytes_written=pipeline.file_output.bytes_written if pipeline.file_output is not None else 0,
+    )
+    logger.info(
+        "Run summary: %d frames (%.1fs of output) in %.1fs: %.1f fps, %.2fx real time, %.3f CPU s per output s, %d dropped",
+        summary.frames,
+        summary.output_seconds,
+        summary.wall_seconds,
+        summary.fps,
+        summary.speed,
+        summary.cpu_per_output_second,
+        summary.frames_dropped + summary.packets_dropped,
+    )
+    summary_file = get_settings().worker.summary_file
+    if summary_file:
+        with open(summary_file, "w") as fh:
+            fh.write(summary.to_json())
 
 
 def run_pipeline(input_path: str) -> None:
-    """Run demux → overlay → PTS/DTS → encode. Hold last frame when source unavailable. Optional RTMP out."""
-    enc = None
-    rtmp_proc = None
-    t = threading.Thread(target=_overlay_refresh_loop, daemon=True)
+    """Run demux → overlay → PTS/DTS → encode. Hold last frame when source unavailable. Optional RTMP out.
+    Encoded packets go to a FanOut over WORKER__RTMP_OUTPUT_URL and WORKER__OUTPUT_URLS, kept across reconnects.
+    The overlay is rendered in a separate process; the frame loop only blends the latest rendered tile.
+    Prometheus metrics are served on the worker admin port (GET /metrics); SIGUSR1 or GET /debug/profile samples
+    stacks, SIGUSR2 or GET /debug/frames dumps recent frame timings (see stream_workers.profiling); GET /preview
+    returns the latest downscaled image of the output (stream_workers.preview).
+    With WORKER__OUTPUT_FILE the stream goes to that file (or "null") instead of RTMP, unpaced unless
+    WORKER__OUTPUT_REALTIME, until WORKER__MAX_FRAMES / WORKER__MAX_SECONDS; a run summary is logged at the end.
+    For several streams in one container, run stream_workers.supervisor instead."""
+    w = get_settings().worker
+    renderer = OverlayRenderer(["full"], w.overlay_tile_max_width, w.overlay_tile_max_height)
+    renderer.start()
+    # Stub overlay data until DB connected; then refresh loop updates it
+    renderer.submit(
+        (
+            [{"position": i, "identifier": f"Donor{i}", "amount": 100 - i} for i in range(1, 11)],
+            [{"message": "PIX received from Donor1"}],
+            None,
+        )
+    )
+    t = threading.Thread(target=_overlay_refresh_loop, args=(renderer,), daemon=True)
     t.start()
-    rtmp_url = get_settings().worker.rtmp_output_url.strip()
-    while True:
-        container = None
-        try:
-            container = demux.open_input(input_path)
-            video_stream = demux.get_video_stream(container)
-            if not video_stream:
-                raise ValueError("No video stream")
-            enc_cfg = get_settings().encoding
-            enc = encode.create_video_encoder(
-                width=video_stream.width or enc_cfg.default_width,
-                height=video_stream.height or enc_cfg.default_height,
-                fps=enc_cfg.fps,
-            )
-            if rtmp_url and rtmp_proc is None:
-                rtmp_proc = rtmp_out.start_rtmp_process(rtmp_url)
-            for packet in demux.iter_packets(container):
-                for frame in packet.decode():
-                    if isinstance(frame, av.VideoFrame):
-                        _last_frame_holder[0] = frame
-                        pts_dts.rewrite_pts_dts(frame)
-                        for pkt in encode.encode_frame(enc, frame):
-                            if rtmp_proc and rtmp_proc.stdin is not None:
-                                if not rtmp_out.write_packet(rtmp_proc, bytes(pkt)):
-                                    rtmp_proc = None
-        except Exception as e:
-            logger.warning("%s", e)
-            if container is None:
-                time.sleep(get_settings().worker.source_retry_interval_seconds)
-                continue
-        finally:
-            if container is not None:
-                container.close()
-            if rtmp_proc is not None and rtmp_proc.stdin is not None:
-                try:
-                    rtmp_proc.stdin.close()
-                except OSError:
-                    pass
-                rtmp_proc.wait(timeout=5)
-                rtmp_proc = None
-        time.sleep(0.1)
+    headless = bool(w.output_file)
+    pipeline = Pipeline(
+        "main",
+        input_path,
+        [] if headless else w.destination_urls(),
+        overlay_segment=renderer.segment("full"),
+        output_file=w.output_file,
+        realtime=w.output_realtime,
+        max_frames=w.max_frames,
+        max_seconds=w.max_seconds,
+        backup_urls=w.backup_input_urls,
+    )
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: pipeline.stop())
+    profiling.install_signal_handlers(pipeline.name, pipeline.frame_timings, pipeline.thread_ids)
+    admin = start_admin_server(
+        {
+            "/metrics": metrics_route(),
+            "/debug/profile": profiling.profile_route(pipeline.name, pipeline.thread_ids),
+            "/debug/frames": profiling.frames_route(pipeline.name, pipeline.frame_timings),
+            "/preview": preview_route(pipeline.preview),
+        }
+    )
+    started, cpu_started = time.monotonic(), time.process_time()
+    try:
+        pipeline.run()
+        if headless or pipeline.frame_limit:
+            _report_summary(pipeline, time.monotonic() - started, time.process_time() - cpu_started)
+    finally:
+        if admin is not None:
+            admin.close()
+        renderer.close()
 
 
 if __name__ == "__main__":
@@ -1,24 +1,37 @@
 """
 Internal API: write Donor, RankingEntry, PIXAlert, OverlayPaymentLink; Stripe webhook; YouTube OAuth and push refresh.
+GET /preview proxies the worker's output preview image (API__WORKER_ADMIN_URL).
 """
 
 import html
 import json
 import logging
-from datetime import datetime
-from typing import cast
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import UTC, datetime, timedelta
+from typing import Any, cast
 
 import stripe
-from flask import Flask, Response, jsonify, redirect, request
-from sqlalchemy import text
+from flask import Flask, Response, g, jsonify, redirect, request
+from sqlalchemy import delete, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from config.settings import get_settings
+from overlay_api import leader
+from overlay_api import metrics as api_metrics
 from overlay_api import youtube as youtube_module
+from overlay_api.cache import CachedBody, get_overlay_cache
+from overlay_api.coalesce import PendingWrites, WriteCoalescer
+from stream_workers import metrics
 from stream_workers.db import (
     Donor,
     OverlayPaymentLink,
     PIXAlert,
+    ProcessedStripeEvent,
     RankingEntry,
     get_engine,
 )
@@ -29,6 +42,42 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 
 
+@app.before_request
+def _start_request_timer() -> None:
+    g.request_started = time.perf_counter()
+    api_metrics.begin_request()
+
+
+@app.after_request
+def _observe_request(response: Response) -> Response:
+    """Record request latency per route and status; log it when over API__slow_request_ms."""
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    api_metrics.REQUEST_SECONDS.labels(route, request.method, str(response.status_code)).observe(elapsed)
+    threshold_ms = get_settings().api.slow_request_ms
+    if threshold_ms > 0 and elapsed * 1000 >= threshold_ms:
+        db_seconds, statements = api_metrics.request_db_time()
+        logger.warning(
+            "Slow request %s %s -> %s in %.0f ms (db %.0f ms over %d statements)",
+            request.method,
+            request.path,
+            response.status_code,
+            elapsed * 1000,
+            db_seconds * 1000,
+            statements,
+        )
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics() -> tuple[Response, int]:
+    """Prometheus metrics summed over all API worker processes."""
+    return Response(metrics.render(api_metrics.collect_all()), content_type=metrics.CONTENT_TYPE), 200
+
+
 def _require_payment_link_auth() -> tuple[Response, int] | None:
     """If API__payment_link_api_key is set, require Bearer or X-API-Key; return 401/403 or None to proceed."""
     key = get_settings().api.payment_link_api_key
@@ -63,6 +112,7 @@ def create_donor() -> tuple[Response, int]:
         )
         session.add(donor)
         session.commit()
+        get_overlay_cache().invalidate()
         session.refresh(donor)
         return jsonify({"id": donor.id}), 201
 
@@ -86,59 +136,195 @@ def create_alert() -> tuple[Response, int]:
         )
         session.add(alert)
         session.commit()
+        get_overlay_cache().invalidate()
         session.refresh(alert)
         return jsonify({"id": alert.id}), 201
 
 
+def _ranking_error(entries: Any) -> str | None:
+    """Validate a /ranking body before it is written (or merged into a coalescing window); None when valid."""
+    if not isinstance(entries, list):
+        return "entries must be a list"
+    if len(entries) > 10:
+        return "max 10 entries"
+    positions = set()
+    for e in entries:
+        if not isinstance(e, dict):
+            return "each entry must be an object"
+        position, donor_id, amount, identifier = (e.get(k) for k in ("position", "donor_id", "amount", "identifier"))
+        if not isinstance(position, int) or isinstance(position, bool) or not 1 <= position <= 10:
+            return "position must be an integer from 1 to 10"
+        if position in positions:
+            return "positions must be unique"
+        positions.add(position)
+        if not isinstance(donor_id, int) or isinstance(donor_id, bool):
+            return "donor_id must be an integer"
+        if not isinstance(amount, int | float) or isinstance(amount, bool):
+            return "amount must be a number"
+        if not isinstance(identifier, str):
+            return "identifier must be a string"
+    return None
+
+
+def _replace_ranking(session: Session, entries: list[dict[str, Any]]) -> None:
+    session.execute(text("DELETE FROM ranking_entries"))
+    for e in entries:
+        session.add(
+            RankingEntry(
+                position=e["position"],
+                donor_id=e["donor_id"],
+                amount=e["amount"],
+                identifier=e["identifier"],
+            )
+        )
+
+
+def _apply_payment_link(session: Session, url: str | None, label: str | None, active: bool | None) -> OverlayPaymentLink:
+    row = session.get(OverlayPaymentLink, 1)
+    if row is None:
+        row = OverlayPaymentLink(
+            id=1,
+            url=url,
+            label=label or None,
+            active=active if active is not None else bool(url),
+        )
+        session.add(row)
+    else:
+        if url is not None:
+            row.url = url or None
+        if label is not None:
+            row.label = label or None
+        if active is not None:
+            row.active = bool(active)
+        if url is not None and not url and row.active:
+            row.active = False
+    return row
+
+
+def _write_pending(pending: PendingWrites) -> dict[str, Any]:
+    """Flush one coalescing window: latest ranking and all payment-link patches in one transaction."""
+    with Session(get_engine()) as session:
+        if pending.ranking is not None:
+            _replace_ranking(session, pending.ranking)
+        row = None
+        for patch in pending.payment_link_patches:
+            row = _apply_payment_link(session, patch["url"], patch["label"], patch["active"])
+            session.flush()
+        session.commit()
+        get_overlay_cache().invalidate()
+        if row is None:
+            row = session.get(OverlayPaymentLink, 1)
+        else:
+            session.refresh(row)
+        link = {"url": row.url, "label": row.label, "active": row.active} if row is not None else None
+        return {"payment_link": link}
+
+
+_coalescer_holder: list[WriteCoalescer | None] = [None]
+_coalesce_refused_logged = [False]
+
+
+def _get_coalescer() -> WriteCoalescer | None:
+    """Return the write coalescer when API__write_coalesce_window_ms > 0, else None (write immediately).
+    Coalescing orders writes within one process only, so it is refused when gunicorn runs several workers."""
+    api = get_settings().api
+    window_ms = api.write_coalesce_window_ms
+    if window_ms <= 0:
+        return None
+    if not api.dev_server and api.workers > 1:
+        if not _coalesce_refused_logged[0]:
+            _coalesce_refused_logged[0] = True
+            logger.warning("API__write_coalesce_window_ms ignored: API__workers=%d > 1 (writes could commit out of order)", api.workers)
+        return None
+    coalescer = _coalescer_holder[0]
+    if coalescer is None:
+        coalescer = WriteCoalescer(window_ms / 1000.0, _write_pending)
+        _coalescer_holder[0] = coalescer
+    return coalescer
+
+
 @app.route("/ranking", methods=["POST"])
 def update_ranking() -> tuple[Response, int]:
-    """Recompute and replace Top 10 ranking atomically. Body: list of {position, donor_id, amount, identifier}."""
+    """Recompute and replace Top 10 ranking atomically. Body: list of {position, donor_id, amount, identifier}.
+    With API__write_coalesce_window_ms set, bursts are merged and only the latest ranking is written."""
     data = request.get_json() or {}
     entries = data.get("entries", [])
-    if len(entries) > 10:
-        return jsonify({"error": "max 10 entries"}), 400
+    error = _ranking_error(entries)
+    if error is not None:
+        return jsonify({"error": error}), 400
+    coalescer = _get_coalescer()
+    if coalescer is not None:
+        coalescer.submit_ranking(entries)
+        return jsonify({"ok": True}), 200
     engine = get_engine()
     with Session(engine) as session:
-        session.execute(text("DELETE FROM ranking_entries"))
-        for e in entries:
-            session.add(
-                RankingEntry(
-                    position=e["position"],
-                    donor_id=e["donor_id"],
-                    amount=e["amount"],
-                    identifier=e["identifier"],
-                )
-            )
+        _replace_ranking(session, entries)
         session.commit()
+        get_overlay_cache().invalidate()
         return jsonify({"ok": True}), 200
 
 
+def _cached_json(cached: CachedBody) -> tuple[Response, int]:
+    """JSON response with strong ETag; 304 without body when If-None-Match matches."""
+    resp = Response(cached.body, mimetype="application/json")
+    resp.set_etag(cached.etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.make_conditional(request)
+    return resp, resp.status_code
+
+
 @app.route("/payment-link", methods=["GET"])
 def get_payment_link() -> tuple[Response, int]:
-    """Return current overlay payment link (global single row). FR-6: backend auth when API__payment_link_api_key set."""
+    """Return current overlay payment link (global single row). FR-6: backend auth when API__payment_link_api_key set.
+    Served from the overlay read cache with ETag / If-None-Match support."""
     auth_fail = _require_payment_link_auth()
     if auth_fail is not None:
         return auth_fail
-    engine = get_engine()
-    with Session(engine) as session:
-        row = session.get(OverlayPaymentLink, 1)
-        if row is None:
-            return jsonify({"url": None, "label": None, "active": False}), 200
-        return (
-            jsonify(
-                {
-                    "url": row.url,
-                    "label": row.label,
-                    "active": row.active,
-                }
-            ),
-            200,
-        )
+    return _cached_json(get_overlay_cache().get().payment_link)
+
+
+@app.route("/overlay", methods=["GET"])
+def get_overlay() -> tuple[Response, int]:
+    """Return combined overlay state {ranking, alerts (active now), payment_link} from the read cache.
+    Same auth as /payment-link since it includes the link; supports ETag / If-None-Match (304)."""
+    auth_fail = _require_payment_link_auth()
+    if auth_fail is not None:
+        return auth_fail
+    return _cached_json(get_overlay_cache().get().overlay)
+
+
+PREVIEW_PROXY_TIMEOUT_SECONDS = 3.0
+
+
+@app.route("/preview", methods=["GET"])
+def get_preview() -> tuple[Response, int]:
+    """Latest preview image of the worker output, fetched from API__WORKER_ADMIN_URL/preview (?stream=<name> for the
+    supervisor). Same auth as /payment-link; 404 when not configured, 502 when the worker is unreachable."""
+    auth_fail = _require_payment_link_auth()
+    if auth_fail is not None:
+        return auth_fail
+    base = get_settings().api.worker_admin_url
+    if not base:
+        return jsonify({"error": "preview not configured (API__WORKER_ADMIN_URL)"}), 404
+    stream = request.args.get("stream")
+    url = base.rstrip("/") + "/preview" + ("?" + urllib.parse.urlencode({"stream": stream}) if stream else "")
+    try:
+        with urllib.request.urlopen(url, timeout=PREVIEW_PROXY_TIMEOUT_SECONDS) as upstream:
+            body, content_type = upstream.read(), upstream.headers.get("Content-Type", "application/octet-stream")
+    except urllib.error.HTTPError as e:
+        return Response(e.read(), content_type=e.headers.get("Content-Type", "application/json")), e.code
+    except OSError as e:
+        logger.warning("Preview proxy to %s failed: %s", url, e)
+        return jsonify({"error": "worker unreachable"}), 502
+    resp = Response(body, content_type=content_type)
+    resp.headers["Cache-Control"] = "no-store"
+    return resp, 200
 
 
 @app.route("/payment-link", methods=["PUT"])
 def put_payment_link() -> tuple[Response, int]:
-    """Create or update the single overlay payment link. FR-6: backend auth when API__payment_link_api_key set."""
+    """Create or update the single overlay payment link. FR-6: backend auth when API__payment_link_api_key set.
+    With API__write_coalesce_window_ms set, patches in a window are applied in one transaction; all get the final link."""
     auth_fail = _require_payment_link_auth()
     if auth_fail is not None:
         return auth_fail
@@ -152,27 +338,15 @@ def put_payment_link() -> tuple[Response, int]:
         return jsonify({"error": "url must be https and max 2048 chars"}), 400
     if label is not None and len(str(label)) > 64:
         return jsonify({"error": "label max 64 chars"}), 400
+    coalescer = _get_coalescer()
+    if coalescer is not None:
+        result = coalescer.submit_payment_link({"url": url, "label": label, "active": active})
+        return jsonify(result["payment_link"]), 200
     engine = get_engine()
     with Session(engine) as session:
-        row = session.get(OverlayPaymentLink, 1)
-        if row is None:
-            row = OverlayPaymentLink(
-                id=1,
-                url=url,
-                label=label or None,
-                active=active if active is not None else bool(url),
-            )
-            session.add(row)
-        else:
-            if url is not None:
-                row.url = url or None
-            if label is not None:
-                row.label = label or None
-            if active is not None:
-                row.active = bool(active)
-            if url is not None and not url and row.active:
-                row.active = False
+        row = _apply_payment_link(session, url, label, active)
         session.commit()
+        get_overlay_cache().invalidate()
         session.refresh(row)
         return (
             jsonify(
@@ -186,38 +360,102 @@ def put_payment_link() -> tuple[Response, int]:
         )
 
 
-_processed_stripe_event_ids: set[str] = set()
-
-
 @app.route("/stripe-webhook", methods=["POST"])
 def stripe_webhook() -> tuple[Response, int]:
-    """Stripe webhook: verify signature, on checkout.session.completed create Donor; deduplicate by event id."""
+    """Stripe webhook: verify signature, on checkout.session.completed create Donor; deduplicate by event id.
+    Event ids are stored in processed_stripe_events in the same transaction, so dedupe holds across workers."""
     secret = get_settings().stripe.webhook_secret
     if not secret:
         return jsonify({"error": "webhook not configured"}), 400
     payload = request.get_data()
     sig_header = request.headers.get("Stripe-Signature", "")
+    started = time.perf_counter()
     try:
         event = stripe.Webhook.construct_event(payload, sig_header, secret)  # type: ignore[no-untyped-call]
     except (ValueError, stripe.SignatureVerificationError):
+        api_metrics.STRIPE_EVENTS.labels("invalid_signature").inc()
         return jsonify({"error": "Invalid signature"}), 400
-    if event["id"] in _processed_stripe_event_ids:
-        return jsonify({"received": True}), 200
-    _processed_stripe_event_ids.add(event["id"])
-    if event["type"] == "checkout.session.completed":
-        session_data = event.get("data", {}).get("object", {})
-        amount_total = session_data.get("amount_total") or 0
-        amount_float = amount_total / 100.0
-        customer_email = session_data.get("customer_email") or session_data.get("customer_details", {}).get("email") or ""
-        identifier = customer_email or f"Stripe-{session_data.get('id', 'unknown')}"
-        engine = get_engine()
-        with Session(engine) as session:
-            donor = Donor(identifier=identifier, amount=amount_float, currency="brl")
-            session.add(donor)
+    finally:
+        api_metrics.STRIPE_VERIFY_SECONDS.labels().observe(time.perf_counter() - started)
+    engine = get_engine()
+    with Session(engine) as session:
+        if session.get(ProcessedStripeEvent, event["id"]) is not None:
+            api_metrics.STRIPE_EVENTS.labels("duplicate").inc()
+            return jsonify({"received": True}), 200
+        session.add(ProcessedStripeEvent(event_id=event["id"]))
+        if event["type"] == "checkout.session.completed":
+            session_data = event.get("data", {}).get("object", {})
+            amount_total = session_data.get("amount_total") or 0
+            amount_float = amount_total / 100.0
+            customer_email = session_data.get("customer_email") or session_data.get("customer_details", {}).get("email") or ""
+            identifier = customer_email or f"Stripe-{session_data.get('id', 'unknown')}"
+            session.add(Donor(identifier=identifier, amount=amount_float, currency="brl"))
+        try:
             session.commit()
+        except IntegrityError:
+            # Concurrent delivery of the same event handled by another worker
+            session.rollback()
+            api_metrics.STRIPE_EVENTS.labels("duplicate_concurrent").inc()
+            return jsonify({"received": True}), 200
+    api_metrics.STRIPE_EVENTS.labels("processed").inc()
+    get_overlay_cache().invalidate()
     return jsonify({"received": True}), 200
 
 
+RETENTION_INTERVAL_SECONDS = 3600
+
+
+def prune_processed_stripe_events() -> int:
+    """Delete webhook dedupe rows older than API__retention_days (Stripe stops retrying after 3 days)."""
+    cutoff = datetime.now(UTC) - timedelta(days=max(1, get_settings().api.retention_days))
+    with Session(get_engine()) as session:
+        result = session.execute(delete(ProcessedStripeEvent).where(ProcessedStripeEvent.created_at < cutoff))
+        session.commit()
+        return int(getattr(result, "rowcount", 0) or 0)
+
+
+def _retention_loop() -> None:
+    while True:
+        try:
+            removed = prune_processed_stripe_events()
+            if removed:
+                logger.info("Retention: pruned %d processed Stripe event(s)", removed)
+        except Exception as e:
+            logger.warning("Retention: %s", e)
+        time.sleep(RETENTION_INTERVAL_SECONDS)
+
+
+def start_retention_thread() -> None:
+    """Start daemon thread for periodic retention of webhook dedupe rows."""
+    t = threading.Thread(target=_retention_loop, daemon=True)
+    t.start()
+
+
+def start_background_jobs() -> None:
+    """Run YouTube push refresh and retention in exactly one process (the leader-lock holder).
+    Every process keeps its metrics dump current for /metrics."""
+    api_metrics.start_flush_thread()
+    leader.start_leader_election(
+        [
+            lambda: youtube_module.start_youtube_push_refresh_thread(refresh_now=True),
+            start_retention_thread,
+        ]
+    )
+
+
+def ensure_schema() -> None:
+    """Attach DB timing to the engine (once, before workers fork) and create tables added after the initial schema
+    (e.g. processed_stripe_events) when missing."""
+    engine = get_engine()
+    try:
+        ProcessedStripeEvent.__table__.create(engine, checkfirst=True)  # type: ignore[attr-defined]
+    finally:
+        # Release pooled connections before the server forks worker processes; dispose replaces the pool, so the
+        # pool-wait timing is attached to the new one
+        engine.dispose()
+        api_metrics.instrument_engine(engine)
+
+
 @app.route("/youtube/connect", methods=["GET"])
 def youtube_connect() -> tuple[Response, int] | Response:
     """Redirect to Google OAuth for YouTube. Optional: require payment-link auth."""
@@ -263,16 +501,19 @@ def youtube_callback() -> tuple[Response, int] | Response:
 
 
 def run() -> None:
+    """Serve the API: gunicorn (multi-process, threaded) by default; Werkzeug dev server when API__dev_server is set."""
     s = get_settings()
-    if s.youtube.client_id and s.youtube.refresh_tokens.strip():
-        try:
-            urls = youtube_module.get_ingestion_urls()
-            youtube_module.write_push_conf(urls)
-            youtube_module.reload_nginx()
-        except Exception as e:
-            logger.warning("YouTube initial push refresh: %s", e)
-        youtube_module.start_youtube_push_refresh_thread()
-    app.run(host=s.api.host, port=s.api.port)
+    try:
+        ensure_schema()
+    except Exception as e:
+        logger.warning("Schema check failed: %s", e)
+    if s.api.dev_server:
+        start_background_jobs()
+        app.run(host=s.api.host, port=s.api.port, threaded=True)
+        return
+    from overlay_api import server
+
+    server.serve(app)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+"""
+Process-local read cache of overlay state (ranking, active PIX alerts, payment link) with strong ETags.
+Write paths call invalidate(), which increments the counter in a generation file in API__runtime_dir (under a
+file lock, replaced atomically) so every API worker process drops its copy; readers only read that counter, so
+unchanged state never touches the DB. A counter, unlike the file's inode or mtime, cannot repeat after a replace.
+Active alerts also change with time: an entry is valid until the next alert show_at/hide_at boundary.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import Any
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from config.settings import get_settings
+from stream_workers.db import OverlayPaymentLink, PIXAlert, get_engine
+
+logger = logging.getLogger(__name__)
+
+GENERATION_FILE_NAME = "overlay.generation"
+GENERATION_LOCK_SUFFIX = ".lock"
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    """Serialized JSON body and its strong ETag (quoted value without W/ prefix)."""
+
+    body: bytes
+    etag: str
+
+
+@dataclass(frozen=True)
+class OverlayCacheEntry:
+    overlay: CachedBody
+    payment_link: CachedBody
+    generation: int
+    valid_until: float  # time.time() of next alert boundary or max age; inf when none
+
+
+def _make_body(data: dict[str, Any]) -> CachedBody:
+    body = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return CachedBody(body=body, etag=hashlib.sha256(body).hexdigest()[:32])
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=UTC) if value.tzinfo is None else value
+
+
+def _load_overlay_state() -> tuple[dict[str, Any], dict[str, Any], datetime | None]:
+    """Read ranking, active alerts, payment link row and next alert boundary in one transaction."""
+    now = datetime.now(UTC)
+    with Session(get_engine()) as session:
+        ranking = [
+            {"position": row[0], "identifier": row[1], "amount": row[2]}
+            for row in session.execute(
+                text("SELECT position, identifier, amount FROM ranking_entries ORDER BY position LIMIT 10")
+            ).fetchall()
+        ]
+        alerts = [
+            {"id": row[0], "message": row[1]}
+            for row in session.execute(
+                text("SELECT id, message FROM pix_alerts WHERE show_at <= :now AND hide_at > :now ORDER BY created_at"),
+                {"now": now},
+            ).fetchall()
+        ]
+        next_show = session.execute(select(func.min(PIXAlert.show_at)).where(PIXAlert.show_at > now)).scalar()
+        next_hide = session.execute(select(func.min(PIXAlert.hide_at)).where(PIXAlert.hide_at > now)).scalar()
+        row = session.get(OverlayPaymentLink, 1)
+        link: dict[str, Any] = {"url": None, "label": None, "active": False}
+        if row is not None:
+            link = {"url": row.url, "label": row.label, "active": row.active}
+    boundaries = [_as_utc(b) for b in (next_show, next_hide) if b is not None]
+    overlay = {"ranking": ranking, "alerts": alerts, "payment_link": link}
+    return overlay, link, min(boundaries) if boundaries else None
+
+
+class OverlayStateCache:
+    """Single-flight cache: concurrent misses wait for one DB load instead of stampeding."""
+
+    def __init__(self, runtime_dir: str, max_age_seconds: float = 0.0) -> None:
+        self.generation_path = os.path.join(runtime_dir, GENERATION_FILE_NAME)
+        self.max_age_seconds = max_age_seconds
+        self._entry: OverlayCacheEntry | None = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _generation(self) -> int:
+        """Shared generation counter (0 before the first write)."""
+        try:
+            with open(self.generation_path, "rb") as f:
+                return int(f.read().split()[0])
+        except (FileNotFoundError, IndexError, ValueError):
+            return 0
+
+    def invalidate(self) -> None:
+        """Drop this process's entry and increment the shared generation so other workers drop theirs."""
+        self._entry = None
+        directory = os.path.dirname(self.generation_path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(self.generation_path + GENERATION_LOCK_SUFFIX, "a") as lock:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)  # serializes read-increment-replace across workers
+                generation = self._generation() + 1
+                fd, tmp = tempfile.mkstemp(dir=directory, prefix=".generation-")
+                with os.fdopen(fd, "w") as f:
+                    f.write(f"{generation}\n")
+                os.replace(tmp, self.generation_path)
+        except OSError as e:
+            logger.warning("Overlay cache generation bump failed (%s): %s", self.generation_path, e)
+
+    def _fresh(self, entry: OverlayCacheEntry | None, generation: int) -> bool:
+        return entry is not None and entry.generation == generation and time.time() < entry.valid_until
+
+    def get(self) -> OverlayCacheEntry:
+        """Return current entry, loading from the DB only when invalidated or past an alert boundary."""
+        generation = self._generation()
+        entry = self._entry
+        if self._fresh(entry, generation):
+            self.hits += 1
+            return entry  # type: ignore[return-value]
+        with self._lock:
+            generation = self._generation()
+            entry = self._entry
+            if self._fresh(entry, generation):
+                self.hits += 1
+                return entry  # type: ignore[return-value]
+            self.misses += 1
+            # Generation is read before the load: a write committed during the load bumps it again
+            overlay, link, next_change = _load_overlay_state()
+            valid_until = next_change.timestamp() if next_change is not None else float("inf")
+            if self.max_age_seconds > 0:
+                valid_until = min(valid_until, time.time() + self.max_age_seconds)
+            entry = OverlayCacheEntry(
+                overlay=_make_body(overlay),
+                payment_link=_make_body(link),
+                generation=generation,
+                valid_until=valid_until,
+            )
+            self._entry = entry
+            return entry
+
+
+_cache_holder: list[OverlayStateCache | None] = [None]
+
+
+def get_overlay_cache() -> OverlayStateCache:
+    cache = _cache_holder[0]
+    if cache is None:
+        api = get_settings().api
+        cache = OverlayStateCache(api.runtime_dir, api.overlay_cache_max_age_seconds)
+        _cache_holder[0] = cache
+    return cache
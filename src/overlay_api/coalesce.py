@@ -0,0 +1,132 @@
+"""
+Write coalescing for bursts of POST /ranking and PUT /payment-link (API__write_coalesce_window_ms > 0).
+The first request in a window waits for the window to close, then writes the merged state in one
+transaction: only the latest ranking is written, payment-link patches are applied in arrival order.
+Every request in the window gets the result of that single write. If the merged write fails, each request
+is replayed on its own, in arrival order, so one bad request only fails itself.
+Windows are flushed one at a time in the order they closed, so an older ranking never commits after a newer one.
+Ordering only holds within one process: the API falls back to immediate writes when it runs several workers.
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class PendingWrites:
+    """Merged state of one coalescing window."""
+
+    __slots__ = ("ranking", "payment_link_patches", "requests")
+
+    def __init__(self) -> None:
+        self.ranking: list[dict[str, Any]] | None = None
+        self.payment_link_patches: list[dict[str, Any]] = []
+        self.requests = 0
+
+
+class _Request:
+    __slots__ = ("merge", "result", "error")
+
+    def __init__(self, merge: Callable[[PendingWrites], None]) -> None:
+        self.merge = merge
+        self.result: dict[str, Any] = {}
+        self.error: BaseException | None = None
+
+
+class _Window:
+    __slots__ = ("requests", "done", "ticket")
+
+    def __init__(self) -> None:
+        self.requests: list[_Request] = []
+        self.done = threading.Event()
+        self.ticket = 0  # flush order, assigned when the window closes
+
+
+def _pending(requests: list[_Request]) -> PendingWrites:
+    pending = PendingWrites()
+    for req in requests:
+        req.merge(pending)
+        pending.requests += 1
+    return pending
+
+
+class WriteCoalescer:
+    """Collect writes for window_seconds, then run flush(pending) once; flush returns the shared result."""
+
+    def __init__(self, window_seconds: float, flush: Callable[[PendingWrites], dict[str, Any]]) -> None:
+        self.window_seconds = window_seconds
+        self._flush = flush
+        self._lock = threading.Lock()
+        self._window: _Window | None = None
+        self._turn = threading.Condition()
+        self._next_ticket = 0
+        self._flushing_ticket = 0
+        self.flushes = 0
+        self.coalesced_requests = 0
+
+    def submit_ranking(self, entries: list[dict[str, Any]]) -> dict[str, Any]:
+        return self._submit(lambda p: setattr(p, "ranking", entries))
+
+    def submit_payment_link(self, patch: dict[str, Any]) -> dict[str, Any]:
+        return self._submit(lambda p: p.payment_link_patches.append(patch))
+
+    def _submit(self, merge: Callable[[PendingWrites], None]) -> dict[str, Any]:
+        req = _Request(merge)
+        with self._lock:
+            window = self._window
+            leader = window is None
+            if window is None:
+                window = _Window()
+                self._window = window
+            window.requests.append(req)
+        if leader:
+            time.sleep(self.window_seconds)
+            with self._lock:
+                self._window = None
+                window.ticket = self._next_ticket
+                self._next_ticket += 1
+            try:
+                self._flush_in_turn(window)
+            finally:
+                window.done.set()
+        else:
+            window.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _flush_in_turn(self, window: _Window) -> None:
+        """Flush window once every window closed before it has been flushed."""
+        with self._turn:
+            self._turn.wait_for(lambda: self._flushing_ticket == window.ticket)
+        try:
+            self._flush_window(window)
+        finally:
+            with self._turn:
+                self._flushing_ticket += 1
+                self._turn.notify_all()
+
+    def _flush_window(self, window: _Window) -> None:
+        requests = window.requests
+        self.flushes += 1
+        self.coalesced_requests += len(requests)
+        try:
+            result = self._flush(_pending(requests))
+        except Exception as e:
+            if len(requests) == 1:
+                requests[0].error = e
+                return
+            logger.warning("Coalesced write of %d requests failed (%s); writing them one by one", len(requests), e)
+        else:
+            for req in requests:
+                req.result = result
+            return
+        for req in requests:
+            try:
+                req.result = self._flush(_pending([req]))
+            except Exception as e:
+                req.error = e
@@ -0,0 +1,88 @@
+"""
+Leader lock for background jobs: with several API worker processes, only the holder of an exclusive
+flock on API__runtime_dir/leader.lock runs jobs (YouTube push refresh, retention). The OS releases the
+lock when the holder exits, so another worker takes over within API__leader_poll_seconds.
+"""
+
+import fcntl
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+from typing import IO
+
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE_NAME = "leader.lock"
+
+
+class LeaderLock:
+    """Non-blocking exclusive file lock; held for the lifetime of the process once acquired."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._fh: IO[str] | None = None
+
+    @property
+    def held(self) -> bool:
+        return self._fh is not None
+
+    def try_acquire(self) -> bool:
+        """Return True if this process holds the lock (acquiring it now if free)."""
+        if self._fh is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fh = open(self.path, "a+")
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+        fh.seek(0)
+        fh.truncate()
+        fh.write(f"{os.getpid()}\n")
+        fh.flush()
+        self._fh = fh
+        return True
+
+    def release(self) -> None:
+        if self._fh is None:
+            return
+        try:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._fh.close()
+            self._fh = None
+
+
+_leader_lock_holder: list[LeaderLock | None] = [None]
+
+
+def get_leader_lock() -> LeaderLock:
+    lock = _leader_lock_holder[0]
+    if lock is None:
+        lock = LeaderLock(os.path.join(get_settings().api.runtime_dir, LOCK_FILE_NAME))
+        _leader_lock_holder[0] = lock
+    return lock
+
+
+def _leader_election_loop(jobs: list[Callable[[], None]]) -> None:
+    lock = get_leader_lock()
+    poll = max(0.5, get_settings().api.leader_poll_seconds)
+    while not lock.try_acquire():
+        time.sleep(poll)
+    logger.info("Worker pid=%s is leader; starting %d background job(s)", os.getpid(), len(jobs))
+    for job in jobs:
+        try:
+            job()
+        except Exception as e:
+            logger.warning("Background job %s failed to start: %s", getattr(job, "__name__", job), e)
+
+
+def start_leader_election(jobs: list[Callable[[], None]]) -> None:
+    """Start daemon thread that waits for the leader lock, then starts each job once (jobs start their own threads)."""
+    t = threading.Thread(target=_leader_election_loop, args=(jobs,), daemon=True)
+    t.start()
@@ -0,0 +1,239 @@
+"""
+Overlay API metrics: request latency per route and status, DB statement / commit / flush timing, connection pool
+wait, Stripe webhook and YouTube refresh counters (Prometheus text on GET /metrics).
+Every gunicorn worker keeps its own registry and dumps it to API__runtime_dir/metrics/<pid>.json every few seconds;
+/metrics sums the dumps of all live workers, so any worker can answer a scrape.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from config.settings import get_settings
+from stream_workers import metrics
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR_NAME = "metrics"
+FLUSH_INTERVAL_SECONDS = 5.0
+STATEMENT_TYPES = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE"})
+
+REGISTRY = metrics.Registry()
+
+REQUEST_SECONDS = metrics.Histogram(
+    "api_request_seconds", "Request latency by route, method and status.", ("route", "method", "status"), registry=REGISTRY
+)
+DB_SECONDS = metrics.Histogram(
+    "api_db_seconds", "DB time per statement type (SELECT, INSERT, UPDATE, DELETE, OTHER, COMMIT).", ("statement",), registry=REGISTRY
+)
+DB_FLUSH_SECONDS = metrics.Histogram(
+    "api_db_flush_seconds", "ORM flush time including its statements (flush minus statements = SQLAlchemy overhead).", registry=REGISTRY
+)
+DB_POOL_WAIT_SECONDS = metrics.Histogram("api_db_pool_wait_seconds", "Time to check a connection out of the pool.", registry=REGISTRY)
+DB_POOL_CHECKED_OUT = metrics.Gauge("api_db_pool_checked_out", "Connections currently checked out.", registry=REGISTRY)
+STRIPE_VERIFY_SECONDS = metrics.Histogram("api_stripe_verify_seconds", "Stripe webhook signature verification time.", registry=REGISTRY)
+STRIPE_EVENTS = metrics.Counter("api_stripe_events_total", "Stripe webhook events by outcome.", ("outcome",), registry=REGISTRY)
+YOUTUBE_REFRESH_SECONDS = metrics.Histogram(
+    "api_youtube_refresh_seconds",
+    "YouTube channel provisioning (token refresh and API calls) per channel.",
+    ("channel",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+    registry=REGISTRY,
+)
+YOUTUBE_REFRESH_FAILURES = metrics.Counter(
+    "api_youtube_refresh_failures_total", "YouTube channel provisioning failures by reason.", ("channel", "reason"), registry=REGISTRY
+)
+
+_local = threading.local()
+_instrumented: list[Engine] = []
+_instrument_lock = threading.Lock()
+_flush_thread_started = [False]
+
+
+def statement_type(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword if keyword in STATEMENT_TYPES else "OTHER"
+
+
+# Per-request accumulators for the slow-request log (request handlers run one per thread)
+def begin_request() -> None:
+    _local.db_seconds = 0.0
+    _local.db_statements = 0
+
+
+def request_db_time() -> tuple[float, int]:
+    """DB seconds and statement count since begin_request() in this thread."""
+    return getattr(_local, "db_seconds", 0.0), getattr(_local, "db_statements", 0)
+
+
+def _record_db(statement: str, seconds: float) -> None:
+    DB_SECONDS.labels(statement).observe(seconds)
+    if hasattr(_local, "db_seconds"):
+        _local.db_seconds += seconds
+        _local.db_statements += 1
+
+
+def _before_cursor_execute(_conn: Any, _cursor: Any, _statement: str, _params: Any, context: Any, _executemany: bool) -> None:
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(_conn: Any, _cursor: Any, statement: str, _params: Any, context: Any, _executemany: bool) -> None:
+    started = getattr(context, "_metrics_started", None)
+    if started is not None:
+        _record_db(statement_type(statement), time.perf_counter() - started)
+
+
+def _before_commit(_conn: Any) -> None:
+    _local.commit_started = time.perf_counter()
+
+
+def _after_session_commit(_session: Session) -> None:
+    started = getattr(_local, "commit_started", None)
+    if started is not None:
+        _local.commit_started = None
+        _record_db("COMMIT", time.perf_counter() - started)
+
+
+def _before_flush(session: Session, _flush_context: Any, _instances: Any) -> None:
+    session.info["metrics_flush_started"] = time.perf_counter()
+
+
+def _after_flush(session: Session, _flush_context: Any) -> None:
+    started = session.info.pop("metrics_flush_started", None)
+    if started is not None:
+        DB_FLUSH_SECONDS.labels().observe(time.perf_counter() - started)
+
+
+def _time_pool_checkout(engine: Engine) -> None:
+    # The pool has no "before checkout" event; wrap the pool's get (what callers block on when the pool is exhausted)
+    pool = engine.pool
+    do_get = getattr(pool, "_do_get", None)
+    if do_get is None:
+        return
+    wait_seconds = DB_POOL_WAIT_SECONDS.labels()
+
+    def timed_do_get() -> Any:
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            wait_seconds.observe(time.perf_counter() - started)
+
+    pool._do_get = timed_do_get  # type: ignore[method-assign]
+
+
+def _collect_pool() -> None:
+    with _instrument_lock:
+        engines = list(_instrumented)
+    checkedout = getattr(engines[-1].pool, "checkedout", None) if engines else None
+    DB_POOL_CHECKED_OUT.labels().set(float(checkedout()) if callable(checkedout) else 0.0)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Attach statement, commit, flush and pool-wait timing to engine (once per engine)."""
+    with _instrument_lock:
+        if any(e is engine for e in _instrumented):
+            return
+        if not _instrumented:
+            event.listen(Session, "after_commit", _after_session_commit)
+            event.listen(Session, "before_flush", _before_flush)
+            event.listen(Session, "after_flush_postexec", _after_flush)
+            REGISTRY.add_collector(_collect_pool)
+        _instrumented.append(engine)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "commit", _before_commit)
+    _time_pool_checkout(engine)
+
+
+def metrics_dir() -> str:
+    return os.path.join(get_settings().api.runtime_dir, METRICS_DIR_NAME)
+
+
+def flush(families: list[metrics.MetricFamily] | None = None) -> None:
+    """Write this process's metrics (families, else a fresh collect) to the shared metrics directory (atomic replace)."""
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    data = metrics.dumps(REGISTRY.collect() if families is None else families)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as fh:
+            fh.write(data)
+        os.replace(tmp, os.path.join(directory, f"{os.getpid()}.json"))
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect_all() -> list[metrics.MetricFamily]:
+    """
+    This process's metrics plus the latest dumps of the other live workers, summed. When the metrics directory cannot
+    be written or read (full or read-only runtime dir), the error is logged and whatever can be read is served.
+    """
+    families = REGISTRY.collect()
+    directory = metrics_dir()
+    try:
+        flush(families)
+    except OSError as e:
+        logger.warning("Metrics flush to %s: %s", directory, e)
+    try:
+        names = os.listdir(directory)
+    except OSError as e:
+        logger.warning("Metrics dumps in %s unreadable: %s", directory, e)
+        names = []
+    own = str(os.getpid())
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        if ext != ".json" or not stem.isdigit() or stem == own:
+            continue
+        path = os.path.join(directory, name)
+        if not _pid_alive(int(stem)):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path) as fh:
+                families.extend(metrics.loads(fh.read()))
+        except (OSError, ValueError) as e:
+            logger.debug("Metrics dump %s unreadable: %s", path, e)
+    return metrics.aggregate(families)
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        try:
+            flush()
+        except OSError as e:
+            logger.warning("Metrics flush to %s: %s", metrics_dir(), e)
+
+
+def start_flush_thread() -> None:
+    """Start the daemon thread that keeps this worker's dump current (once per process)."""
+    with _instrument_lock:
+        if _flush_thread_started[0]:
+            return
+        _flush_thread_started[0] = True
+    threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
@@ -0,0 +1,69 @@
+"""
+Production serving for the overlay API: gunicorn with gthread workers (API__workers x API__threads),
+HTTP keep-alive, and graceful drain. SIGHUP restarts workers gracefully, SIGTERM drains and exits;
+in-flight requests get up to API__graceful_timeout_seconds to finish.
+Background jobs start in every worker but only run in the leader-lock holder (see overlay_api.leader).
+"""
+
+import logging
+from typing import Any
+
+from flask import Flask
+from gunicorn.app.base import BaseApplication  # type: ignore[import-untyped]
+
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+def _post_worker_init(_worker: Any) -> None:
+    from overlay_api.app import start_background_jobs
+
+    start_background_jobs()
+
+
+def gunicorn_options() -> dict[str, Any]:
+    """Gunicorn settings derived from ApiSettings."""
+    api = get_settings().api
+    return {
+        "bind": f"{api.host}:{api.port}",
+        "worker_class": "gthread",
+        "workers": max(1, api.workers),
+        "threads": max(1, api.threads),
+        "keepalive": max(0, api.keepalive_seconds),
+        "timeout": max(1, api.timeout_seconds),
+        "graceful_timeout": max(1, api.graceful_timeout_seconds),
+        "max_requests": max(0, api.max_requests),
+        "max_requests_jitter": max(0, api.max_requests // 10),
+        "accesslog": None,
+        "errorlog": "-",
+        "post_worker_init": _post_worker_init,
+    }
+
+
+class _OverlayApiApplication(BaseApplication):  # type: ignore[misc]
+    def __init__(self, wsgi_app: Flask, options: dict[str, Any]) -> None:
+        self.wsgi_app = wsgi_app
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self) -> Flask:
+        return self.wsgi_app
+
+
+def serve(wsgi_app: Flask) -> None:
+    """Run gunicorn in the foreground until SIGTERM/SIGINT."""
+    options = gunicorn_options()
+    logger.info(
+        "Overlay API on %s (workers=%s threads=%s keepalive=%ss)",
+        options["bind"],
+        options["workers"],
+        options["threads"],
+        options["keepalive"],
+    )
+    _OverlayApiApplication(wsgi_app, options).run()
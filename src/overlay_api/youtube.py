@@ -4,15 +4,22 @@ YouTube Live: OAuth redirect/callback helpers and push-URL refresh from YouTube
 
 import json
 import logging
+import os
 import subprocess
+import tempfile
 import threading
 import time
 import urllib.error
 import urllib.parse
 import urllib.request
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from typing import Any, cast
 
 from config.settings import get_settings
+from overlay_api import metrics as api_metrics
+from stream_workers.urls import mask_url
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +29,8 @@ SCOPES = [
 ]
 AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth"
 TOKEN_URL = "https://oauth2.googleapis.com/token"
+DEFAULT_TOKEN_LIFETIME_SECONDS = 3600.0
+GOOGLE_HTTP_TIMEOUT_SECONDS = 10.0
 
 
 def build_connect_url(redirect_uri: str, state: str | None = None) -> str | None:
@@ -89,8 +98,8 @@ def get_channel_id(access_token: str) -> str | None:
     return None
 
 
-def refresh_access_token(refresh_token: str) -> str | None:
-    """Get a new access_token using refresh_token. Returns access_token or None."""
+def _request_access_token(refresh_token: str) -> tuple[str, float] | None:
+    """POST refresh_token grant to Google. Returns (access_token, expires_in seconds) or None."""
     yt = get_settings().youtube
     if not yt.client_id or not yt.client_secret:
         return None
@@ -105,132 +114,439 @@ def refresh_access_token(refresh_token: str) -> str | None:
     req = urllib.request.Request(TOKEN_URL, data=data, method="POST")
     req.add_header("Content-Type", "application/x-www-form-urlencoded")
     try:
-        with urllib.request.urlopen(req) as resp:
+        with urllib.request.urlopen(req, timeout=GOOGLE_HTTP_TIMEOUT_SECONDS) as resp:
             out = json.loads(resp.read().decode())
-        return cast(str | None, out.get("access_token"))
-    except (urllib.error.HTTPError, urllib.error.URLError, json.JSONDecodeError) as e:
+        access_token = out.get("access_token")
+        if not access_token:
+            return None
+        return (str(access_token), float(out.get("expires_in") or DEFAULT_TOKEN_LIFETIME_SECONDS))
+    except (urllib.error.HTTPError, urllib.error.URLError, OSError, json.JSONDecodeError, ValueError) as e:
         logger.warning("Token refresh failed: %s", e)
         return None
 
 
-def get_ingestion_urls() -> list[str]:
+class _CachedToken:
+    __slots__ = ("access_token", "expires_at")
+
+    def __init__(self, access_token: str, expires_at: float) -> None:
+        self.access_token = access_token
+        self.expires_at = expires_at
+
+
+class _InflightRefresh:
+    __slots__ = ("done", "result")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: str | None = None
+
+
+class AccessTokenManager:
     """
-    For each channel in YOUTUBE__REFRESH_TOKENS, refresh token, create/reuse liveStream and liveBroadcast,
-    return list of rtmp://ingestionAddress/streamName.
+    Per-refresh-token access-token cache honoring expires_in.
+    Tokens are treated as expired expiry_margin_seconds early; within early_refresh_seconds of expiry the cached
+    token is still returned while a background refresh runs. Concurrent refreshes of one token collapse into one;
+    callers waiting on another caller's refresh give up after wait_timeout_seconds and get the cached token while it
+    has not expired, else None. clock is the time source for expiry (monotonic seconds).
     """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], tuple[str, float] | None],
+        expiry_margin_seconds: float = 60.0,
+        early_refresh_seconds: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+        wait_timeout_seconds: float = GOOGLE_HTTP_TIMEOUT_SECONDS,
+    ) -> None:
+        self._fetch = fetch
+        self._clock = clock
+        self.expiry_margin_seconds = expiry_margin_seconds
+        self.early_refresh_seconds = early_refresh_seconds
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self._tokens: dict[str, _CachedToken] = {}
+        self._inflight: dict[str, _InflightRefresh] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.refreshes = 0
+
+    def get(self, refresh_token: str) -> str | None:
+        """Return a valid access token, refreshing only when missing or about to expire."""
+        now = self._clock()
+        with self._lock:
+            cached = self._tokens.get(refresh_token)
+            if cached is not None and cached.expires_at - self.expiry_margin_seconds > now:
+                self.hits += 1
+                if cached.expires_at - self.early_refresh_seconds <= now and refresh_token not in self._inflight:
+                    self._inflight[refresh_token] = _InflightRefresh()
+                    threading.Thread(target=self._refresh, args=(refresh_token,), daemon=True).start()
+                return cached.access_token
+            inflight = self._inflight.get(refresh_token)
+            leader = inflight is None
+            if inflight is None:
+                inflight = _InflightRefresh()
+                self._inflight[refresh_token] = inflight
+        if leader:
+            return self._refresh(refresh_token)
+        if inflight.done.wait(timeout=self.wait_timeout_seconds):
+            return inflight.result
+        with self._lock:
+            cached = self._tokens.get(refresh_token)
+        return cached.access_token if cached is not None and cached.expires_at > self._clock() else None
+
+    def invalidate(self, refresh_token: str) -> None:
+        """Drop the cached token (e.g. after a 401) so the next get() refreshes."""
+        with self._lock:
+            self._tokens.pop(refresh_token, None)
+
+    def _refresh(self, refresh_token: str) -> str | None:
+        result: str | None = None
+        try:
+            fetched = self._fetch(refresh_token)
+            if fetched is not None:
+                result, expires_in = fetched
+                with self._lock:
+                    self._tokens[refresh_token] = _CachedToken(result, self._clock() + expires_in)
+                    self.refreshes += 1
+        finally:
+            with self._lock:
+                inflight = self._inflight.pop(refresh_token, None)
+            if inflight is not None:
+                inflight.result = result
+                inflight.done.set()
+        return result
+
+
+_token_manager_holder: list[AccessTokenManager | None] = [None]
+_token_manager_lock = threading.Lock()
+
+
+def get_token_manager() -> AccessTokenManager:
+    """Process-wide token cache, created once (provisioning threads reach it in parallel)."""
+    with _token_manager_lock:
+        manager = _token_manager_holder[0]
+        if manager is None:
+            yt = get_settings().youtube
+            manager = AccessTokenManager(
+                _request_access_token,
+                expiry_margin_seconds=yt.token_expiry_margin_seconds,
+                early_refresh_seconds=yt.token_early_refresh_seconds,
+            )
+            _token_manager_holder[0] = manager
+        return manager
+
+
+def refresh_access_token(refresh_token: str) -> str | None:
+    """Get an access_token for refresh_token from the token cache (refreshed near expiry). Returns access_token or None."""
+    return get_token_manager().get(refresh_token)
+
+
+@dataclass(frozen=True)
+class ChannelIngest:
+    """Provisioned YouTube resources for one channel; cached so refreshes only re-check the stream and a channel whose
+    provisioning fails or times out keeps its last known URL. broadcast_id is None until a broadcast could be bound."""
+
+    stream_id: str
+    rtmp_url: str
+    broadcast_id: str | None
+
+
+_channel_cache: dict[str, ChannelIngest] = {}
+_channel_cache_lock = threading.Lock()
+_discovery_doc_holder: list[dict[str, Any] | None] = [None]
+_discovery_doc_lock = threading.Lock()
+
+
+def _youtube_client(access_token: str) -> Any:
+    """
+    Build a YouTube v3 client from the discovery document parsed once per process (clients are not thread-safe).
+    Its HTTP calls time out after GOOGLE_HTTP_TIMEOUT_SECONDS so a hung request cannot hold a provisioning thread.
+    """
+    import httplib2  # type: ignore[import-untyped]
     from google.oauth2.credentials import Credentials
-    from googleapiclient.discovery import build  # type: ignore[import-untyped]
+    from google_auth_httplib2 import AuthorizedHttp  # type: ignore[import-untyped]
+    from googleapiclient import discovery_cache  # type: ignore[import-untyped]
+    from googleapiclient.discovery import build_from_document  # type: ignore[import-untyped]
+
+    with _discovery_doc_lock:
+        doc = _discovery_doc_holder[0]
+        if doc is None:
+            doc = cast(dict[str, Any], json.loads(discovery_cache.get_static_doc("youtube", "v3")))
+            _discovery_doc_holder[0] = doc
+    creds = Credentials(token=access_token)  # type: ignore[no-untyped-call]
+    return build_from_document(doc, http=AuthorizedHttp(creds, http=httplib2.Http(timeout=GOOGLE_HTTP_TIMEOUT_SECONDS)))
+
+
+def _stream_ingest(stream: dict[str, Any]) -> tuple[str | None, str | None]:
+    """Return (stream_id, rtmp://ingestionAddress/streamName) from a liveStream resource."""
+    ing = stream.get("cdn", {}).get("ingestionInfo", {})
+    ingestion_address = ing.get("ingestionAddress")
+    stream_name = ing.get("streamName")
+    if not ingestion_address or not stream_name:
+        return stream.get("id"), None
+    return stream.get("id"), f"rtmp://{ingestion_address}/{stream_name}"
+
+
+def _ensure_bound_broadcast(youtube: Any, stream_id: str) -> str | None:
+    """Return id of a broadcast bound to stream_id, creating and binding one when missing."""
+    broadcast_list = (
+        youtube.liveBroadcasts()
+        .list(
+            part="id,contentDetails",
+            broadcastStatus="all",
+        )
+        .execute()
+    )
+    for b in broadcast_list.get("items", []):
+        if b.get("contentDetails", {}).get("boundStreamId") == stream_id:
+            return cast(str, b["id"])
+    # Create broadcast and bind (insert returns the resource directly)
+    insert_b = (
+        youtube.liveBroadcasts()
+        .insert(
+            part="snippet,status",
+            body={
+                "snippet": {
+                    "title": "Donatik Live",
+                    "scheduledStartTime": "2030-01-01T00:00:00Z",
+                },
+                "status": {"privacyStatus": "unlisted"},
+            },
+        )
+        .execute()
+    )
+    bid = insert_b.get("id")
+    if bid:
+        youtube.liveBroadcasts().bind(part="id,contentDetails", id=bid, streamId=stream_id).execute()
+    return cast(str | None, bid)
+
+
+def _provision_channel(channel_id: str, refresh_token: str) -> str | None:
+    """Provision one channel; a 401 drops the cached access token so the next refresh gets a new one."""
+    from googleapiclient.errors import HttpError  # type: ignore[import-untyped]
+
+    started = time.perf_counter()
+    try:
+        url = _provision_channel_once(channel_id, refresh_token)
+    except HttpError as e:
+        api_metrics.YOUTUBE_REFRESH_FAILURES.labels(channel_id, f"http_{getattr(e.resp, 'status', 'error')}").inc()
+        if getattr(e.resp, "status", None) == 401:
+            get_token_manager().invalidate(refresh_token)
+        raise
+    except Exception:
+        api_metrics.YOUTUBE_REFRESH_FAILURES.labels(channel_id, "error").inc()
+        raise
+    finally:
+        api_metrics.YOUTUBE_REFRESH_SECONDS.labels(channel_id).observe(time.perf_counter() - started)
+    if url is None:
+        api_metrics.YOUTUBE_REFRESH_FAILURES.labels(channel_id, "no_url").inc()
+    return url
+
+
+def _provision_channel_once(channel_id: str, refresh_token: str) -> str | None:
+    """
+    Return the channel's RTMP ingestion URL. With a cached stream, one liveStreams.list(id=...) call confirms it;
+    otherwise create/reuse a liveStream, ensure a bound liveBroadcast and cache the ids.
+    """
+    access_token = refresh_access_token(refresh_token)
+    if not access_token:
+        return None
+    youtube = _youtube_client(access_token)
+    with _channel_cache_lock:
+        cached = _channel_cache.get(channel_id)
+    if cached is not None and cached.broadcast_id:
+        items = youtube.liveStreams().list(part="id,cdn", id=cached.stream_id).execute().get("items", [])
+        if items:
+            current_id, current_url = _stream_ingest(items[0])
+            if current_id == cached.stream_id and current_url == cached.rtmp_url:
+                return current_url
+        logger.info("YouTube channel %s: cached stream %s changed; re-provisioning", channel_id, cached.stream_id)
+
+    # Create or reuse a live stream; get ingestion info
+    stream_list = youtube.liveStreams().list(part="id,cdn", mine=True).execute()
+    stream_id = None
+    rtmp_url = None
+    if stream_list.get("items"):
+        stream_id, rtmp_url = _stream_ingest(stream_list["items"][0])
+    if not stream_id or not rtmp_url:
+        # Create new stream (insert returns the resource directly)
+        s = (
+            youtube.liveStreams()
+            .insert(
+                part="snippet,cdn,status",
+                body={
+                    "snippet": {"title": "Donatik Live"},
+                    "cdn": {"resolution": "1080p", "frameRate": "30fps"},
+                },
+            )
+            .execute()
+        )
+        stream_id, rtmp_url = _stream_ingest(s)
+        if not stream_id or not rtmp_url:
+            return None
 
+    # Ensure a broadcast is bound to this stream; the URL is usable even if binding fails
+    broadcast_id = None
+    try:
+        broadcast_id = _ensure_bound_broadcast(youtube, stream_id)
+    except Exception as e:
+        logger.warning("YouTube broadcast bind for channel %s: %s", channel_id, e)
+    with _channel_cache_lock:
+        _channel_cache[channel_id] = ChannelIngest(stream_id=stream_id, rtmp_url=rtmp_url, broadcast_id=broadcast_id)
+    return rtmp_url
+
+
+PROVISION_POLL_SECONDS = 0.1
+
+# Provisioning still running from an earlier refresh, per channel; such channels are not submitted again
+_running_provisions: dict[str, Future[str | None]] = {}
+_running_provisions_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class IngestionUrls:
+    """Result of one provisioning run: URLs to push to, and channels with neither a fresh nor a cached URL."""
+
+    urls: tuple[str, ...]
+    unresolved: tuple[str, ...] = ()
+
+
+def _wait_per_channel(futures: dict[str, Future[str | None]], started: dict[str, float], timeout: float, workers: int) -> set[str]:
+    """
+    Wait until every channel finished or ran for timeout seconds since it started; return the timed-out channel ids.
+    Channels still queued once every worker is held by a timed-out channel can never start, so they time out too.
+    """
+    timed_out: set[str] = set()
+    while True:
+        now = time.monotonic()
+        deadlines: list[float] = []
+        waiting: list[str] = []
+        for channel_id, future in futures.items():
+            if future.done() or channel_id in timed_out:
+                continue
+            start = started.get(channel_id)
+            if start is not None and now - start >= timeout:
+                timed_out.add(channel_id)
+                continue
+            if start is not None:
+                deadlines.append(start + timeout)
+            waiting.append(channel_id)
+        if not waiting:
+            return timed_out
+        if sum(1 for channel_id in timed_out if not futures[channel_id].done()) >= workers:
+            timed_out.update(waiting)
+            return timed_out
+        next_check = min(deadlines, default=now + PROVISION_POLL_SECONDS)
+        wait([futures[channel_id] for channel_id in waiting], timeout=max(0.0, next_check - now), return_when=FIRST_COMPLETED)
+
+
+def provision_ingestion_urls() -> IngestionUrls:
+    """
+    For each channel in YOUTUBE__REFRESH_TOKENS, refresh token, create/reuse liveStream and liveBroadcast, and
+    collect rtmp://ingestionAddress/streamName. Channels are provisioned in parallel (YOUTUBE__PROVISION_MAX_WORKERS),
+    each with its own YOUTUBE__PROVISION_TIMEOUT_SECONDS from the moment it starts; a channel that fails or times out
+    keeps its last known URL, and is reported as unresolved when it has none yet. A channel whose provisioning from an
+    earlier run is still going is not provisioned again; it is treated like a timed-out channel.
+    """
     yt = get_settings().youtube
     if not yt.client_id or not yt.client_secret or not yt.refresh_tokens.strip():
-        return []
+        return IngestionUrls(())
     try:
         tokens = json.loads(yt.refresh_tokens)
     except json.JSONDecodeError:
-        return []
+        return IngestionUrls(())
     if not isinstance(tokens, dict):
-        return []
+        return IngestionUrls(())
+    channels = [(str(cid), tok) for cid, tok in tokens.items() if tok and isinstance(tok, str)]
+    if not channels:
+        return IngestionUrls(())
+
+    started: dict[str, float] = {}
+
+    def provision(channel_id: str, refresh_token: str) -> str | None:
+        started[channel_id] = time.monotonic()
+        return _provision_channel(channel_id, refresh_token)
+
+    with _running_provisions_lock:
+        busy = {cid for cid, _ in channels if cid in _running_provisions and not _running_provisions[cid].done()}
+    pending = [(cid, tok) for cid, tok in channels if cid not in busy]
+    futures: dict[str, Future[str | None]] = {}
+    if pending:
+        workers = max(1, min(len(pending), yt.provision_max_workers))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="yt-provision")
+        futures = {cid: executor.submit(provision, cid, tok) for cid, tok in pending}
+        with _running_provisions_lock:
+            _running_provisions.update(futures)
+        _wait_per_channel(futures, started, yt.provision_timeout_seconds, workers)
+        # Do not block on stragglers; they finish (and fill the cache) in the background
+        executor.shutdown(wait=False, cancel_futures=True)
 
     urls: list[str] = []
-    for channel_id, ref_tok in tokens.items():
-        if not ref_tok or not isinstance(ref_tok, str):
-            continue
-        access_token = refresh_access_token(ref_tok)
-        if not access_token:
-            continue
-        creds = Credentials(token=access_token)  # type: ignore[no-untyped-call]
-        try:
-            youtube = build("youtube", "v3", credentials=creds)
-
-            # Create or reuse a live stream; get ingestion info
-            stream_list = youtube.liveStreams().list(part="id,cdn", mine=True).execute()
-            stream_id = None
-            ingestion_address = None
-            stream_name = None
-            if stream_list.get("items"):
-                s = stream_list["items"][0]
-                stream_id = s["id"]
-                cdn = s.get("cdn", {})
-                ing = cdn.get("ingestionInfo", {})
-                ingestion_address = ing.get("ingestionAddress")
-                stream_name = ing.get("streamName")
-            if not stream_id or not ingestion_address or not stream_name:
-                # Create new stream (insert returns the resource directly)
-                s = (
-                    youtube.liveStreams()
-                    .insert(
-                        part="snippet,cdn,status",
-                        body={
-                            "snippet": {"title": "Donatik Live"},
-                            "cdn": {"resolution": "1080p", "frameRate": "30fps"},
-                        },
-                    )
-                    .execute()
-                )
-                stream_id = s.get("id")
-                cdn = s.get("cdn", {})
-                ing = cdn.get("ingestionInfo", {})
-                ingestion_address = ing.get("ingestionAddress")
-                stream_name = ing.get("streamName")
-                if not stream_id or not ingestion_address or not stream_name:
-                    continue
-
-            if not ingestion_address or not stream_name:
-                continue
-            rtmp_url = f"rtmp://{ingestion_address}/{stream_name}"
-            urls.append(rtmp_url)
-
-            # Ensure a broadcast is bound to this stream
-            broadcast_list = (
-                youtube.liveBroadcasts()
-                .list(
-                    part="id,contentDetails",
-                    broadcastStatus="all",
-                )
-                .execute()
-            )
-            bound_broadcast_id = None
-            for b in broadcast_list.get("items", []):
-                if b.get("contentDetails", {}).get("boundStreamId") == stream_id:
-                    bound_broadcast_id = b["id"]
-                    break
-            if not bound_broadcast_id:
-                # Create broadcast and bind (insert returns the resource directly)
-                insert_b = (
-                    youtube.liveBroadcasts()
-                    .insert(
-                        part="snippet,status",
-                        body={
-                            "snippet": {
-                                "title": "Donatik Live",
-                                "scheduledStartTime": "2030-01-01T00:00:00Z",
-                            },
-                            "status": {"privacyStatus": "unlisted"},
-                        },
-                    )
-                    .execute()
-                )
-                bid = insert_b.get("id")
-                if bid:
-                    youtube.liveBroadcasts().bind(part="id,contentDetails", id=bid, streamId=stream_id).execute()
-        except Exception as e:
-            logger.warning("YouTube API for channel %s: %s", channel_id, e)
+    unresolved: list[str] = []
+    for channel_id, _ in channels:
+        url: str | None = None
+        future = futures.get(channel_id)
+        if future is None:
+            api_metrics.YOUTUBE_REFRESH_FAILURES.labels(channel_id, "in_progress").inc()
+            logger.warning("YouTube API for channel %s: provisioning from an earlier refresh is still running", channel_id)
+        elif not future.done() or future.cancelled():  # still running, or still queued and cancelled above
+            api_metrics.YOUTUBE_REFRESH_FAILURES.labels(channel_id, "timeout").inc()
+            logger.warning("YouTube API for channel %s: timed out after %ss", channel_id, yt.provision_timeout_seconds)
+        elif future.exception() is not None:
+            logger.warning("YouTube API for channel %s: %s", channel_id, future.exception())
+        else:
+            url = future.result()
+        if url is None:
+            with _channel_cache_lock:
+                cached = _channel_cache.get(channel_id)
+            if cached is not None:
+                url = cached.rtmp_url
+            else:
+                unresolved.append(channel_id)
+        if url and url not in urls:
+            urls.append(url)
+    return IngestionUrls(tuple(urls), tuple(unresolved))
+
+
+def get_ingestion_urls() -> list[str]:
+    """Ingestion URLs of every channel (fresh, or last known for channels that failed or timed out)."""
+    return list(provision_ingestion_urls().urls)
+
+
+def read_push_conf(path: str | None = None) -> list[str] | None:
+    """Return push URLs currently in the Nginx include file, or None when it does not exist or cannot be read."""
+    path = path or get_settings().youtube.push_conf_path
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    urls: list[str] = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith("push ") and line.endswith(";"):
+            urls.append(line[len("push ") : -1].strip())
     return urls
 
 
 def write_push_conf(urls: list[str]) -> bool:
-    """Write Nginx push directives to YOUTUBE__PUSH_CONF_PATH. Returns True on success."""
+    """Write Nginx push directives to YOUTUBE__PUSH_CONF_PATH atomically (temp file + rename). Returns True on success."""
     yt = get_settings().youtube
     path = yt.push_conf_path
     lines = [f"push {u};" for u in urls]
     if not urls:
         lines = ["# No YouTube push URLs configured"]
+    tmp = None
     try:
-        with open(path, "w") as f:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".youtube_push.", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
             f.write("\n".join(lines) + "\n")
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
         return True
     except OSError as e:
         logger.warning("Write push conf %s: %s", path, e)
+        if tmp is not None and os.path.exists(tmp):
+            os.unlink(tmp)
         return False
 
 
@@ -247,28 +563,99 @@ def reload_nginx() -> None:
         logger.debug("Nginx reload skipped: %s", e)
 
 
-def _youtube_push_refresh_loop() -> None:
-    """Background loop: refresh ingestion URLs, write push conf, reload nginx."""
+@dataclass(frozen=True)
+class PushConfigDiff:
+    """Push URLs added/removed by one update; applied is False when writing or signalling Nginx failed."""
+
+    added: tuple[str, ...]
+    removed: tuple[str, ...]
+    applied: bool = True
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.removed)
+
+
+def _push_control(action: str, url: str) -> bool:
+    """Call YOUTUBE__PUSH_CONTROL_URL/push/<add|drop>?app=...&url=... Returns True on a 2xx response."""
+    yt = get_settings().youtube
+    query = urllib.parse.urlencode({"app": yt.push_control_app, "url": url})
+    req = urllib.request.Request(f"{yt.push_control_url.rstrip('/')}/push/{action}?{query}", method="GET")
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return 200 <= int(resp.status) < 300
+    except (urllib.error.HTTPError, urllib.error.URLError, OSError) as e:
+        logger.warning("Push control %s %s: %s", action, url, e)
+        return False
+
+
+def apply_push_urls(urls: list[str], keep_deployed: bool = False) -> PushConfigDiff:
+    """
+    Compare urls with the deployed push conf; when the set differs, rewrite it atomically and apply the change.
+    keep_deployed only adds: deployed pushes missing from urls stay (used while a channel's URL is unknown).
+    With YOUTUBE__PUSH_CONTROL_URL set, each added/removed push goes through the control endpoint and Nginx is
+    reloaded only if a control call fails; otherwise Nginx is reloaded. Unchanged sets touch nothing.
+    """
+    current = read_push_conf()
+    deployed = set(current or [])
+    wanted = list(dict.fromkeys([*(current or []), *urls] if keep_deployed else urls))
+    diff = PushConfigDiff(
+        added=tuple(u for u in wanted if u not in deployed),
+        removed=tuple(u for u in (current or []) if u not in set(wanted)),
+    )
+    if current is not None and not diff.changed:
+        logger.debug("YouTube push conf unchanged (%d url(s))", len(wanted))
+        return diff
+    if not write_push_conf(wanted):
+        return PushConfigDiff(added=diff.added, removed=diff.removed, applied=False)
+    logger.info("YouTube push conf updated: +%d -%d (%s)", len(diff.added), len(diff.removed), _describe_diff(diff))
+    if get_settings().youtube.push_control_url:
+        results = [_push_control("drop", u) for u in diff.removed] + [_push_control("add", u) for u in diff.added]
+        if all(results):
+            return diff
+        logger.warning("Push control failed; falling back to nginx reload")
+    reload_nginx()
+    return diff
+
+
+def _describe_diff(diff: PushConfigDiff) -> str:
+    """Added/removed URLs with stream keys masked for logs."""
+    parts = [f"+{mask_url(u)}" for u in diff.added] + [f"-{mask_url(u)}" for u in diff.removed]
+    return ", ".join(parts) or "initial write"
+
+
+def refresh_push_config() -> PushConfigDiff:
+    """One refresh: fetch ingestion URLs and apply them to the Nginx push conf when they changed.
+    While a channel has no URL yet (failed or timed out before its first success), no deployed push is removed."""
+    result = provision_ingestion_urls()
+    if result.unresolved:
+        logger.warning("YouTube channels without a URL (%s): keeping the deployed pushes", ", ".join(result.unresolved))
+    return apply_push_urls(list(result.urls), keep_deployed=bool(result.unresolved))
+
+
+def _youtube_push_refresh_loop(refresh_now: bool = False) -> None:
+    """Background loop: refresh ingestion URLs, update push conf and nginx only when the URL set changed."""
     yt = get_settings().youtube
     if not yt.client_id or not yt.refresh_tokens.strip():
         return
     interval = max(60, yt.refresh_interval_seconds)
-    while True:
+    if not refresh_now:
         time.sleep(interval)
+    while True:
         try:
-            urls = get_ingestion_urls()
-            if write_push_conf(urls):
-                reload_nginx()
+            refresh_push_config()
         except Exception as e:
             logger.warning("YouTube push refresh: %s", e)
+        time.sleep(interval)
 
 
-def start_youtube_push_refresh_thread() -> None:
-    """Start daemon thread for YouTube push config refresh. No-op if YouTube not configured."""
+def start_youtube_push_refresh_thread(refresh_now: bool = False) -> None:
+    """Start daemon thread for YouTube push config refresh. No-op if YouTube not configured.
+    refresh_now runs the first refresh immediately instead of after one interval."""
     yt = get_settings().youtube
     if not yt.client_id or not yt.refresh_tokens.strip():
         return
-    t = threading.Thread(target=_youtube_push_refresh_loop, daemon=True)
+    t = threading.Thread(target=_youtube_push_refresh_loop, args=(refresh_now,), daemon=True)
     t.start()
     logger.info(
         "YouTube push refresh thread started (interval=%ss)",
@@ -0,0 +1,93 @@
+"""
+Stream worker admin HTTP server (WORKER__ADMIN_HOST:WORKER__ADMIN_PORT; port 0 disables it).
+Serves GET routes registered by the worker, e.g. /metrics in Prometheus text format, from a daemon thread.
+"""
+
+import logging
+import threading
+import urllib.parse
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from config.settings import get_settings
+from stream_workers import metrics
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = metrics.CONTENT_TYPE
+
+# Handler: query params -> (status, content type, body)
+RouteHandler = Callable[[dict[str, list[str]]], tuple[int, str, bytes]]
+
+
+def metrics_route(extra: Callable[[], list[metrics.MetricFamily]] | None = None) -> RouteHandler:
+    """/metrics handler: this process's registry plus families from extra() (e.g. collected in pipeline processes)."""
+
+    def handle(_params: dict[str, list[str]]) -> tuple[int, str, bytes]:
+        families = metrics.REGISTRY.collect()
+        if extra is not None:
+            families.extend(extra())
+        return 200, PROMETHEUS_CONTENT_TYPE, metrics.render(families).encode()
+
+    return handle
+
+
+class AdminServer:
+    """ThreadingHTTPServer with a path -> handler table."""
+
+    def __init__(self, host: str, port: int, routes: dict[str, RouteHandler]) -> None:
+        self.routes = dict(routes)
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                parsed = urllib.parse.urlsplit(self.path)
+                handler = server.routes.get(parsed.path)
+                if handler is None:
+                    self._reply(404, "text/plain; charset=utf-8", b"not found\n")
+                    return
+                try:
+                    status, content_type, body = handler(urllib.parse.parse_qs(parsed.query))
+                except Exception as e:
+                    logger.warning("Admin %s failed: %s", parsed.path, e)
+                    self._reply(500, "text/plain; charset=utf-8", f"{e}\n".encode())
+                    return
+                self._reply(status, content_type, body)
+
+            def _reply(self, status: int, content_type: str, body: bytes) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                logger.debug("admin: " + format, *args)
+
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self.port = int(self._httpd.server_address[1])
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="worker-admin", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def close(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def start_admin_server(routes: dict[str, RouteHandler]) -> AdminServer | None:
+    """Start the admin server from WorkerSettings; None when disabled or the port cannot be bound."""
+    w = get_settings().worker
+    if w.admin_port <= 0:
+        return None
+    try:
+        server = AdminServer(w.admin_host, w.admin_port, routes)
+    except OSError as e:
+        logger.warning("Worker admin server not started on %s:%s: %s", w.admin_host, w.admin_port, e)
+        return None
+    server.start()
+    logger.info("Worker admin server on %s:%s (%s)", w.admin_host, server.port, ", ".join(sorted(routes)))
+    return server
@@ -0,0 +1,208 @@
+"""
+Output audio track, carried in lockstep with the video. Source AAC packets are passed through untouched (only
+their timestamps are rewritten); other codecs, or AAC with another sample rate or layout than the track, are
+decoded and re-encoded to AAC. While the source has no audio, a pre-encoded silent AAC frame is repeated.
+The track is contiguous: each packet starts where the previous one ended. Source timestamps are mapped to the output
+timeline through the video frame they arrive with (its output time minus its source time), so loops, reconnects
+and input switches re-anchor audio to video. A packet more than SYNC_TOLERANCE_SECONDS early is dropped; a gap
+larger than that is filled with silence.
+"""
+
+import logging
+from collections.abc import Sequence
+from dataclasses import dataclass
+from fractions import Fraction
+
+import av
+
+from stream_workers import metrics
+
+logger = logging.getLogger(__name__)
+
+AAC_FRAME_SAMPLES = 1024
+SYNC_TOLERANCE_SECONDS = 0.1
+MAX_LAG_SECONDS = 1.0  # source audio may trail its video by this much (file interleaving) before silence fills in
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    """Codec and parameters of an audio stream (extradata: AAC AudioSpecificConfig, None for ADTS framing)."""
+
+    codec_name: str
+    sample_rate: int
+    layout: str
+    extradata: bytes | None = None
+
+
+def audio_format(stream: av.AudioStream | None) -> AudioFormat | None:
+    if stream is None or not stream.codec_context.sample_rate:
+        return None
+    codec = stream.codec_context
+    return AudioFormat(codec.name, codec.sample_rate, codec.layout.name, bytes(codec.extradata) if codec.extradata else None)
+
+
+def create_aac_encoder(sample_rate: int, layout: str, bitrate_k: int) -> av.CodecContext:
+    enc = av.CodecContext.create("aac", "w")
+    enc.sample_rate = sample_rate
+    enc.layout = layout
+    enc.format = "fltp"
+    enc.bit_rate = bitrate_k * 1000
+    enc.time_base = Fraction(1, sample_rate)
+    enc.open()
+    return enc
+
+
+def output_format(source: AudioFormat | None, sample_rate: int, layout: str, bitrate_k: int) -> AudioFormat:
+    """The track's format: the source's when it is AAC (passthrough), otherwise AAC at sample_rate / layout."""
+    if source is not None and source.codec_name == "aac":
+        if source.extradata is not None:
+            return source
+        # ADTS-framed source: keep a config for the silent frames, which are raw AAC
+        encoder = create_aac_encoder(source.sample_rate, source.layout, bitrate_k)
+        return AudioFormat("aac", source.sample_rate, source.layout, bytes(encoder.extradata))
+    encoder = create_aac_encoder(sample_rate, layout, bitrate_k)
+    return AudioFormat("aac", sample_rate, layout, bytes(encoder.extradata))
+
+
+def _silent_frame(samples: int, sample_rate: int, layout: str) -> av.AudioFrame:
+    frame = av.AudioFrame(format="fltp", layout=layout, samples=samples)
+    for plane in frame.planes:
+        plane.update(bytes(plane.buffer_size))
+    frame.sample_rate = sample_rate
+    return frame
+
+
+def encode_silence(output: AudioFormat, bitrate_k: int) -> bytes:
+    """One AAC frame of silence in steady state (after the encoder's priming frame), reusable back to back."""
+    encoder = create_aac_encoder(output.sample_rate, output.layout, bitrate_k)
+    packets: list[av.Packet] = []
+    for i in range(4):
+        frame = _silent_frame(AAC_FRAME_SAMPLES, output.sample_rate, output.layout)
+        frame.pts = i * AAC_FRAME_SAMPLES
+        packets.extend(encoder.encode(frame))
+    return bytes(packets[-1])
+
+
+class _Transcoder:
+    """Decode one source format and re-encode it as AAC in the track's format; pending = samples inside the encoder."""
+
+    def __init__(self, source: AudioFormat, output: AudioFormat, bitrate_k: int) -> None:
+        self.source = source
+        self.output = output
+        self.decoder = av.CodecContext.create(source.codec_name, "r")
+        self.decoder.sample_rate = source.sample_rate
+        self.decoder.layout = source.layout
+        if source.extradata is not None:
+            self.decoder.extradata = source.extradata
+        self.resampler = av.AudioResampler(format="fltp", layout=output.layout, rate=output.sample_rate, frame_size=AAC_FRAME_SAMPLES)
+        self.encoder = create_aac_encoder(output.sample_rate, output.layout, bitrate_k)
+        self.pending = 0
+        self._fed = 0
+
+    def encode(self, packet: av.Packet) -> list[tuple[bytes, int]]:
+        frames = [r for f in self.decoder.decode(packet) for r in self.resampler.resample(f)]
+        return self._encode(frames)
+
+    def silence(self, samples: int) -> list[tuple[bytes, int]]:
+        return self._encode([_silent_frame(samples, self.output.sample_rate, self.output.layout)] if samples > 0 else [])
+
+    def _encode(self, frames: list[av.AudioFrame]) -> list[tuple[bytes, int]]:
+        out: list[tuple[bytes, int]] = []
+        for frame in frames:
+            frame.pts = self._fed
+            frame.time_base = self.encoder.time_base
+            self._fed += frame.samples
+            self.pending += frame.samples
+            for packet in self.encoder.encode(frame):
+                samples = packet.duration or AAC_FRAME_SAMPLES
+                self.pending -= samples
+                out.append((bytes(packet), samples))
+        return out
+
+
+class AudioTrack:
+    """Output audio of one pipeline, fed with the source packets that arrive with each video frame."""
+
+    def __init__(self, output: AudioFormat, bitrate_k: int = 128, stream: str = "") -> None:
+        self.output = output
+        self.bitrate_k = bitrate_k
+        self.time_base = Fraction(1, output.sample_rate)
+        self.next_pts = 0  # samples written so far: the next packet's pts
+        self._tolerance = round(SYNC_TOLERANCE_SECONDS * output.sample_rate)
+        self._max_lag = round(MAX_LAG_SECONDS * output.sample_rate)
+        self._silence: bytes | None = None
+        self._transcoder: _Transcoder | None = None
+        self._counters = {path: metrics.AUDIO_PACKETS.labels(stream, path) for path in ("passthrough", "transcoded", "silence", "dropped")}
+
+    def passthrough(self, source: AudioFormat) -> bool:
+        return (source.codec_name, source.sample_rate, source.layout) == ("aac", self.output.sample_rate, self.output.layout)
+
+    def feed(
+        self, packets: Sequence[av.Packet], source: AudioFormat | None, offset_seconds: float | None, until_seconds: float
+    ) -> list[av.Packet]:
+        """Output packets for one video frame: packets are the source audio demuxed with it, offset_seconds maps their
+        timestamps to the output (frame output time - frame source time, None if unknown) and until_seconds is the
+        frame's end on the output timeline. source None (no audio) plays silence up to until_seconds."""
+        out: list[av.Packet] = []
+        transcoder = self._transcoder_for(source)
+        for packet in packets:
+            target = self._target(packet, offset_seconds)
+            cursor = self.next_pts + (transcoder.pending if transcoder is not None else 0)
+            if target is not None and target < cursor - self._tolerance:
+                self._counters["dropped"].inc()
+                continue
+            if target is not None and target > cursor + self._tolerance:
+                out += self._fill(transcoder, target - cursor)
+            if transcoder is not None:
+                out += self._emit(transcoder.encode(packet), "transcoded")
+            else:
+                out += self._emit([(bytes(packet), self._samples(packet))], "passthrough")
+        until = round(until_seconds * self.output.sample_rate) - (self._max_lag if source is not None else 0)
+        cursor = self.next_pts + (transcoder.pending if transcoder is not None else 0)
+        if until > cursor:
+            out += self._fill(transcoder, until - cursor)
+        return out
+
+    def _transcoder_for(self, source: AudioFormat | None) -> _Transcoder | None:
+        if source is None or self.passthrough(source):
+            self._transcoder = None  # samples still inside a previous transcoder are dropped with it
+            return None
+        if self._transcoder is None or self._transcoder.source != source:
+            logger.info("Transcoding %s audio (%d Hz %s) to the AAC track", source.codec_name, source.sample_rate, source.layout)
+            self._transcoder = _Transcoder(source, self.output, self.bitrate_k)
+        return self._transcoder
+
+    def _target(self, packet: av.Packet, offset_seconds: float | None) -> int | None:
+        """Output sample position for packet (None: no timestamp to sync on, append contiguously)."""
+        if offset_seconds is None or packet.pts is None or packet.time_base is None:
+            return None
+        return round((float(packet.pts * packet.time_base) + offset_seconds) * self.output.sample_rate)
+
+    def _samples(self, packet: av.Packet) -> int:
+        if packet.duration and packet.time_base is not None:
+            return int(packet.duration * packet.time_base * self.output.sample_rate)
+        return AAC_FRAME_SAMPLES
+
+    def _fill(self, transcoder: _Transcoder | None, samples: int) -> list[av.Packet]:
+        """Whole AAC frames of silence covering up to samples (through the transcoder when one is active)."""
+        frames = samples // AAC_FRAME_SAMPLES
+        if frames <= 0:
+            return []
+        if transcoder is not None:
+            return self._emit(transcoder.silence(frames * AAC_FRAME_SAMPLES), "silence")
+        if self._silence is None:
+            self._silence = encode_silence(self.output, self.bitrate_k)
+        return self._emit([(self._silence, AAC_FRAME_SAMPLES)] * frames, "silence")
+
+    def _emit(self, units: list[tuple[bytes, int]], path: str) -> list[av.Packet]:
+        packets = []
+        for data, samples in units:
+            packet = av.Packet(data)
+            packet.pts = packet.dts = self.next_pts
+            packet.duration = samples
+            packet.time_base = self.time_base
+            packet.is_keyframe = True
+            self.next_pts += samples
+            packets.append(packet)
+        self._counters[path].inc(len(packets))
+        return packets
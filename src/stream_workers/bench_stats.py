@@ -0,0 +1,24 @@
+"""
+Throughput and latency percentile summaries shared by the benchmark, latency and load scripts (scripts/).
+"""
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict[str, float]:
+    """Throughput (items/s over elapsed) and latency percentiles in ms."""
+    ordered = sorted(latencies)
+    n = len(ordered)
+    return {
+        "frames": n,
+        "fps": round(n / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(_percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(_percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(_percentile(ordered, 99) * 1000, 3),
+        "max_ms": round((ordered[-1] if ordered else 0.0) * 1000, 3),
+    }
@@ -0,0 +1,114 @@
+"""
+Congestion-aware encoder bitrate (ENCODING__ADAPTIVE_BITRATE). When the uplink or the RTMP push congests, packets
+back up in the FanOut's destination buffers: writers sit blocked in writes, the backlog grows and its oldest packet
+ages. AdaptiveBitrate reads that from the destinations' stats and answers at each GOP boundary: step the bitrate down
+while the outputs stay congested and the backlog is not draining, and probe back up once it has been drained for a
+while, between a floor and a ceiling. The pipeline applies a new bitrate by reopening x264 at the GOP boundary, where
+an IDR is due anyway (libx264 only takes a bitrate change at runtime when VBV is configured, which PyAV cannot
+update once the encoder is open), so the stream degrades in quality instead of stalling until the push breaks.
+"""
+
+from dataclasses import dataclass
+
+from config.settings import EncodingSettings
+from stream_workers.rtmp_out import DestinationStats
+
+CONGESTED_WRITE_BUSY = 0.9  # writer blocked in writes for this share of the time: the destination is at capacity
+DRAINED_WRITE_BUSY = 0.5
+DRAINED_LAG_FRACTION = 0.25  # lag / backlog under this share of congestion_lag_seconds counts as drained
+
+
+@dataclass(frozen=True)
+class Backpressure:
+    """Worst output backpressure over the connected destinations since the previous sample."""
+
+    write_busy: float  # share of the time the writer spent blocked in writes
+    lag_seconds: float  # age of the oldest queued packet
+    backlog_seconds: float  # time to send the queued bytes at the rate the destination currently accepts
+
+    @property
+    def delay_seconds(self) -> float:
+        return max(self.lag_seconds, self.backlog_seconds)
+
+
+class AdaptiveBitrate:
+    """Bitrate steps (kbit/s) from output backpressure, measured and updated once per GOP."""
+
+    def __init__(
+        self,
+        initial_k: int,
+        floor_k: int,
+        ceiling_k: int,
+        step_down: float = 0.75,
+        step_up: float = 1.1,
+        congestion_lag_seconds: float = 1.0,
+        probe_seconds: float = 10.0,
+    ) -> None:
+        if not 0 < step_down < 1 or step_up <= 1:
+            raise ValueError(f"bitrate steps must be 0 < step_down < 1 < step_up (got {step_down}, {step_up})")
+        self.floor_k = min(floor_k, ceiling_k)
+        self.ceiling_k = ceiling_k
+        self.step_down = step_down
+        self.step_up = step_up
+        self.congestion_lag_seconds = congestion_lag_seconds
+        self.probe_seconds = probe_seconds
+        self.bitrate_k = max(self.floor_k, min(ceiling_k, initial_k))
+        self._write_seconds: dict[str, float] = {}
+        self._sampled_at: float | None = None
+        self._congested_delay: float | None = None  # delay at the previous congested update
+        self._drained_since: float | None = None
+
+    @classmethod
+    def from_settings(cls, settings: EncodingSettings) -> "AdaptiveBitrate":
+        return cls(
+            settings.cbr_bitrate_k,
+            settings.bitrate_floor_k,
+            settings.bitrate_ceiling_k or settings.cbr_bitrate_k,
+            settings.bitrate_step_down,
+            settings.bitrate_step_up,
+            settings.congestion_lag_seconds,
+            settings.bitrate_probe_seconds,
+        )
+
+    def measure(self, outputs: list[DestinationStats], now: float) -> Backpressure:
+        """Backpressure of the connected destinations; write_busy covers the time since the previous measure()."""
+        elapsed = now - self._sampled_at if self._sampled_at is not None else 0.0
+        busy = lag = backlog = 0.0
+        for st in outputs:
+            previous = self._write_seconds.get(st.url)
+            self._write_seconds[st.url] = st.write_seconds
+            if not st.connected:
+                continue  # reconnecting: its buffer was dropped, nothing to relieve by encoding less
+            if previous is not None and elapsed > 0:
+                busy = max(busy, (st.write_seconds - previous) / elapsed)
+            lag = max(lag, st.lag_seconds)
+            backlog = max(backlog, st.backlog_bytes * 8 / ((st.bitrate_kbps or self.bitrate_k) * 1000))
+        self._sampled_at = now
+        return Backpressure(busy, lag, backlog)
+
+    def update(self, pressure: Backpressure, now: float) -> int | None:
+        """At a GOP boundary: the new bitrate when it should change, else None."""
+        delay = pressure.delay_seconds
+        if pressure.write_busy >= CONGESTED_WRITE_BUSY or delay >= self.congestion_lag_seconds:
+            self._drained_since = None
+            draining = self._congested_delay is not None and delay < self._congested_delay
+            self._congested_delay = delay
+            if draining:
+                return None  # the previous step is working: let the backlog drain before cutting further
+            return self._set(max(self.floor_k, int(self.bitrate_k * self.step_down)))
+        self._congested_delay = None
+        if pressure.write_busy >= DRAINED_WRITE_BUSY or delay >= self.congestion_lag_seconds * DRAINED_LAG_FRACTION:
+            self._drained_since = None
+            return None
+        if self._drained_since is None:
+            self._drained_since = now
+        if now - self._drained_since < self.probe_seconds:
+            return None
+        self._drained_since = now  # the next probe waits another probe_seconds
+        return self._set(min(self.ceiling_k, max(self.bitrate_k + 1, int(self.bitrate_k * self.step_up))))
+
+    def _set(self, bitrate_k: int) -> int | None:
+        if bitrate_k == self.bitrate_k:
+            return None
+        self.bitrate_k = bitrate_k
+        return bitrate_k
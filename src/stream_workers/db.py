@@ -62,6 +62,14 @@ class OverlayPaymentLink(Base):
     active: Mapped[bool] = mapped_column(nullable=False, default=False)
 
 
+class ProcessedStripeEvent(Base):
+    """Stripe event ids already handled; shared by all API workers for webhook dedupe, pruned by retention."""
+
+    __tablename__ = "processed_stripe_events"
+    event_id: Mapped[str] = mapped_column(primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(UTC))
+
+
 _engine_holder: list[Engine | None] = [None]
 
 
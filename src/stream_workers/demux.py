@@ -1,32 +1,226 @@
 """
 Demux MP4 (H.264/AAC) and RTSP over TCP via PyAV.
 Yields decoded video/audio packets for the pipeline.
+open_source() opens with bounded probing and open/read timeouts (WORKER__INPUT_*); when the StreamParams of an
+earlier open are known it forces that format and skips probing, falling back to a full probe if the stream changed.
+iter_looping_packets() plays a file forever from one open container (optionally memory-mapped): it seeks back
+instead of reopening, replays the first GOP from memory at each wrap and keeps timestamps increasing.
+Close containers from open_source()/open_mapped() with close_input(), which also unmaps a memory-mapped file.
 """
 
 from __future__ import annotations
 
 import logging
+import mmap
+import threading
 from collections.abc import Iterator
+from dataclasses import dataclass
 
 import av
 
+from config.settings import WorkerSettings
+from stream_workers.urls import mask_url
+
 logger = logging.getLogger(__name__)
 
+MIN_PROBESIZE = 32  # FFmpeg's minimum: read just enough to find the streams
+MAX_LOOP_HEAD_BYTES = 16_000_000  # first GOP kept in memory for the wrap; larger GOPs just seek
+
+
+@dataclass(frozen=True)
+class StreamParams:
+    """Demuxer and video stream found by a full probe; lets a reconnect skip probing."""
+
+    format_name: str
+    codec_name: str
+    width: int
+    height: int
 
-def open_input(path_or_url: str, options: dict[str, str] | None = None) -> av.container.InputContainer:
+
+def open_input(
+    path_or_url: str,
+    options: dict[str, str] | None = None,
+    timeout: float | tuple[float, float] | None = None,
+    format: str | None = None,
+) -> av.container.InputContainer:
     """Open MP4 file or RTSP URL. RTSP uses TCP when options include 'rtsp_transport': 'tcp'."""
     opts = options or {}
-    if not path_or_url.startswith("rtsp://"):
-        return av.open(path_or_url, options=opts)
-    opts.setdefault("rtsp_transport", "tcp")
-    return av.open(path_or_url, options=opts)
+    if path_or_url.startswith("rtsp://"):
+        opts.setdefault("rtsp_transport", "tcp")
+    return av.open(path_or_url, options=opts, timeout=timeout, format=format)
+
+
+# Maps behind open_mapped() containers, by id(container): container.close() leaves the map open, close_input() releases it
+_maps: dict[int, mmap.mmap] = {}
+_maps_lock = threading.Lock()
+
+
+def open_mapped(path: str, options: dict[str, str] | None = None, format: str | None = None) -> av.container.InputContainer:
+    """Open a local file through a read-only memory map (page cache instead of read() calls).
+    Close it with close_input(): container.close() alone leaves the map open until garbage collection."""
+    with open(path, "rb") as fh:
+        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        container = av.open(mapped, options=options or {}, format=format)
+    except BaseException:
+        mapped.close()
+        raise
+    with _maps_lock:
+        _maps[id(container)] = mapped  # replaces the map of a collected container that was never close_input()-ed
+    return container
+
+
+def close_input(container: av.container.InputContainer) -> None:
+    """Close container and release its memory map, if it was opened with open_mapped()."""
+    container.close()
+    with _maps_lock:
+        mapped = _maps.pop(id(container), None)
+    if mapped is not None:
+        mapped.close()
+
+
+def is_network_url(path_or_url: str) -> bool:
+    scheme, sep, _ = path_or_url.partition("://")
+    return bool(sep) and scheme != "file"
+
+
+def open_options(url: str, settings: WorkerSettings, cached: bool) -> dict[str, str]:
+    """FFmpeg options for an input open: bounded (or, with cached StreamParams, minimal) probing, optional nobuffer."""
+    opts = {
+        "probesize": str(MIN_PROBESIZE if cached else settings.input_probesize),
+        "analyzeduration": str(0 if cached else settings.input_analyzeduration_ms * 1000),
+    }
+    if settings.input_low_delay and is_network_url(url):
+        opts["fflags"] = "nobuffer"  # drops the packets read while probing: live sources only, never files
+    return opts
+
+
+def stream_params(container: av.container.InputContainer) -> StreamParams | None:
+    stream = get_video_stream(container)
+    if stream is None or not stream.codec_context.width or not stream.codec_context.height:
+        return None
+    return StreamParams(
+        format_name=container.format.name.split(",")[0],
+        codec_name=stream.codec_context.name,
+        width=stream.codec_context.width,
+        height=stream.codec_context.height,
+    )
+
+
+def open_source(
+    url: str, settings: WorkerSettings, cached: StreamParams | None = None
+) -> tuple[av.container.InputContainer, StreamParams | None, bool]:
+    """Open url with WORKER__INPUT_* probing and timeouts; (container, its StreamParams, whether the cached ones were used)."""
+    timeout = (settings.input_open_timeout_seconds, settings.input_read_timeout_seconds)
+    mapped = settings.input_mmap and not is_network_url(url)
+
+    def _open(options: dict[str, str], format: str | None = None) -> av.container.InputContainer:
+        if mapped:
+            return open_mapped(url, options, format=format)
+        return open_input(url, options, timeout=timeout, format=format)
+
+    if cached is not None:
+        try:
+            container = _open(open_options(url, settings, cached=True), format=cached.format_name)
+        except av.FFmpegError as e:
+            logger.info("Input %s: fast open failed (%s); probing", mask_url(url), e)
+        else:
+            if stream_params(container) == cached:
+                return container, cached, True
+            close_input(container)
+            logger.info("Input %s: stream parameters changed; probing", mask_url(url))
+    container = _open(open_options(url, settings, cached=False))
+    return container, stream_params(container), False
+
+
+def iter_packets(container: av.container.InputContainer, *streams: av.stream.Stream) -> Iterator[av.Packet]:
+    """Iterate over packets (demux) of streams (default all). Use decode in pipeline for frames."""
+    yield from container.demux(*streams)
+
+
+def _retime(packet: av.Packet, offset: int) -> av.Packet:
+    if offset:
+        packet.pts = packet.pts + offset if packet.pts is not None else None
+        packet.dts = packet.dts + offset if packet.dts is not None else None
+    return packet
+
+
+def _replay(packet: av.Packet, offset: int) -> av.Packet:
+    """Fresh copy of a cached packet, shifted by offset (the cached one stays as demuxed: consumers may hold it)."""
+    copy = av.Packet(bytes(packet))
+    copy.stream = packet.stream
+    copy.time_base = packet.time_base
+    copy.duration = packet.duration
+    copy.is_keyframe = packet.is_keyframe
+    copy.pts = packet.pts + offset if packet.pts is not None else None
+    copy.dts = packet.dts + offset if packet.dts is not None else None
+    return copy
 
 
-def iter_packets(
-    container: av.container.InputContainer,
+def iter_looping_packets(
+    container: av.container.InputContainer, *streams: av.stream.Stream, max_head_bytes: int = MAX_LOOP_HEAD_BYTES
 ) -> Iterator[av.Packet]:
-    """Iterate over packets (demux). Use decode in pipeline for frames."""
-    yield from container.demux()
+    """Packets of streams (the first, video, sets the loop points), looping forever without reopening the container.
+    The first pass keeps the first GOP (keyframe up to the next keyframe, with the other streams' packets in between)
+    in memory. At each wrap those packets are replayed without I/O and the container seeks to the second keyframe, so
+    the next loop is ready before the current one ends; a file of one GOP plays from memory. Every loop shifts pts/dts
+    of all streams by the video duration, so timestamps keep increasing through the wrap (end-of-file flush packets
+    are skipped: the loop's first IDR drains the decoder)."""
+    anchor = streams[0]
+    head: list[av.Packet] | None = []  # None: the first GOP exceeded max_head_bytes, wrap by seeking to 0
+    head_bytes = 0
+    collecting = True
+    seek_to: int | None = None  # pts of the second keyframe
+    resume: dict[int, int] = {}  # stream index -> dts of its first packet after the head
+    start: int | None = None  # the video's presentation span: loop length = end - start
+    end = 0
+    loops = 0
+    offsets = dict.fromkeys((s.index for s in streams), 0)
+    while True:
+        for packet in container.demux(*streams):
+            dts = packet.dts if packet.dts is not None else packet.pts  # Matroska keyframes may carry only a pts
+            if dts is None or not packet.size:
+                continue
+            index = packet.stream.index
+            if loops == 0:
+                if index == anchor.index:
+                    pts = packet.pts if packet.pts is not None else dts
+                    start = pts if start is None else min(start, pts)
+                    end = max(end, pts + (packet.duration or 1))
+                if collecting and head is not None:
+                    if index == anchor.index and packet.is_keyframe and head:
+                        collecting = False
+                        seek_to = packet.pts if packet.pts is not None else dts
+                    elif head or (index == anchor.index and packet.is_keyframe):
+                        head.append(packet)
+                        head_bytes += packet.size
+                        if head_bytes > max_head_bytes:
+                            head = None
+                if not collecting:
+                    resume.setdefault(index, dts)
+            elif head is not None and dts < resume.get(index, dts + 1):
+                continue  # the seek landed before the second keyframe: those packets came from the head
+            yield _retime(packet, offsets[index])
+        if start is None:
+            return  # no video packets at all
+        loops += 1
+        ticks = loops * (end - start)
+        offsets = {s.index: round(ticks * anchor.time_base / s.time_base) for s in streams}
+        if head is None:
+            container.seek(0)
+            continue
+        for packet in head:
+            yield _replay(packet, offsets[packet.stream.index])
+        if seek_to is not None:
+            container.seek(seek_to, stream=anchor)
+            continue
+        # One GOP: keep replaying it from memory (the container is already at the end)
+        while True:
+            loops += 1
+            ticks = loops * (end - start)
+            offsets = {s.index: round(ticks * anchor.time_base / s.time_base) for s in streams}
+            for packet in head:
+                yield _replay(packet, offsets[packet.stream.index])
 
 
 def get_video_stream(container: av.container.InputContainer) -> av.VideoStream | None:
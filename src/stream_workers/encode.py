@@ -1,14 +1,23 @@
 """
 Encode with libx264 or h264_nvenc: CBR 4500kbps, GOP 2s, profile high, level 4.1, zerolatency.
 Uses config.settings encoding. On capacity exceeded: drop frames and log (FR-009).
+With ENCODING__TIMESTAMP_SEI each encoded frame carries a user-data-unregistered SEI (TIMESTAMP_SEI_UUID) with its
+output frame number, the wall-clock time the worker demuxed its source frame and the time the encoder emitted it.
+The SEI survives MPEG-TS, FLV and MP4 remuxing, so a reader at any hop (scripts/analyze_latency.py) can measure the
+delay up to that hop as well as the worker's own processing time.
 """
 
 import logging
+import struct
+import time
+import uuid
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
 from fractions import Fraction
 
 import av
 
-from config.settings import get_settings
+from config.settings import EncodingSettings, get_settings
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +26,12 @@ def create_video_encoder(
     width: int | None = None,
     height: int | None = None,
     fps: int | None = None,
+    settings: EncodingSettings | None = None,
+    bitrate_k: int | None = None,
 ) -> av.CodecContext:
-    """Create H.264 encoder with CBR, GOP 2s, high/4.1, zerolatency."""
-    enc = get_settings().encoding
+    """Create H.264 encoder with CBR, GOP 2s, high/4.1, zerolatency (settings default to ENCODING__*; bitrate_k
+    overrides cbr_bitrate_k, e.g. the adaptive bitrate's current step)."""
+    enc = settings or get_settings().encoding
     w = width if width is not None else enc.default_width
     h = height if height is not None else enc.default_height
     f = fps if fps is not None else enc.fps
@@ -28,7 +40,7 @@ def create_video_encoder(
     codec.height = h
     codec.pix_fmt = "yuv420p"
     codec.time_base = Fraction(1, f)
-    codec.bit_rate = enc.cbr_bitrate_k * 1000
+    codec.bit_rate = (bitrate_k if bitrate_k is not None else enc.cbr_bitrate_k) * 1000
     codec.gop_size = enc.gop_frames
     codec.options = {
         "profile": enc.profile,
@@ -39,13 +51,128 @@ def create_video_encoder(
     return codec
 
 
-def encode_frame(encoder: av.CodecContext, frame: av.VideoFrame) -> list[av.Packet]:
+TIMESTAMP_SEI_UUID = uuid.UUID("6b1c3f0e-8d5a-4e7b-9c2f-d0a7e1b45c93").bytes
+_TIMESTAMP = struct.Struct(">Qdd")  # frame number, ingest time, encode time
+_SEI_USER_DATA_UNREGISTERED = 5
+_NAL_SEI = 6
+_MAX_PENDING_INGEST = 256  # frames the encoder may hold back (lookahead) before their ingest times are forgotten
+
+
+@dataclass(frozen=True)
+class FrameTimestamp:
+    """Timing carried by a frame's SEI: output frame number and wall-clock seconds (time.time())."""
+
+    frame: int
+    ingest_time: float  # the worker demuxed the source frame
+    encode_time: float  # the encoder emitted the packet
+
+    @property
+    def processing_seconds(self) -> float:
+        return self.encode_time - self.ingest_time
+
+
+def _escape(rbsp: bytes) -> bytes:
+    """Insert emulation prevention bytes (00 00 0x -> 00 00 03 0x for x <= 3)."""
+    out = bytearray()
+    zeros = 0
+    for byte in rbsp:
+        if zeros >= 2 and byte <= 3:
+            out.append(3)
+            zeros = 0
+        out.append(byte)
+        zeros = zeros + 1 if byte == 0 else 0
+    return bytes(out)
+
+
+def _unescape(ebsp: bytes) -> bytes:
+    out = bytearray()
+    zeros = 0
+    for byte in ebsp:
+        if zeros >= 2 and byte == 3:
+            zeros = 0
+            continue
+        out.append(byte)
+        zeros = zeros + 1 if byte == 0 else 0
+    return bytes(out)
+
+
+def timestamp_sei(stamp: FrameTimestamp) -> bytes:
+    """Annex B SEI NAL unit (user data unregistered) carrying stamp."""
+    payload = TIMESTAMP_SEI_UUID + _TIMESTAMP.pack(stamp.frame, stamp.ingest_time, stamp.encode_time)
+    rbsp = bytes([_SEI_USER_DATA_UNREGISTERED, len(payload)]) + payload + b"\x80"
+    return b"\x00\x00\x00\x01" + bytes([_NAL_SEI]) + _escape(rbsp)
+
+
+def _nal_starts(data: bytes) -> Iterator[tuple[int, int]]:
+    """(start code offset, NAL type) of each NAL unit in Annex B data."""
+    index = data.find(b"\x00\x00\x01")
+    while index >= 0 and index + 3 < len(data):
+        start = index - 1 if index > 0 and data[index - 1] == 0 else index
+        yield start, data[index + 3] & 0x1F
+        index = data.find(b"\x00\x00\x01", index + 3)
+
+
+def add_timestamp_sei(packet: av.Packet, stamp: FrameTimestamp) -> av.Packet:
+    """Copy of packet (Annex B) with the timestamp SEI inserted before its first slice, as H.264 requires."""
+    data = bytes(packet)
+    at = next((start for start, nal_type in _nal_starts(data) if 1 <= nal_type <= 5), 0)
+    out = av.Packet(data[:at] + timestamp_sei(stamp) + data[at:])
+    out.pts = packet.pts
+    out.dts = packet.dts
+    out.duration = packet.duration
+    if packet.time_base is not None:
+        out.time_base = packet.time_base
+    out.is_keyframe = packet.is_keyframe
+    return out
+
+
+def read_timestamp_sei(data: bytes) -> FrameTimestamp | None:
+    """The timestamp SEI in an encoded frame (Annex B or length-prefixed, e.g. after FLV/MP4 remuxing), if any."""
+    index = data.find(TIMESTAMP_SEI_UUID)
+    if index < 0:
+        return None
+    # the payload is short enough that at most one escape byte per 3 bytes follows the UUID
+    raw = _unescape(data[index + len(TIMESTAMP_SEI_UUID) : index + len(TIMESTAMP_SEI_UUID) + _TIMESTAMP.size * 3 // 2])
+    if len(raw) < _TIMESTAMP.size:
+        return None
+    return FrameTimestamp(*_TIMESTAMP.unpack_from(raw))
+
+
+class TimestampStamper:
+    """Adds the timestamp SEI to encoded packets; the ingest time of each frame is registered (by pts) before encoding."""
+
+    def __init__(self) -> None:
+        self._ingest: dict[int, float] = {}
+
+    def ingested(self, pts: int, wall_time: float) -> None:
+        self._ingest[pts] = wall_time
+        if len(self._ingest) > _MAX_PENDING_INGEST:
+            del self._ingest[next(iter(self._ingest))]
+
+    def stamp(self, packets: list[av.Packet]) -> list[av.Packet]:
+        now = time.time()
+        out = []
+        for packet in packets:
+            frame = packet.pts if packet.pts is not None else 0
+            out.append(add_timestamp_sei(packet, FrameTimestamp(frame, self._ingest.pop(frame, now), now)))
+        return out
+
+
+def encode_frame(
+    encoder: av.CodecContext,
+    frame: av.VideoFrame,
+    on_drop: Callable[[], None] | None = None,
+    stamper: TimestampStamper | None = None,
+) -> list[av.Packet]:
     """
-    Encode one frame. On capacity exceeded (e.g. encoder backlog), drop frame and log/alert.
-    Stream continues; no silent data loss (FR-009).
+    Encode one frame. On capacity exceeded (e.g. encoder backlog), drop frame and log/alert (on_drop counts it).
+    Stream continues; no silent data loss (FR-009). With a stamper each packet gets the timestamp SEI.
     """
     try:
-        return list(encoder.encode(frame))
+        packets = list(encoder.encode(frame))
+        return stamper.stamp(packets) if stamper is not None else packets
     except (MemoryError, BlockingIOError, BufferError) as e:
         logger.warning("Encode drop (capacity exceeded), stream continues: %s", e)
+        if on_drop is not None:
+            on_drop()
         return []
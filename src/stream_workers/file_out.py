@@ -0,0 +1,98 @@
+"""
+Headless output for offline renders and reproducible performance runs: the encoded stream is muxed into a local
+file (container chosen by extension: .flv, .mp4, .mkv, .ts) or discarded ("null"), with the AAC track when one is
+given, in the pipeline thread, so unlike the RTMP FanOut nothing is dropped when the writer is slow. RunSummary
+reports what a run achieved.
+"""
+
+import json
+import logging
+from dataclasses import asdict, dataclass
+
+import av
+
+from stream_workers.audio import AudioFormat
+
+logger = logging.getLogger(__name__)
+
+NULL_OUTPUT = "null"
+
+
+class FileOutput:
+    """Mux encoded H.264 packets (timestamps in the encoder time base) and, with audio, the AAC track's packets into
+    path, or count and discard them."""
+
+    def __init__(self, path: str, width: int, height: int, fps: int, audio: AudioFormat | None = None) -> None:
+        self.path = path
+        self.packets = 0
+        self.audio_packets = 0
+        self.bytes_written = 0
+        self._container: av.container.OutputContainer | None = None
+        self._stream: av.VideoStream | None = None
+        self._audio_stream: av.AudioStream | None = None
+        if path != NULL_OUTPUT:
+            self._container = av.open(path, "w")
+            self._stream = self._container.add_stream("h264", rate=fps)
+            self._stream.width = width
+            self._stream.height = height
+            self._stream.pix_fmt = "yuv420p"
+            if audio is not None:
+                self._audio_stream = self._container.add_stream("aac", rate=audio.sample_rate)
+                self._audio_stream.layout = audio.layout
+                if audio.extradata is not None:
+                    self._audio_stream.codec_context.extradata = audio.extradata
+
+    def write(self, packet: av.Packet) -> None:
+        self.packets += 1
+        self.bytes_written += packet.size
+        if self._container is not None:
+            packet.stream = self._stream
+            self._container.mux(packet)
+
+    def write_audio(self, packet: av.Packet) -> None:
+        self.audio_packets += 1
+        self.bytes_written += packet.size
+        if self._container is not None and self._audio_stream is not None:
+            packet.stream = self._audio_stream
+            self._container.mux(packet)
+
+    def close(self) -> None:
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+            logger.info("Wrote %d packets (%d bytes) to %s", self.packets, self.bytes_written, self.path)
+
+
+@dataclass(frozen=True)
+class RunSummary:
+    frames: int
+    output_seconds: float  # frames / encoder fps
+    wall_seconds: float
+    fps: float  # frames per wall-clock second
+    speed: float  # output seconds per wall-clock second (1.0 = real time)
+    cpu_seconds: float  # process CPU (user + system, all threads)
+    cpu_per_output_second: float
+    frames_dropped: int  # dropped by the encoder
+    packets_dropped: int  # dropped by RTMP outputs (a file output never drops)
+    bytes_written: int
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), indent=2)
+
+
+def summarize_run(
+    frames: int, fps: int, wall_seconds: float, cpu_seconds: float, frames_dropped: int, packets_dropped: int, bytes_written: int
+) -> RunSummary:
+    output_seconds = frames / fps if fps > 0 else 0.0
+    return RunSummary(
+        frames=frames,
+        output_seconds=round(output_seconds, 3),
+        wall_seconds=round(wall_seconds, 3),
+        fps=round(frames / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+        speed=round(output_seconds / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+        cpu_seconds=round(cpu_seconds, 3),
+        cpu_per_output_second=round(cpu_seconds / output_seconds, 3) if output_seconds > 0 else 0.0,
+        frames_dropped=frames_dropped,
+        packets_dropped=packets_dropped,
+        bytes_written=bytes_written,
+    )
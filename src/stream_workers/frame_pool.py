@@ -0,0 +1,110 @@
+"""
+Preallocated frames and zero-copy plane views for the worker hot loop.
+FramePool holds a few yuv420p VideoFrames at the encoder geometry: a decoded frame that needs an overlay is copied
+into one of them (the decoder keeps its own frames as references, so they are never written), and the slot is reused
+once the encoder has taken it. Planes are reached through PIL images that share the frame's buffer (plane_view), so
+copying and blending run in Pillow's C loops without building an RGB image or a new frame.
+YuvTile is an RGBA overlay tile converted once to Y, U, V planes plus full- and half-resolution alpha masks; blending
+it pastes each plane into the frame in place, replacing the per-frame yuv420p -> RGB -> yuv420p round trip.
+"""
+
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import av
+from PIL import Image
+
+POOL_FRAMES = 2  # one being filled while the encoder may still hold the previous one
+
+
+def plane_view(plane: av.video.plane.VideoPlane) -> Image.Image:
+    """Writable 8-bit PIL image over a frame plane's buffer (no copy: pasting into it writes the frame)."""
+    view = Image.frombuffer("L", (plane.width, plane.height), plane, "raw", "L", plane.line_size, 1)
+    view.readonly = 0  # frombuffer marks shared images read-only so writes would copy; these must land in the plane
+    return view
+
+
+class FramePool:
+    """Rotating yuv420p frames at a fixed geometry, each with cached plane views."""
+
+    def __init__(self, width: int, height: int, size: int = POOL_FRAMES) -> None:
+        self.width = width
+        self.height = height
+        self._frames = [av.VideoFrame(width, height, "yuv420p") for _ in range(size)]
+        self._views: list[tuple[int, list[Image.Image]] | None] = [None] * size
+        self._next = 0
+
+    def acquire(self) -> tuple[av.VideoFrame, list[Image.Image]]:
+        """Next frame of the pool (writable) and views of its planes."""
+        index = self._next
+        self._next = (index + 1) % len(self._frames)
+        frame = self._frames[index]
+        frame.make_writable()  # no-op unless an encoder still references the buffer: then it gets a fresh one
+        cached = self._views[index]
+        if cached is None or cached[0] != frame.planes[0].buffer_ptr:
+            cached = (frame.planes[0].buffer_ptr, [plane_view(plane) for plane in frame.planes])
+            self._views[index] = cached
+        return frame, cached[1]
+
+    def detach(self, frame: av.VideoFrame) -> None:
+        """Give up frame (if it is one of the pool's) to a holder that reads it later; a fresh frame takes its slot."""
+        for index, pooled in enumerate(self._frames):
+            if pooled is frame:
+                self._frames[index] = av.VideoFrame(self.width, self.height, "yuv420p")
+                self._views[index] = None
+
+    def copy(self, frame: av.VideoFrame) -> tuple[av.VideoFrame, list[Image.Image]]:
+        """A pooled copy of frame (yuv420p at the pool geometry) with its timestamps, plus its plane views."""
+        out, views = self.acquire()
+        for src, dst, view in zip(frame.planes, out.planes, views, strict=True):
+            if src.line_size == dst.line_size:
+                dst.update(src)
+            else:
+                view.paste(plane_view(src), (0, 0))
+        out.pts = frame.pts
+        if frame.time_base is not None:
+            out.time_base = frame.time_base
+        return out, views
+
+
+@dataclass(frozen=True)
+class YuvTile:
+    """Overlay tile as yuv420p planes (the encoder's conversion) with alpha at luma and chroma resolution."""
+
+    planes: tuple[Image.Image, Image.Image, Image.Image]
+    alpha: tuple[Image.Image, Image.Image]
+
+    @classmethod
+    def from_image(cls, tile: Image.Image) -> "YuvTile":
+        width, height = tile.width + tile.width % 2, tile.height + tile.height % 2
+        padded = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        padded.paste(tile, (0, 0))
+        yuv = av.VideoFrame.from_image(padded.convert("RGB")).reformat(format="yuv420p")
+        planes = tuple(plane_view(plane).copy() for plane in yuv.planes)
+        alpha = padded.getchannel("A")
+        chroma_alpha = alpha.resize((width // 2, height // 2), Image.Resampling.BOX)
+        return cls((planes[0], planes[1], planes[2]), (alpha, chroma_alpha))
+
+    def blend(self, views: list[Image.Image]) -> None:
+        """Alpha-paste the tile at the top-left corner of the frame whose plane views are given (in place)."""
+        for view, plane, alpha in zip(views, self.planes, (self.alpha[0], self.alpha[1], self.alpha[1]), strict=True):
+            view.paste(plane, (0, 0), alpha)
+
+
+class YuvTileCache:
+    """YuvTile of the latest overlay version; render() only runs when the version changes."""
+
+    def __init__(self) -> None:
+        self.version: int | None = None
+        self.tile: YuvTile | None = None
+
+    def get(self, version: int, render: Callable[[], Image.Image | None]) -> YuvTile | None:
+        if version != self.version:
+            image = render()
+            self.tile = YuvTile.from_image(image) if image is not None else None
+            self.version = version
+        return self.tile
+
+    def put(self, version: int, tile: YuvTile | None) -> None:
+        self.version = version
+        self.tile = tile
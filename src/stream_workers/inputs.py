@@ -0,0 +1,278 @@
+"""
+Inputs with hot standby: every source URL (primary first, then backups) has a reader thread that keeps it open.
+The active source demuxes and decodes into a small queue the pipeline consumes. Standbys only demux, paced to their
+timestamps, and keep the packets since their last keyframe, so switching to one decodes that GOP and hands over its
+newest frame at once instead of reconnecting. InputSwitcher fails over when the active source delivers nothing for
+stall_timeout and fails back to a higher-priority source once that has been healthy for failback_seconds.
+Reader threads reopen with jittered exponential backoff and reuse the StreamParams of their last successful open
+(see demux.open_source); every open's time to first frame is exported per input. File inputs loop in place
+(demux.iter_looping_packets): no reopen, no gap and no timestamp reset at the wrap.
+The active source also demuxes its audio stream; the packets ride along with the next decoded frame (DecodedFrame.audio),
+so the pipeline can place them against that frame (stream_workers.audio).
+"""
+
+import logging
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+import av
+
+from config.settings import WorkerSettings
+from stream_workers import demux, metrics
+from stream_workers.audio import AudioFormat, audio_format
+from stream_workers.urls import mask_url
+
+logger = logging.getLogger(__name__)
+
+QUEUE_FRAMES = 2  # decoded frames buffered ahead of the pipeline (bounds the latency the hand-off adds)
+MAX_PACE_SLEEP_SECONDS = 1.0
+
+
+@dataclass(frozen=True)
+class DecodedFrame:
+    frame: av.VideoFrame
+    demuxed_at: float  # perf_counter() when its packet was demuxed
+    demux_seconds: float
+    decode_seconds: float
+    audio: tuple[av.Packet, ...] = ()  # source audio demuxed since the previous frame
+    audio_format: AudioFormat | None = None  # None: the source has no audio
+
+
+class InputSource:
+    """One input URL kept open by a reader thread; decodes only while active (see module docstring)."""
+
+    def __init__(self, stream: str, url: str, index: int, settings: WorkerSettings) -> None:
+        self.url = url
+        self.index = index
+        self.label = mask_url(url)
+        self.settings = settings
+        self.stall_timeout = settings.input_stall_timeout_seconds
+        self.frames: queue.Queue[DecodedFrame] = queue.Queue(maxsize=QUEUE_FRAMES)
+        self.active = False
+        self.connected = False
+        self.last_packet_at = 0.0
+        self.healthy_since: float | None = None
+        self._gop: list[av.Packet] = []
+        self._params: demux.StreamParams | None = None
+        self._opened_at: float | None = None  # perf_counter() of the open whose first frame is pending
+        self._first_frame_seconds = {
+            probe: metrics.INPUT_FIRST_FRAME_SECONDS.labels(stream, self.label, probe) for probe in ("full", "cached")
+        }
+        self._probe = "full"
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"input-{index}", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    @property
+    def thread_id(self) -> int | None:
+        return self._thread.ident if self._thread.is_alive() else None
+
+    def close(self) -> None:
+        self._closed.set()
+        self._thread.join(timeout=2.0)
+
+    def healthy(self, now: float) -> bool:
+        """Connected, delivering packets, and (as a standby) holding a keyframe to start from."""
+        return self.connected and now - self.last_packet_at <= self.stall_timeout and (self.active or bool(self._gop))
+
+    def _run(self) -> None:
+        backoff = self.settings.source_retry_interval_seconds
+        while not self._closed.is_set():
+            started = time.perf_counter()
+            try:
+                container, self._params, cached = demux.open_source(self.url, self.settings, self._params)
+            except Exception as e:
+                backoff = self._retry_later(e, backoff)
+                continue
+            self._opened_at, self._probe = started, "cached" if cached else "full"
+            try:
+                self._read(container)
+            except Exception as e:
+                if self._opened_at is None:  # delivered frames before failing: start over at the initial delay
+                    backoff = self.settings.source_retry_interval_seconds
+                backoff = self._retry_later(e, backoff)
+            else:
+                backoff = self.settings.source_retry_interval_seconds
+                self._closed.wait(0.1)  # end of a live input: reopen
+            finally:
+                self.connected = False
+                self.healthy_since = None
+                self._gop.clear()
+                demux.close_input(container)
+
+    def _retry_later(self, error: Exception, backoff: float) -> float:
+        """Wait backoff (±20% jitter); returns the next, doubled backoff (capped at source_retry_max_seconds)."""
+        wait = backoff * random.uniform(0.8, 1.2)
+        logger.warning("Input %s: %s (retry in %.1fs)", self.label, error, wait)
+        self._closed.wait(wait)
+        return min(self.settings.source_retry_max_seconds, backoff * 2)
+
+    def _first_frame(self) -> None:
+        """Record open -> first frame (decoded when active, keyframe buffered as standby) once per open."""
+        if self._opened_at is not None:
+            seconds = time.perf_counter() - self._opened_at
+            self._opened_at = None
+            self._first_frame_seconds[self._probe].observe(seconds)
+            logger.debug("Input %s: first frame %.3fs after open (%s probe)", self.label, seconds, self._probe)
+
+    def _read(self, container: av.container.InputContainer) -> None:
+        stream = demux.get_video_stream(container)
+        if stream is None:
+            raise ValueError("No video stream")
+        audio_stream = demux.get_audio_stream(container) if self.settings.source_audio else None
+        fmt = audio_format(audio_stream)
+        streams = [stream] if fmt is None or audio_stream is None else [stream, audio_stream]
+        self.connected = True
+        decoding = False
+        audio: list[av.Packet] = []
+        anchor: tuple[float, float] | None = None  # (monotonic, pts seconds) for standby pacing
+        if demux.is_network_url(self.url):
+            packets = demux.iter_packets(container, *streams)
+        else:
+            packets = demux.iter_looping_packets(container, *streams)
+        while not self._closed.is_set():
+            demux_started = time.perf_counter()
+            packet = next(packets, None)
+            if packet is None:
+                return
+            if packet.stream.type == "audio":
+                if decoding and self.active and packet.size:
+                    audio.append(packet)
+                continue
+            demuxed_at = time.perf_counter()
+            now = time.monotonic()
+            if self.healthy_since is None or now - self.last_packet_at > self.stall_timeout:
+                self.healthy_since = now
+            self.last_packet_at = now
+            if not self.active:
+                decoding = False
+                audio.clear()
+                anchor = self._buffer_standby(packet, anchor)
+                continue
+            if not decoding:
+                # Just activated: start from the buffered GOP and hand over only its newest frame
+                self._drain()
+                if packet.is_keyframe:
+                    self._gop.clear()
+                if packet.size:
+                    self._gop.append(packet)
+                if not self._gop or not self._gop[0].is_keyframe:
+                    self._gop.clear()
+                    continue
+                stream.codec_context.flush_buffers()
+                gop, self._gop = self._gop, []
+                frames = [f for p in gop for f in p.decode() if isinstance(f, av.VideoFrame)][-1:]
+                decoding = True
+            else:
+                frames = [f for f in packet.decode() if isinstance(f, av.VideoFrame)]
+            decode_seconds = time.perf_counter() - demuxed_at
+            if frames:
+                self._first_frame()
+            for frame in frames:
+                self._put(DecodedFrame(frame, demuxed_at, demuxed_at - demux_started, decode_seconds, tuple(audio), fmt))
+                audio.clear()
+
+    def _buffer_standby(self, packet: av.Packet, anchor: tuple[float, float] | None) -> tuple[float, float] | None:
+        """Keep the packets since the last keyframe; pace to packet timestamps so a standby file plays in real time."""
+        if not packet.size:
+            return anchor
+        if packet.is_keyframe:
+            self._gop.clear()
+        if self._gop or packet.is_keyframe:
+            self._gop.append(packet)
+            self._first_frame()
+        if packet.pts is None or packet.time_base is None:
+            return anchor
+        pts = float(packet.pts * packet.time_base)
+        now = time.monotonic()
+        if anchor is None or not 0 <= pts - anchor[1] <= now - anchor[0] + MAX_PACE_SLEEP_SECONDS:
+            return (now, pts)
+        delay = anchor[0] + (pts - anchor[1]) - now
+        if delay > 0:
+            self._closed.wait(delay)
+        return anchor
+
+    def _put(self, item: DecodedFrame) -> None:
+        while self.active and not self._closed.is_set():
+            try:
+                self.frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                return
+
+
+class InputSwitcher:
+    """Primary plus backup inputs for one pipeline; next_frame() returns frames from the active one."""
+
+    def __init__(self, name: str, urls: list[str], settings: WorkerSettings) -> None:
+        self.name = name
+        self.stall_timeout = settings.input_stall_timeout_seconds
+        self.failback_seconds = settings.input_failback_seconds
+        self.sources = [InputSource(name, url, i, settings) for i, url in enumerate(dict.fromkeys(urls))]
+        self.active = self.sources[0]
+        self.active.active = True
+        self._waiting_logged = False
+
+    def start(self) -> None:
+        for source in self.sources:
+            source.start()
+
+    def close(self) -> None:
+        for source in self.sources:
+            source.close()
+
+    def thread_ids(self) -> set[int]:
+        """Ids of the running reader threads (one per input)."""
+        return {ident for ident in (source.thread_id for source in self.sources) if ident is not None}
+
+    def next_frame(self) -> DecodedFrame | None:
+        """The active source's next frame; None after stall_timeout without one (failing over if a standby is healthy)."""
+        if self.active.index > 0:
+            self._failback(time.monotonic())
+        try:
+            item = self.active.frames.get(timeout=self.stall_timeout)
+        except queue.Empty:
+            self._failover(time.monotonic())
+            return None
+        self._waiting_logged = False
+        return item
+
+    def switch(self, source: InputSource, reason: str) -> None:
+        logger.warning("[%s] Input %s: %s -> %s", self.name, reason, self.active.label, source.label)
+        self.active.active = False
+        source.active = True
+        self.active = source
+        metrics.INPUT_SWITCHES.labels(self.name, reason).inc()
+
+    def _failover(self, now: float) -> None:
+        standby = next((s for s in self.sources if s is not self.active and s.healthy(now)), None)
+        if standby is not None:
+            self.switch(standby, "failover")
+        elif not self._waiting_logged:
+            logger.warning("[%s] Input %s stalled and no standby is healthy; waiting", self.name, self.active.label)
+            self._waiting_logged = True
+
+    def _failback(self, now: float) -> None:
+        for source in self.sources[: self.active.index]:
+            if source.healthy(now) and source.healthy_since is not None and now - source.healthy_since >= self.failback_seconds:
+                self.switch(source, "failback")
+                return
+
+    def export_metrics(self) -> None:
+        now = time.monotonic()
+        for source in self.sources:
+            metrics.INPUT_UP.labels(self.name, source.label).set(1.0 if source.healthy(now) else 0.0)
+            metrics.INPUT_ACTIVE.labels(self.name, source.label).set(1.0 if source is self.active else 0.0)
+            metrics.INPUT_QUEUE_FRAMES.labels(self.name, source.label).set(source.frames.qsize())
@@ -0,0 +1,331 @@
+"""
+Minimal in-process metrics (counters, gauges, histograms) rendered in Prometheus text format.
+Hot-path updates are a few integer/float adds under the metric's lock: uncontended on the frame path, where each
+child is updated by the thread that owns the stage, and what keeps counts exact when the overlay API's request threads
+share children. Per-frame instrumentation costs microseconds. collect() returns picklable MetricFamily snapshots, which lets the
+multi-stream supervisor merge families collected in pipeline processes into one /metrics response; dumps()/loads()
+and aggregate() let processes that share nothing but a directory (the overlay API's gunicorn workers) do the same.
+"""
+
+import bisect
+import json
+import math
+import threading
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import dataclass
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+@dataclass(frozen=True)
+class Sample:
+    suffix: str  # "", "_bucket", "_sum", "_count"
+    labels: Labels
+    value: float
+
+
+@dataclass(frozen=True)
+class MetricFamily:
+    name: str
+    kind: str  # counter, gauge, histogram
+    help: str
+    samples: tuple[Sample, ...]
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock: threading.Lock) -> None:
+        self.value = 0.0
+        self._lock = lock
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock: threading.Lock) -> None:
+        self.value = 0.0
+        self._lock = lock
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: tuple[float, ...], lock: threading.Lock) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = lock
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Registry:
+    """Holds metrics and collector callbacks (run before every collect, e.g. to refresh gauges from stats)."""
+
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric") -> None:
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"metric {metric.name} already registered")
+            self._metrics.append(metric)
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], None]) -> None:
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def collect(self) -> list[MetricFamily]:
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for collector in collectors:
+            collector()
+        return [m.collect() for m in metrics]
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Registry | None = REGISTRY) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _new_child(self) -> object:
+        raise NotImplementedError
+
+    def _child(self, values: tuple[str, ...]) -> object:
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def remove(self, *values: str) -> None:
+        with self._lock:
+            self._children.pop(tuple(values), None)
+
+    def _labels(self, values: tuple[str, ...]) -> Labels:
+        return tuple(zip(self.labelnames, values, strict=True))
+
+    def _samples(self, labels: Labels, child: object) -> list[Sample]:
+        raise NotImplementedError
+
+    def collect(self) -> MetricFamily:
+        samples: list[Sample] = []
+        with self._lock:  # children update under this lock too, so each histogram's buckets, sum and count agree
+            for values, child in self._children.items():
+                samples.extend(self._samples(self._labels(values), child))
+        return MetricFamily(self.name, self.kind, self.help, tuple(samples))
+
+
+class Counter(_Metric):
+    """Monotonic total; by convention the name ends in _total."""
+
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild(self._lock)
+
+    def labels(self, *values: str) -> _CounterChild:
+        return self._child(values)  # type: ignore[return-value]
+
+    def _samples(self, labels: Labels, child: object) -> list[Sample]:
+        assert isinstance(child, _CounterChild)
+        return [Sample("", labels, child.value)]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild(self._lock)
+
+    def labels(self, *values: str) -> _GaugeChild:
+        return self._child(values)  # type: ignore[return-value]
+
+    def _samples(self, labels: Labels, child: object) -> list[Sample]:
+        assert isinstance(child, _GaugeChild)
+        return [Sample("", labels, child.value)]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        registry: Registry | None = REGISTRY,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets, self._lock)
+
+    def labels(self, *values: str) -> _HistogramChild:
+        return self._child(values)  # type: ignore[return-value]
+
+    def _samples(self, labels: Labels, child: object) -> list[Sample]:
+        assert isinstance(child, _HistogramChild)
+        counts = list(child.counts)
+        samples = []
+        cumulative = 0
+        for bound, n in zip((*self.buckets, math.inf), counts, strict=True):
+            cumulative += n
+            samples.append(Sample("_bucket", (*labels, ("le", _format_value(bound))), cumulative))
+        samples.append(Sample("_sum", labels, child.sum))
+        samples.append(Sample("_count", labels, cumulative))
+        return samples
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def aggregate(families: Iterable[MetricFamily]) -> list[MetricFamily]:
+    """Merge families with the same name and sum samples with the same suffix and labels (e.g. one dump per process).
+    Gauges are summed too, so only use it for gauges where the total across processes is meaningful."""
+    merged: dict[str, tuple[MetricFamily, dict[tuple[str, Labels], float]]] = {}
+    for family in families:
+        entry = merged.setdefault(family.name, (family, {}))
+        values = entry[1]
+        for sample in family.samples:
+            key = (sample.suffix, sample.labels)
+            values[key] = values.get(key, 0.0) + sample.value
+    return [
+        MetricFamily(
+            family.name, family.kind, family.help, tuple(Sample(suffix, labels, value) for (suffix, labels), value in values.items())
+        )
+        for family, values in merged.values()
+    ]
+
+
+def dumps(families: Iterable[MetricFamily]) -> str:
+    """JSON form of families (for passing through files)."""
+    return json.dumps([[f.name, f.kind, f.help, [[s.suffix, [list(kv) for kv in s.labels], s.value] for s in f.samples]] for f in families])
+
+
+def loads(data: str) -> list[MetricFamily]:
+    """Inverse of dumps()."""
+    return [
+        MetricFamily(
+            name,
+            kind,
+            help,
+            tuple(Sample(suffix, tuple((str(k), str(v)) for k, v in labels), float(value)) for suffix, labels, value in samples),
+        )
+        for name, kind, help, samples in json.loads(data)
+    ]
+
+
+def render(families: Iterable[MetricFamily]) -> str:
+    """Prometheus text exposition (0.0.4). Families with the same name (e.g. from several processes) are merged into one
+    series per suffix and labels: counter and histogram samples are summed, for gauges the last family reporting wins."""
+    merged: dict[str, tuple[MetricFamily, dict[tuple[str, Labels], float]]] = {}
+    for family in families:
+        entry = merged.setdefault(family.name, (family, {}))
+        values = entry[1]
+        for sample in family.samples:
+            key = (sample.suffix, sample.labels)
+            values[key] = sample.value if family.kind == "gauge" else values.get(key, 0.0) + sample.value
+    lines: list[str] = []
+    for name, (family, values) in merged.items():
+        lines.append(f"# HELP {name} {family.help}")
+        lines.append(f"# TYPE {name} {family.kind}")
+        for (suffix, labels), value in values.items():
+            text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+            lines.append(f"{name}{suffix}{{{text}}} {_format_value(value)}" if text else f"{name}{suffix} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Stream worker metrics (label "stream" is the pipeline name; one process may run one or several pipelines)
+STAGE_SECONDS = Histogram(
+    "worker_stage_seconds", "Time spent per frame-path stage (demux, decode, scale, overlay, encode, write).", ("stream", "stage")
+)
+FRAME_LATENCY_SECONDS = Histogram(
+    "worker_frame_latency_seconds", "Demux of the source packet to encoded output handed to the outputs.", ("stream",)
+)
+FRAMES = Counter("worker_frames_total", "Frames encoded.", ("stream",))
+FRAMES_DROPPED = Counter("worker_frames_dropped_total", "Frames dropped before output.", ("stream", "reason"))
+FPS = Gauge("worker_fps", "Frames encoded per second (last second).", ("stream",))
+ENCODER_BITRATE_KBPS = Gauge("worker_encoder_bitrate_kbps", "Video bitrate the encoder targets (adaptive bitrate steps).", ("stream",))
+BITRATE_CHANGES = Counter("worker_bitrate_changes_total", "Adaptive bitrate steps by direction (down, up).", ("stream", "direction"))
+OUTPUT_CONNECTED = Gauge("worker_output_connected", "1 when the destination is connected.", ("stream", "destination"))
+OUTPUT_BACKLOG_BYTES = Gauge("worker_output_backlog_bytes", "Bytes queued for the destination.", ("stream", "destination"))
+OUTPUT_BACKLOG_PACKETS = Gauge("worker_output_backlog_packets", "Packets queued for the destination.", ("stream", "destination"))
+OUTPUT_LAG_SECONDS = Gauge("worker_output_lag_seconds", "Age of the oldest queued packet.", ("stream", "destination"))
+OUTPUT_BYTES = Counter("worker_output_bytes_total", "Bytes written to the destination.", ("stream", "destination"))
+OUTPUT_PACKETS_DROPPED = Counter("worker_output_packets_dropped_total", "Packets dropped for the destination.", ("stream", "destination"))
+OUTPUT_RECONNECTS = Counter("worker_output_reconnects_total", "Destination reconnects.", ("stream", "destination"))
+OUTPUT_WRITE_SECONDS = Histogram("worker_output_write_seconds", "Time per packet write to the destination.", ("stream", "destination"))
+INPUT_UP = Gauge("worker_input_up", "1 while the input delivers packets (primary and standbys).", ("stream", "input"))
+INPUT_QUEUE_FRAMES = Gauge("worker_input_queue_frames", "Decoded frames queued for the pipeline by the input.", ("stream", "input"))
+INPUT_ACTIVE = Gauge("worker_input_active", "1 for the input currently feeding the stream.", ("stream", "input"))
+INPUT_SWITCHES = Counter("worker_input_switches_total", "Input switches by reason (failover, failback).", ("stream", "reason"))
+INPUT_FIRST_FRAME_SECONDS = Histogram(
+    "worker_input_first_frame_seconds",
+    "Input open (or reconnect) to its first frame, by probe (full, or cached stream parameters).",
+    ("stream", "input", "probe"),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+AUDIO_PACKETS = Counter(
+    "worker_audio_packets_total",
+    "Output audio packets by path (passthrough, transcoded, silence); dropped counts source packets dropped to keep A/V sync.",
+    ("stream", "path"),
+)
+OVERLAY_REFRESH_SECONDS = Histogram("worker_overlay_refresh_seconds", "Overlay snapshot read from the DB.")
+OVERLAY_DB_FAILURES = Counter("worker_overlay_db_failures_total", "Overlay snapshot reads that failed.")
+PIPELINE_UP = Gauge("worker_pipeline_up", "1 while the stream's pipeline process is running (supervisor).", ("stream",))
+PIPELINE_RESTARTS = Counter("worker_pipeline_restarts_total", "Pipeline process restarts (supervisor).", ("stream",))
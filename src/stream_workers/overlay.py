@@ -11,17 +11,42 @@ from PIL import Image, ImageDraw, ImageFont
 logger = logging.getLogger(__name__)
 
 
+OVERLAY_PROFILES = ("full", "alerts", "none")
+
+
 # In-memory stub: list of {position, identifier, amount}; list of {message}; optional payment_link {url, label}
-class _OverlayState:
-    __slots__ = ("ranking", "alerts", "payment_link")
+class OverlayState:
+    """Overlay data for one pipeline; each pipeline owns its own instance."""
+
+    __slots__ = ("ranking", "alerts", "payment_link", "version")
 
     def __init__(self) -> None:
         self.ranking: list[dict[str, Any]] = []
         self.alerts: list[dict[str, Any]] = []
         self.payment_link: dict[str, Any] | None = None
+        self.version = 0  # bumped on every update so renderers can cache per version
+
+    def update(
+        self,
+        ranking: list[dict[str, Any]],
+        alerts: list[dict[str, Any]],
+        payment_link: dict[str, Any] | None = None,
+    ) -> None:
+        """Set current overlay data (stub or from DB). When DB unreachable, keep last known."""
+        if not ranking and alerts is None and payment_link is None:
+            return
+        if ranking:
+            self.ranking = ranking
+        if alerts is not None:
+            self.alerts = alerts
+        self.payment_link = payment_link
+        self.version += 1
 
+    def get(self) -> tuple[list[dict[str, Any]], list[dict[str, Any]], dict[str, Any] | None]:
+        return (self.ranking, self.alerts, self.payment_link)
 
-_overlay_state = _OverlayState()
+
+_overlay_state = OverlayState()
 
 
 def set_overlay_data(
@@ -29,45 +54,67 @@ def set_overlay_data(
     alerts: list[dict[str, Any]],
     payment_link: dict[str, Any] | None = None,
 ) -> None:
-    """Set current overlay data (stub or from DB). When DB unreachable, keep last known."""
-    if not ranking and alerts is None and payment_link is None:
-        return
-    if ranking:
-        _overlay_state.ranking = ranking
-    if alerts is not None:
-        _overlay_state.alerts = alerts
-    _overlay_state.payment_link = payment_link
+    """Set current overlay data (stub or from DB) on the default state. When DB unreachable, keep last known."""
+    _overlay_state.update(ranking, alerts, payment_link)
 
 
 def get_overlay_data() -> tuple[list[dict[str, Any]], list[dict[str, Any]], dict[str, Any] | None]:
     """Return (ranking, alerts, payment_link) for rendering. Uses last known if DB failed."""
-    return (_overlay_state.ranking, _overlay_state.alerts, _overlay_state.payment_link)
+    return _overlay_state.get()
+
+
+def get_overlay_version() -> int:
+    """Version of the default state, bumped by every set_overlay_data (cache renderings per version)."""
+    return _overlay_state.version
 
 
-def render_overlay_on_image(pil_image: Image.Image) -> Image.Image:
+def _overlay_lines(state: OverlayState, profile: str) -> list[tuple[str, tuple[int, int, int, int]]]:
+    """Text lines (top to bottom, 20 px apart) and their RGBA fill for the given profile."""
+    if profile == "none":
+        return []
+    ranking, alerts, payment_link = state.get()
+    if profile == "alerts":
+        ranking = []
+    lines: list[tuple[str, tuple[int, int, int, int]]] = []
+    for i, entry in enumerate(ranking[:10], 1):
+        lines.append((f"#{i} {entry.get('identifier', '')} {entry.get('amount', '')}", (255, 255, 255, 220)))
+    for a in alerts:
+        lines.append((a.get("message", ""), (255, 255, 0, 220)))
+    if payment_link:
+        lines.append((payment_link.get("label") or "Donate", (200, 255, 200, 220)))
+        url = payment_link.get("url") or ""
+        if url:
+            lines.append((url, (200, 255, 200, 200)))
+    return lines
+
+
+def render_overlay_layer(state: OverlayState | None = None, profile: str = "full") -> Image.Image | None:
+    """
+    Render ranking, alerts and payment link as a transparent RGBA tile anchored at the frame's top-left corner,
+    sized to the text. Returns None when there is nothing to draw. The tile is independent of the frame size,
+    so one rendering serves every stream with the same profile.
+    """
+    lines = _overlay_lines(state or _overlay_state, profile)
+    if not lines:
+        return None
+    font = ImageFont.load_default()
+    width = max(int(font.getbbox(text)[2]) for text, _ in lines) + 20
+    layer = Image.new("RGBA", (width, 10 + 20 * len(lines)), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer, "RGBA")
+    for i, (text, fill) in enumerate(lines):
+        draw.text((10, 10 + 20 * i), text, fill=fill, font=font)
+    return layer
+
+
+def render_overlay_on_image(pil_image: Image.Image, state: OverlayState | None = None, profile: str = "full") -> Image.Image:
     """
     Draw Top 10 ranking, PIX alerts, and payment link (when present) on the image.
     When payment_link is None, no payment link area is drawn (no placeholder).
+    profile "alerts" skips the ranking, "none" draws nothing; state defaults to the module-level state.
     """
-    ranking, alerts, payment_link = get_overlay_data()
-    if not ranking and not alerts and not payment_link:
+    layer = render_overlay_layer(state, profile)
+    if layer is None:
         return pil_image
     overlay = pil_image.copy()
-    draw = ImageDraw.Draw(overlay, "RGBA")
-    font = ImageFont.load_default()
-    y = 10
-    for i, entry in enumerate(ranking[:10], 1):
-        text = f"#{i} {entry.get('identifier', '')} {entry.get('amount', '')}"
-        draw.text((10, y), text, fill=(255, 255, 255, 220), font=font)
-        y += 20
-    for a in alerts:
-        draw.text((10, y), a.get("message", ""), fill=(255, 255, 0, 220), font=font)
-        y += 20
-    if payment_link:
-        label = payment_link.get("label") or "Donate"
-        url = payment_link.get("url") or ""
-        draw.text((10, y), label, fill=(200, 255, 200, 220), font=font)
-        y += 20
-        if url:
-            draw.text((10, y), url, fill=(200, 255, 200, 200), font=font)
+    overlay.paste(layer, (0, 0), layer)
     return overlay
@@ -0,0 +1,103 @@
+"""
+Overlay rendering in a separate process, so Pillow text drawing never holds the GIL of a frame loop.
+The renderer receives overlay snapshots (latest wins), renders one tile per profile and publishes it to an
+OverlaySegment; a completed publish (the segment version) is the readiness signal. Frame loops only blend the
+latest published tile and never wait for a render in progress.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from collections.abc import Iterable
+from multiprocessing.process import BaseProcess
+from typing import Any
+
+from stream_workers import overlay
+from stream_workers.overlay_shm import OverlaySegment
+
+logger = logging.getLogger(__name__)
+
+_CTX = multiprocessing.get_context("spawn")
+
+OverlaySnapshot = tuple[list[dict[str, Any]], list[dict[str, Any]], dict[str, Any] | None]
+
+
+def _render_main(segment_names: dict[str, str], snapshots: Any) -> None:
+    """Renderer process: render every received snapshot (skipping superseded ones) into each profile's segment."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    segments = {profile: OverlaySegment.attach(name) for profile, name in segment_names.items()}
+    state = overlay.OverlayState()
+    while True:
+        snapshot = snapshots.get()
+        while True:
+            try:
+                snapshot = snapshots.get_nowait()
+            except queue.Empty:
+                break
+        if snapshot is None:
+            return
+        state.update(*snapshot)
+        for profile, segment in segments.items():
+            segment.publish(overlay.render_overlay_layer(state, profile))
+
+
+class OverlayRenderer:
+    """Owns one OverlaySegment per profile and the process that renders into them."""
+
+    def __init__(self, profiles: Iterable[str], max_width: int, max_height: int) -> None:
+        self._segments = {
+            profile: OverlaySegment.create(f"overlay-{os.getpid()}-{profile}", max_width, max_height)
+            for profile in sorted(set(profiles) - {"none"})
+        }
+        self._queue: Any = _CTX.Queue()
+        self._process: BaseProcess | None = None
+        self._last: OverlaySnapshot | None = None
+        self._lock = threading.Lock()
+
+    def segment(self, profile: str) -> OverlaySegment | None:
+        """The segment pipelines with this profile blend from (None for profile "none")."""
+        return self._segments.get(profile)
+
+    def start(self) -> None:
+        names = {profile: segment.name for profile, segment in self._segments.items()}
+        self._process = _CTX.Process(target=_render_main, args=(names, self._queue), name="overlay-renderer", daemon=True)
+        self._process.start()
+
+    def ensure_running(self) -> None:
+        """Restart the renderer if it died and hand it the last snapshot again."""
+        with self._lock:
+            process = self._process
+            if process is None or process.exitcode is None:
+                return
+            logger.warning("Overlay renderer exited (code %s); restarting", process.exitcode)
+            process.close()
+            self._queue = _CTX.Queue()
+            self.start()
+            if self._last is not None:
+                self._offer(self._last)
+
+    def _offer(self, snapshot: OverlaySnapshot | None) -> None:
+        # Unbounded put never blocks; the renderer skips to the newest queued snapshot
+        self._queue.put_nowait(snapshot)
+
+    def submit(self, snapshot: OverlaySnapshot) -> None:
+        """Queue a snapshot for rendering; unchanged snapshots are ignored. Never blocks."""
+        with self._lock:
+            if snapshot == self._last:
+                return
+            self._last = snapshot
+            self._offer(snapshot)
+
+    def close(self, timeout: float = 5.0) -> None:
+        process = self._process
+        if process is not None and process.exitcode is None:
+            self._offer(None)
+            process.join(timeout)
+            if process.exitcode is None:
+                process.kill()
+                process.join()
+        for segment in self._segments.values():
+            segment.close()
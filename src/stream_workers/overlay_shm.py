@@ -0,0 +1,130 @@
+"""
+Shared-memory distribution of the rendered overlay tile: one process renders and publishes, pipelines in other
+processes map the segment and blend the tile straight from shared memory (no copy, no lock on the frame path).
+
+Layout: 64-byte header (magic, begin/end publish counters, per-buffer width/height) followed by two RGBA buffers.
+Publish n writes buffer n % 2 between begin = n and end = n (double-buffered seqlock). A reader uses buffer
+end % 2 and afterwards checks that no later publish started writing into that same buffer; otherwise it retries,
+and after READ_ATTEMPTS torn reads it raises TornRead so the caller keeps what it had instead of a mixed tile.
+"""
+
+import logging
+import struct
+from collections.abc import Callable
+from multiprocessing import shared_memory
+from typing import TypeVar
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MAGIC = b"OVLSHM01"
+HEADER_SIZE = 64
+_COUNTERS = struct.Struct("<QQ")  # begin, end at offset 8
+_DIMS = struct.Struct("<II")  # width, height per buffer at offset 24 + 8 * index
+READ_ATTEMPTS = 3
+
+
+class TornRead(RuntimeError):
+    """Every read attempt overlapped a publish into the buffer being read."""
+
+
+class OverlaySegment:
+    """One double-buffered RGBA tile of at most max_width x max_height pixels in a named shared-memory block."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool) -> None:
+        self._shm = shm
+        self._owner = owner
+        buf = shm.buf
+        if buf is None or bytes(buf[:8]) != MAGIC:
+            raise ValueError(f"shared memory {shm.name} is not an overlay segment")
+        self._buf: memoryview = buf
+        max_width, max_height = _DIMS.unpack_from(buf, 40)
+        self.max_width = int(max_width)
+        self.max_height = int(max_height)
+        self._capacity = self.max_width * self.max_height * 4
+
+    @classmethod
+    def create(cls, name: str, max_width: int, max_height: int) -> "OverlaySegment":
+        """Create (owner side) an empty segment."""
+        size = HEADER_SIZE + 2 * max_width * max_height * 4
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = bytearray(HEADER_SIZE)
+        header[:8] = MAGIC
+        _DIMS.pack_into(header, 40, max_width, max_height)
+        shm.buf[:HEADER_SIZE] = header  # type: ignore[index]
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "OverlaySegment":
+        """Map an existing segment (reader side)."""
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    @property
+    def name(self) -> str:
+        return str(self._shm.name)
+
+    def _buffer_offset(self, index: int) -> int:
+        return HEADER_SIZE + index * self._capacity
+
+    def publish(self, tile: Image.Image | None) -> int:
+        """Write tile (cropped to the segment's max size; None clears) into the idle buffer and flip. Returns version."""
+        buf = self._buf
+        end = int(_COUNTERS.unpack_from(buf, 8)[1])
+        version = end + 1
+        index = version % 2
+        _COUNTERS.pack_into(buf, 8, version, end)
+        width = height = 0
+        if tile is not None:
+            if tile.mode != "RGBA":
+                tile = tile.convert("RGBA")
+            if tile.width > self.max_width or tile.height > self.max_height:
+                logger.warning("Overlay tile %dx%d cropped to %dx%d", tile.width, tile.height, self.max_width, self.max_height)
+                tile = tile.crop((0, 0, min(tile.width, self.max_width), min(tile.height, self.max_height)))
+            width, height = tile.size
+            offset = self._buffer_offset(index)
+            buf[offset : offset + width * height * 4] = tile.tobytes()
+        _DIMS.pack_into(buf, 24 + 8 * index, width, height)
+        _COUNTERS.pack_into(buf, 8, version, version)
+        return version
+
+    @property
+    def version(self) -> int:
+        """Last completed publish (0 = never published)."""
+        return int(_COUNTERS.unpack_from(self._buf, 8)[1])
+
+    def read(self, consume: Callable[[Image.Image | None, int], T]) -> T:
+        """Call consume(tile, version) with a zero-copy view of the latest tile (None when empty) and return its result.
+        The view is only valid inside consume, and consume may run again when a publish overwrote the buffer meanwhile:
+        it should only copy or convert the tile, without side effects. Raises TornRead after READ_ATTEMPTS attempts."""
+        buf = self._buf
+        for _ in range(READ_ATTEMPTS):
+            end = _COUNTERS.unpack_from(buf, 8)[1]
+            index = end % 2
+            width, height = _DIMS.unpack_from(buf, 24 + 8 * index)
+            if end == 0 or width == 0 or height == 0:
+                return consume(None, end)
+            offset = self._buffer_offset(index)
+            view = buf[offset : offset + width * height * 4]
+            try:
+                tile = Image.frombuffer("RGBA", (width, height), view, "raw", "RGBA", 0, 1)  # type: ignore[arg-type]
+                result = consume(tile, end)
+                del tile
+            finally:
+                view.release()
+            begin = _COUNTERS.unpack_from(buf, 8)[0]
+            if begin <= end + 1:
+                return result
+        raise TornRead(f"overlay segment {self.name}: {READ_ATTEMPTS} reads overlapped a publish")
+
+    def close(self) -> None:
+        """Unmap; the owner also removes the segment."""
+        del self._buf
+        self._shm.close()
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
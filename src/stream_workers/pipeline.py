@@ -0,0 +1,420 @@
+"""
+One stream pipeline: demux → overlay → PTS/DTS rewrite → encode → MPEG-TS mux (with audio) → FanOut.
+Frames come from an InputSwitcher (stream_workers.inputs): the primary input plus hot-standby backups, switched
+without touching the encoder, the outputs or the PTS/DTS counters. The encoder is opened once, at the geometry of
+the first frame; frames from a source with another size or pixel format are rescaled to it, so reconnects, file
+loops and input switches never restart x264 (no forced IDR, no cold rate control) or the outputs. The one exception
+is ENCODING__ADAPTIVE_BITRATE (stream_workers.bitrate): when output backpressure calls for another bitrate, x264 is
+reopened at it on a GOP boundary, where the next frame was going to be an IDR anyway.
+All per-stream state (overlay data, timestamp counters, last frame, outputs) lives on the Pipeline instance,
+so several pipelines can run side by side (see stream_workers.supervisor). The overlay tile is either rendered
+locally once per OverlayState version or read from a shared OverlaySegment published by another process, and
+converted to yuv420p planes once per version (stream_workers.frame_pool): each frame is blended in place, on a pooled
+copy of the decoded frame or on the rescaler's output, so the hot loop allocates no RGB images or per-frame frames.
+Each stage (demux, decode, scale, overlay, encode, write) is timed into stream_workers.metrics, labelled by name,
+and into frame_timings, a ring buffer of the last frames dumped on demand (stream_workers.profiling). With
+ENCODING__TIMESTAMP_SEI the encoded frames also carry their ingest and encode times (stream_workers.encode).
+Every WORKER__PREVIEW_INTERVAL_SECONDS an encoded frame is handed (by reference) to a PreviewEncoder thread that
+makes the admin /preview image (stream_workers.preview).
+For headless runs the stream goes to a local file or null output instead (stream_workers.file_out), optionally
+paced to real time and stopped after max_frames / max_seconds of output.
+Source audio arrives with the frames and goes through an AudioTrack (stream_workers.audio): AAC is passed through,
+anything else transcoded, and silence fills in for sources without audio. Each frame's audio is placed against that
+frame's output time, so A/V sync survives loops and input switches like the video timestamps do.
+"""
+
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+
+import av
+from av.video.frame import PictureType
+from av.video.reformatter import Interpolation, VideoReformatter
+from PIL import Image
+
+from config.settings import EncodingSettings, get_settings
+from stream_workers import audio, encode, file_out, metrics, overlay, preview, pts_dts, rtmp_out
+from stream_workers.bitrate import AdaptiveBitrate
+from stream_workers.frame_pool import FramePool, YuvTile, YuvTileCache, plane_view
+from stream_workers.inputs import InputSwitcher
+from stream_workers.overlay_shm import OverlaySegment, TornRead
+from stream_workers.profiling import FrameTimings
+from stream_workers.ts_mux import TsMuxer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PipelineStats:
+    name: str
+    frames: int
+    fps: float
+    lag_seconds: float  # oldest unsent packet across outputs
+    outputs: int
+    outputs_connected: int
+
+
+class Pipeline:
+    """Run one input (failing over to backup_urls) until stop(); retry when every source is unavailable."""
+
+    def __init__(
+        self,
+        name: str,
+        input_url: str,
+        output_urls: list[str],
+        encoding: EncodingSettings | None = None,
+        overlay_state: overlay.OverlayState | None = None,
+        overlay_profile: str = "full",
+        encoder_threads: int = 0,
+        overlay_segment: OverlaySegment | None = None,
+        output_file: str = "",
+        realtime: bool = False,
+        max_frames: int = 0,
+        max_seconds: float = 0.0,
+        backup_urls: list[str] | None = None,
+    ) -> None:
+        if overlay_profile not in overlay.OVERLAY_PROFILES:
+            raise ValueError(f"unknown overlay profile {overlay_profile!r} (expected one of {overlay.OVERLAY_PROFILES})")
+        self.name = name
+        self.input_url = input_url
+        self.backup_urls = backup_urls or []
+        self.inputs: InputSwitcher | None = None
+        self.output_urls = output_urls
+        self.encoding = encoding or get_settings().encoding
+        self.overlay_state = overlay_state or overlay.OverlayState()
+        self.overlay_profile = overlay_profile
+        self.overlay_segment = overlay_segment
+        self.encoder_threads = encoder_threads
+        self._tiles = YuvTileCache()
+        self.frame_pool: FramePool | None = None
+        self.pts = pts_dts.PTSState()
+        self.last_frame: av.VideoFrame | None = None
+        self.fanout: rtmp_out.FanOut | None = None
+        self.ts_muxer: TsMuxer | None = None
+        self.audio_track: audio.AudioTrack | None = None
+        self.output_file = output_file
+        self.file_output: file_out.FileOutput | None = None
+        self.realtime = realtime
+        limits = [n for n in (max_frames, math.ceil(max_seconds * self.encoding.fps)) if n > 0]
+        self.frame_limit = min(limits, default=0)
+        self._pace_start: float | None = None
+        self.frames = 0
+        self._fps = 0.0
+        self._fps_window_start = time.monotonic()
+        self._fps_window_frames = 0
+        self._stop = threading.Event()
+        self._thread_id: int | None = None  # the thread in run()
+        self._stage = {
+            stage: metrics.STAGE_SECONDS.labels(name, stage) for stage in ("demux", "decode", "scale", "overlay", "encode", "write")
+        }
+        self._frame_latency = metrics.FRAME_LATENCY_SECONDS.labels(name)
+        self._frames_total = metrics.FRAMES.labels(name)
+        self._encode_drops = metrics.FRAMES_DROPPED.labels(name, "encode")
+        w = get_settings().worker
+        self.frame_timings = FrameTimings(w.frame_trace_size)
+        self.preview = (
+            preview.PreviewEncoder(w.preview_interval_seconds, w.preview_width, w.preview_format, w.preview_quality)
+            if w.preview_interval_seconds > 0
+            else None
+        )
+        self._scale_seconds = 0.0
+        self._overlay_seconds = 0.0
+        self._rescaler = VideoReformatter()
+        self._stamper = encode.TimestampStamper() if self.encoding.timestamp_sei else None
+        self.bitrate = AdaptiveBitrate.from_settings(self.encoding) if self.encoding.adaptive_bitrate and output_urls else None
+        self._gop_frames = 0  # frames encoded since the last keyframe
+        self._source_geometry: tuple[int, int, str] | None = None
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop.is_set()
+
+    def thread_ids(self) -> set[int]:
+        """Threads worth profiling while run() is active: the frame loop and the input readers."""
+        ids = {self._thread_id} if self._thread_id is not None else set()
+        if self.inputs is not None:
+            ids |= self.inputs.thread_ids()
+        return ids
+
+    @property
+    def frames_dropped(self) -> int:
+        return int(self._encode_drops.value)
+
+    def stats(self) -> PipelineStats:
+        outputs = self.fanout.stats() if self.fanout is not None else []
+        return PipelineStats(
+            name=self.name,
+            frames=self.frames,
+            fps=self._fps,
+            lag_seconds=max((o.lag_seconds for o in outputs), default=0.0),
+            outputs=len(outputs),
+            outputs_connected=sum(1 for o in outputs if o.connected),
+        )
+
+    def export_metrics(self) -> None:
+        """Registry collector: refresh the fps gauge and output metrics from current stats."""
+        metrics.FPS.labels(self.name).set(self._fps)
+        if self.bitrate is not None:
+            metrics.ENCODER_BITRATE_KBPS.labels(self.name).set(self.bitrate.bitrate_k)
+        if self.inputs is not None:
+            self.inputs.export_metrics()
+        if self.fanout is not None:
+            self.fanout.export_metrics()
+
+    def _blend(self, frame: av.VideoFrame, tile: YuvTile | None, writable: bool) -> av.VideoFrame:
+        """frame with tile pasted in place: on frame itself when writable (rescaled), else on a pooled copy."""
+        if tile is None:
+            return frame
+        started = time.perf_counter()
+        if writable or self.frame_pool is None:
+            out, views = frame, [plane_view(plane) for plane in frame.planes]
+        else:
+            out, views = self.frame_pool.copy(frame)
+        copied = time.perf_counter()
+        tile.blend(views)
+        # scale = copying the decoder's frame into the pool, overlay = the alpha paste itself
+        self._scale_seconds += copied - started
+        self._overlay_seconds += time.perf_counter() - copied
+        return out
+
+    def _fit(self, frame: av.VideoFrame, enc: av.CodecContext) -> av.VideoFrame:
+        """frame at the encoder's geometry and pixel format (rescaled when its source differs)."""
+        geometry = (frame.width, frame.height, frame.format.name)
+        if geometry != self._source_geometry:
+            self._source_geometry = geometry
+            if geometry != (enc.width, enc.height, enc.pix_fmt):
+                logger.info("[%s] Source is %dx%d %s; rescaling to %dx%d %s", self.name, *geometry, enc.width, enc.height, enc.pix_fmt)
+        if geometry == (enc.width, enc.height, enc.pix_fmt):
+            return frame
+        started = time.perf_counter()
+        out = self._rescaler.reformat(frame, width=enc.width, height=enc.height, format=enc.pix_fmt, interpolation=Interpolation.BILINEAR)
+        self._scale_seconds += time.perf_counter() - started
+        return out
+
+    def _segment_tile(self, segment: OverlaySegment) -> YuvTile | None:
+        """YuvTile of the segment's latest version. It is converted inside read (the only place the shared view is valid)
+        and cached only once the read passed its version check; a torn read keeps the previous tile."""
+        if segment.version == self._tiles.version:
+            return self._tiles.tile
+
+        def convert(image: Image.Image | None, version: int) -> tuple[int, YuvTile | None]:
+            return version, YuvTile.from_image(image) if image is not None else None
+
+        try:
+            version, tile = segment.read(convert)
+        except TornRead as e:
+            logger.debug("[%s] %s; keeping the previous overlay", self.name, e)
+            return self._tiles.tile
+        self._tiles.put(version, tile)
+        return tile
+
+    def _apply_overlay(self, frame: av.VideoFrame, writable: bool = False) -> av.VideoFrame:
+        """Overlay on frame; writable: frame is the pipeline's own (not the decoder's) and may be drawn on directly."""
+        if self.overlay_profile == "none":
+            return frame
+        if self.overlay_segment is not None:
+            return self._blend(frame, self._segment_tile(self.overlay_segment), writable)
+        state = self.overlay_state
+        tile = self._tiles.get(state.version, lambda: overlay.render_overlay_layer(state, self.overlay_profile))
+        return self._blend(frame, tile, writable)
+
+    def _count_frame(self) -> None:
+        self.frames += 1
+        self._fps_window_frames += 1
+        now = time.monotonic()
+        elapsed = now - self._fps_window_start
+        if elapsed >= 1.0:
+            self._fps = self._fps_window_frames / elapsed
+            self._fps_window_start = now
+            self._fps_window_frames = 0
+
+    def _pace(self) -> None:
+        """Realtime mode: hold frame N until N / fps seconds after the first frame."""
+        now = time.monotonic()
+        if self._pace_start is None:
+            self._pace_start = now
+        delay = self._pace_start + self.frames / self.encoding.fps - now
+        if delay > 0:
+            self._stop.wait(delay)
+
+    def _audio_packets(
+        self, frame: av.VideoFrame, out_pts: int, packets: tuple[av.Packet, ...], source: audio.AudioFormat | None
+    ) -> list[av.Packet]:
+        """The audio track's packets up to the end of output frame out_pts, with packets placed against frame."""
+        if self.audio_track is None:
+            return []
+        out_seconds = out_pts / self.encoding.fps
+        offset = None
+        if frame.pts is not None and frame.time_base is not None:
+            offset = out_seconds - float(frame.pts * frame.time_base)
+        return self.audio_track.feed(packets, source, offset, out_seconds + 1 / self.encoding.fps)
+
+    def _write(self, packets: list[av.Packet], audio_packets: list[av.Packet]) -> None:
+        if self.fanout is not None and self.ts_muxer is not None:
+            for pkt in packets:
+                for chunk in self.ts_muxer.mux_video(pkt):
+                    self.fanout.send(chunk)
+            for pkt in audio_packets:
+                for chunk in self.ts_muxer.mux_audio(pkt):
+                    self.fanout.send(chunk)
+        if self.file_output is not None:
+            for pkt in packets:
+                self.file_output.write(pkt)
+            for pkt in audio_packets:
+                self.file_output.write_audio(pkt)
+
+    def _process_frame(
+        self,
+        enc: av.CodecContext,
+        frame: av.VideoFrame,
+        demuxed_at: float,
+        demux_s: float,
+        decode_s: float,
+        audio_packets: tuple[av.Packet, ...] = (),
+        audio_format: audio.AudioFormat | None = None,
+    ) -> None:
+        if self.realtime:
+            self._pace()
+        self.last_frame = frame
+        self._scale_seconds = self._overlay_seconds = 0.0
+        fitted = self._fit(frame, enc)
+        out = self._apply_overlay(fitted, writable=fitted is not frame)
+        if self._scale_seconds:
+            self._stage["scale"].observe(self._scale_seconds)
+        if self._overlay_seconds:
+            self._stage["overlay"].observe(self._overlay_seconds)
+        self.pts.rewrite(out)
+        out.time_base = enc.time_base  # PTSState counts frames; without this the encoder rescales from the source time base
+        out.pict_type = PictureType.NONE  # a decoded I frame would force an IDR: keyframes follow the encoder's GOP only
+        pts = float(out.pts if out.pts is not None else -1)
+        started = time.perf_counter()
+        if self._stamper is not None:
+            self._stamper.ingested(int(pts), time.time() - (started - demuxed_at))
+        packets = encode.encode_frame(enc, out, on_drop=self._encode_drops.inc, stamper=self._stamper)
+        encoded = time.perf_counter()
+        if self.bitrate is not None:
+            self._gop_frames = 0 if any(p.is_keyframe for p in packets) else self._gop_frames + 1
+        self._stage["encode"].observe(encoded - started)
+        written = encoded
+        self._write(packets, self._audio_packets(frame, int(pts), audio_packets, audio_format))
+        if self.fanout is not None or self.file_output is not None:
+            written = time.perf_counter()
+            self._stage["write"].observe(written - encoded)
+        latency = time.perf_counter() - demuxed_at
+        self._frame_latency.observe(latency)
+        self.frame_timings.record(
+            time.time(),
+            pts,
+            demux_s,
+            decode_s,
+            self._scale_seconds,
+            self._overlay_seconds,
+            encoded - started,
+            written - encoded,
+            latency,
+        )
+        if self.preview is not None and self.preview.due():
+            if self.frame_pool is not None:
+                self.frame_pool.detach(out)  # the preview thread reads it later: the pool must not reuse it
+            self.preview.submit(out, self.frames)
+        self._frames_total.inc()
+        self._count_frame()
+        if self.frame_limit and self.frames >= self.frame_limit:
+            self.stop()
+
+    def _create_encoder(self, width: int, height: int) -> av.CodecContext:
+        bitrate_k = self.bitrate.bitrate_k if self.bitrate is not None else None
+        enc = encode.create_video_encoder(width=width, height=height, fps=self.encoding.fps, settings=self.encoding, bitrate_k=bitrate_k)
+        if self.encoder_threads > 0:
+            enc.thread_count = self.encoder_threads
+        return enc
+
+    def _adapt_bitrate(self, enc: av.CodecContext) -> av.CodecContext:
+        """At a GOP boundary, let the adaptive bitrate look at the outputs; on a new bitrate, the encoder reopened at it."""
+        if self.bitrate is None or self.fanout is None or self._gop_frames < self.encoding.gop_frames - 1:
+            return enc
+        self._gop_frames = 0  # the next check comes a GOP later, whether or not the encoder is replaced
+        previous = self.bitrate.bitrate_k
+        now = time.monotonic()
+        pressure = self.bitrate.measure(self.fanout.stats(), now)
+        bitrate_k = self.bitrate.update(pressure, now)
+        if bitrate_k is None:
+            return enc
+        logger.info(
+            "[%s] Output %s (write busy %.0f%%, lag %.2fs, backlog %.2fs); bitrate %d -> %d kbps",
+            self.name,
+            "congested" if bitrate_k < previous else "drained",
+            pressure.write_busy * 100,
+            pressure.lag_seconds,
+            pressure.backlog_seconds,
+            previous,
+            bitrate_k,
+        )
+        metrics.BITRATE_CHANGES.labels(self.name, "down" if bitrate_k < previous else "up").inc()
+        flushed = list(enc.encode(None))
+        self._write(self._stamper.stamp(flushed) if self._stamper is not None else flushed, [])
+        return self._create_encoder(enc.width, enc.height)
+
+    def _open_encoder(self, width: int, height: int, audio_format: audio.AudioFormat | None = None) -> av.CodecContext:
+        """Encoder at the first frame's geometry, plus the outputs; the first source's AAC format (if any) sets the track's."""
+        enc = self._create_encoder(width, height)
+        self.frame_pool = FramePool(enc.width, enc.height)
+        e = self.encoding
+        track = audio.output_format(audio_format, e.audio_sample_rate, e.audio_layout, e.audio_bitrate_k)
+        self.audio_track = audio.AudioTrack(track, e.audio_bitrate_k, stream=self.name)
+        if self.fanout is not None and self.ts_muxer is None:
+            self.ts_muxer = TsMuxer(enc.width, enc.height, self.encoding.fps, track)
+        if self.output_file and self.file_output is None:
+            self.file_output = file_out.FileOutput(self.output_file, enc.width, enc.height, self.encoding.fps, track)
+        return enc
+
+    def run(self) -> None:
+        """Loop until stop(): encode every frame of the active input; the encoder and outputs survive input switches."""
+        w = get_settings().worker
+        self._thread_id = threading.get_ident()
+        self.fanout = rtmp_out.create_fanout(self.output_urls, stream=self.name, input_format="mpegts") if self.output_urls else None
+        self.inputs = InputSwitcher(self.name, [self.input_url, *self.backup_urls], w)
+        next_stats_log = time.monotonic() + w.output_stats_log_seconds
+        metrics.REGISTRY.add_collector(self.export_metrics)
+        self.inputs.start()
+        enc: av.CodecContext | None = None
+        try:
+            while not self._stop.is_set():
+                item = self.inputs.next_frame()
+                if item is None:
+                    continue
+                frame = item.frame
+                self._stage["demux"].observe(item.demux_seconds)
+                self._stage["decode"].observe(item.decode_seconds)
+                try:
+                    if enc is None:
+                        enc = self._open_encoder(frame.width, frame.height, item.audio_format)
+                    enc = self._adapt_bitrate(enc)
+                    self._process_frame(enc, frame, item.demuxed_at, item.demux_seconds, item.decode_seconds, item.audio, item.audio_format)
+                except Exception as e:
+                    logger.warning("[%s] Frame skipped: %s", self.name, e)
+                if self.fanout is not None and time.monotonic() >= next_stats_log:
+                    rtmp_out.log_stats(self.fanout)
+                    next_stats_log = time.monotonic() + w.output_stats_log_seconds
+            if self.file_output is not None and enc is not None:
+                flushed = list(enc.encode(None))
+                for pkt in self._stamper.stamp(flushed) if self._stamper is not None else flushed:
+                    self.file_output.write(pkt)
+        finally:
+            self.inputs.close()
+            self._thread_id = None
+            if self.preview is not None:
+                self.preview.close()
+            metrics.REGISTRY.remove_collector(self.export_metrics)
+            if self.fanout is not None:
+                if self.ts_muxer is not None:
+                    for chunk in self.ts_muxer.close():
+                        self.fanout.send(chunk)
+                self.fanout.close()
+            if self.file_output is not None:
+                self.file_output.close()
@@ -0,0 +1,119 @@
+"""
+Periodic preview of the composited output (WORKER__PREVIEW_*), for operators to check the overlay without waiting
+for YouTube. Every interval the pipeline hands the frame it just encoded to a PreviewEncoder: only a reference
+changes hands on the frame path (a pooled frame is detached from its FramePool first, so it is never overwritten).
+A background thread scales it down and encodes a JPEG or WebP; the latest one is served on the admin endpoint
+(/preview) and, through API__WORKER_ADMIN_URL, by the overlay API.
+"""
+
+import io
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import av
+from av.video.reformatter import Interpolation, VideoReformatter
+
+from stream_workers.admin import RouteHandler
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_FORMATS = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+@dataclass(frozen=True)
+class Preview:
+    """One encoded preview image; captured_at is the wall-clock time of its frame."""
+
+    data: bytes
+    content_type: str
+    width: int
+    height: int
+    frame: int
+    captured_at: float
+
+
+class PreviewEncoder:
+    """Takes a frame reference at most every interval_seconds and encodes it to a preview off the frame path."""
+
+    def __init__(self, interval_seconds: float, width: int = 320, image_format: str = "jpeg", quality: int = 70) -> None:
+        if image_format not in PREVIEW_FORMATS:
+            raise ValueError(f"unknown preview format {image_format!r} (expected one of {tuple(PREVIEW_FORMATS)})")
+        self.interval_seconds = interval_seconds
+        self.width = width
+        self.image_format = image_format
+        self.quality = quality
+        self.latest: Preview | None = None
+        self._next_at = 0.0
+        self._pending: tuple[av.VideoFrame, int, float] | None = None
+        self._wake = threading.Condition()
+        self._closed = False
+        self._thread: threading.Thread | None = None
+        self._scaler = VideoReformatter()
+
+    def due(self) -> bool:
+        """True when a preview should be taken now (the interval elapsed and the previous one is encoded)."""
+        return time.monotonic() >= self._next_at and self._pending is None
+
+    def submit(self, frame: av.VideoFrame, frame_number: int) -> None:
+        """Hand frame over to the encoder thread; the caller must not write into it afterwards."""
+        self._next_at = time.monotonic() + self.interval_seconds
+        with self._wake:
+            self._pending = (frame, frame_number, time.time())
+            self._wake.notify()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="preview", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        if hasattr(os, "setpriority"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)  # Linux: this thread only
+            except OSError:
+                pass
+        while True:
+            with self._wake:
+                while self._pending is None and not self._closed:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                assert self._pending is not None
+                frame, frame_number, captured_at = self._pending
+            try:
+                self.latest = self.encode(frame, frame_number, captured_at)
+            except Exception as e:
+                logger.warning("Preview failed: %s", e)
+            finally:
+                with self._wake:
+                    self._pending = None
+
+    def encode(self, frame: av.VideoFrame, frame_number: int, captured_at: float) -> Preview:
+        width = min(self.width, frame.width) // 2 * 2
+        height = max(2, round(frame.height * width / frame.width) // 2 * 2)
+        small = self._scaler.reformat(frame, width=width, height=height, format="rgb24", interpolation=Interpolation.AREA)
+        buffer = io.BytesIO()
+        small.to_image().save(buffer, format=self.image_format.upper(), quality=self.quality)  # type: ignore[no-untyped-call]
+        return Preview(buffer.getvalue(), PREVIEW_FORMATS[self.image_format], width, height, frame_number, captured_at)
+
+    def close(self) -> None:
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+
+
+def preview_response(preview: Preview | None) -> tuple[int, str, bytes]:
+    if preview is None:
+        return 404, "application/json", json.dumps({"error": "no preview yet"}).encode()
+    return 200, preview.content_type, preview.data
+
+
+def preview_route(encoder: PreviewEncoder | None) -> RouteHandler:
+    """GET /preview: the latest preview image of this process's pipeline."""
+
+    def handle(_params: dict[str, list[str]]) -> tuple[int, str, bytes]:
+        return preview_response(encoder.latest if encoder is not None else None)
+
+    return handle
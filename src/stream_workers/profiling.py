@@ -0,0 +1,194 @@
+"""
+On-demand diagnostics for a live worker, without restarting it or interrupting output:
+- a sampling profiler: a background thread records the stacks of the pipeline's threads (frame loop and input
+  readers; every other thread when none are known yet) every interval for N seconds and writes them in
+  collapsed-stack format (one "thread;outer;...;inner count" line per stack, flamegraph input);
+- FrameTimings: a fixed-size ring buffer of per-frame stage durations (the last N frames), written as CSV.
+Triggered by SIGUSR1 (profile) / SIGUSR2 (frame trace) or the admin routes /debug/profile and /debug/frames.
+Files go to WORKER__PROFILE_DIR.
+"""
+
+import collections
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from array import array
+from collections.abc import Callable
+from types import FrameType
+
+from config.settings import get_settings
+from stream_workers.admin import RouteHandler
+
+logger = logging.getLogger(__name__)
+
+FRAME_FIELDS = ("time", "pts", "demux", "decode", "scale", "overlay", "encode", "write", "latency")
+MAX_PROFILE_SECONDS = 300.0
+
+_profile_lock = threading.Lock()
+
+ThreadIds = Callable[[], set[int]]  # ids of the threads to profile, looked up when a profile starts
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+
+def sample_stacks(seconds: float, interval: float, thread_ids: set[int] | None = None) -> collections.Counter[str]:
+    """Sample the stacks of thread_ids (default: every thread but the caller) for seconds; collapsed stack -> count."""
+    own = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    counts: collections.Counter[str] = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (thread_ids is not None and ident not in thread_ids):
+                continue
+            stack: list[str] = []
+            current: FrameType | None = frame
+            while current is not None:
+                stack.append(_frame_label(current))
+                current = current.f_back
+            stack.append(names.get(ident) or str(ident))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+def collapsed(counts: collections.Counter[str]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+def _write_file(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as fh:
+        fh.write(text)
+
+
+def profile_to_file(
+    path: str, seconds: float, interval: float | None = None, thread_ids: ThreadIds | None = None
+) -> collections.Counter[str] | None:
+    """Sample thread_ids() (every other thread when None or empty) for seconds and write the collapsed stacks to path;
+    None when a profile is already running."""
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        interval = interval if interval is not None else get_settings().worker.profile_interval_ms / 1000.0
+        threads = (thread_ids() if thread_ids is not None else set()) or None
+        logger.info("Profiling %s for %.0fs (every %.0f ms) -> %s", threads or "all threads", seconds, interval * 1000, path)
+        counts = sample_stacks(min(seconds, MAX_PROFILE_SECONDS), interval, threads)
+        _write_file(path, collapsed(counts))
+        logger.info("Profile written: %s (%d samples)", path, sum(counts.values()))
+        return counts
+    finally:
+        _profile_lock.release()
+
+
+class FrameTimings:
+    """Ring buffer of the last capacity frames' timings (FRAME_FIELDS); one writer thread, readers copy."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(1, capacity)
+        self._width = len(FRAME_FIELDS)
+        self._data = array("d", bytes(8 * self.capacity * self._width))
+        self._count = 0
+
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
+
+    def record(self, *values: float) -> None:
+        base = (self._count % self.capacity) * self._width
+        data = self._data
+        for i, value in enumerate(values):
+            data[base + i] = value
+        self._count += 1
+
+    def rows(self, last: int | None = None) -> list[tuple[float, ...]]:
+        """Oldest-first copy of the last `last` (default all buffered) rows."""
+        count = self._count
+        n = min(count, self.capacity, last if last is not None else self.capacity)
+        width = self._width
+        rows = []
+        for seq in range(count - n, count):
+            base = (seq % self.capacity) * width
+            rows.append(tuple(self._data[base : base + width]))
+        return rows
+
+    def csv(self, last: int | None = None) -> str:
+        lines = [",".join(FRAME_FIELDS)]
+        lines.extend(",".join(f"{v:.6f}" for v in row) for row in self.rows(last))
+        return "\n".join(lines) + "\n"
+
+
+def output_path(name: str, kind: str, pid: int | None = None) -> str:
+    """WORKER__PROFILE_DIR/<name>-<pid>-<UTC timestamp>.<kind> (pid defaults to this process)"""
+    stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    return os.path.join(get_settings().worker.profile_dir, f"{name}-{pid or os.getpid()}-{stamp}.{kind}")
+
+
+def start_profile(name: str, seconds: float | None = None, thread_ids: ThreadIds | None = None) -> str:
+    """Profile in a background thread (returns the file path at once)."""
+    seconds = seconds if seconds is not None else get_settings().worker.profile_seconds
+    path = output_path(name, "collapsed")
+    threading.Thread(target=profile_to_file, args=(path, seconds, None, thread_ids), name="profiler", daemon=True).start()
+    return path
+
+
+def write_frame_timings(path: str, timings: FrameTimings, last: int | None = None) -> str:
+    """Write the last frames' timings as CSV to path; returns the CSV text."""
+    text = timings.csv(last)
+    _write_file(path, text)
+    logger.info("Frame trace written: %s (%d frames)", path, text.count("\n") - 1)
+    return text
+
+
+def dump_frame_timings(name: str, timings: FrameTimings, last: int | None = None) -> tuple[str, str]:
+    """write_frame_timings to a new file in WORKER__PROFILE_DIR; returns (path, CSV text)."""
+    path = output_path(name, "frames.csv")
+    return path, write_frame_timings(path, timings, last)
+
+
+def install_signal_handlers(name: str, timings: FrameTimings, thread_ids: ThreadIds | None = None) -> None:
+    """SIGUSR1 starts a profile of thread_ids, SIGUSR2 dumps the frame trace (main thread only; the work runs off the
+    handler)."""
+
+    def on_profile(_signum: int, _frame: object) -> None:
+        start_profile(name, thread_ids=thread_ids)
+
+    def on_frames(_signum: int, _frame: object) -> None:
+        threading.Thread(target=dump_frame_timings, args=(name, timings), name="frame-trace", daemon=True).start()
+
+    signal.signal(signal.SIGUSR1, on_profile)
+    signal.signal(signal.SIGUSR2, on_frames)
+
+
+def _float_param(params: dict[str, list[str]], key: str, default: float) -> float:
+    values = params.get(key)
+    return float(values[0]) if values else default
+
+
+def profile_route(name: str, thread_ids: ThreadIds | None = None) -> RouteHandler:
+    """GET /debug/profile?seconds=N: sample thread_ids for N seconds, save the file and return the collapsed stacks."""
+
+    def handle(params: dict[str, list[str]]) -> tuple[int, str, bytes]:
+        seconds = _float_param(params, "seconds", get_settings().worker.profile_seconds)
+        path = output_path(name, "collapsed")
+        counts = profile_to_file(path, seconds, thread_ids=thread_ids)
+        if counts is None:
+            return 409, "text/plain; charset=utf-8", b"a profile is already running\n"
+        return 200, "text/plain; charset=utf-8", collapsed(counts).encode()
+
+    return handle
+
+
+def frames_route(name: str, timings: FrameTimings) -> RouteHandler:
+    """GET /debug/frames?last=N: CSV of the last N frame timings (also saved to a file)."""
+
+    def handle(params: dict[str, list[str]]) -> tuple[int, str, bytes]:
+        _path, text = dump_frame_timings(name, timings, int(_float_param(params, "last", timings.capacity)))
+        return 200, "text/csv; charset=utf-8", text.encode()
+
+    return handle
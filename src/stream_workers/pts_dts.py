@@ -11,15 +11,32 @@ logger = logging.getLogger(__name__)
 
 
 # Running base for continuous timestamps (time_base units).
-class _PTSState:
+class PTSState:
+    """Running PTS/DTS counters for one pipeline; each pipeline owns its own instance."""
+
     __slots__ = ("next_pts", "next_dts")
 
     def __init__(self) -> None:
         self.next_pts = 0
         self.next_dts = 0
 
+    def rewrite(self, frame: av.VideoFrame | av.AudioFrame) -> None:
+        """Rewrite frame PTS/DTS to be linear and monotonic (mutates frame in place)."""
+        if frame.pts is None and frame.dts is None:
+            return
+        if frame.pts is not None:
+            frame.pts = self.next_pts
+            self.next_pts += 1
+        if frame.dts is not None:
+            frame.dts = self.next_dts
+            self.next_dts += 1
+
+    def reset(self) -> None:
+        self.next_pts = 0
+        self.next_dts = 0
+
 
-_pts_state = _PTSState()
+_pts_state = PTSState()
 
 
 def get_time_base() -> tuple[int, int]:
@@ -32,17 +49,9 @@ def rewrite_pts_dts(frame: av.VideoFrame | av.AudioFrame) -> None:
     Rewrite frame PTS/DTS to be linear and monotonic.
     Mutates frame in place; uses module-level running counters.
     """
-    if frame.pts is None and frame.dts is None:
-        return
-    if frame.pts is not None:
-        frame.pts = _pts_state.next_pts
-        _pts_state.next_pts += 1
-    if frame.dts is not None:
-        frame.dts = _pts_state.next_dts
-        _pts_state.next_dts += 1
+    _pts_state.rewrite(frame)
 
 
 def reset_pts_dts() -> None:
     """Reset running counters (e.g. on intentional stream restart)."""
-    _pts_state.next_pts = 0
-    _pts_state.next_dts = 0
+    _pts_state.reset()
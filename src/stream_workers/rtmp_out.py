@@ -1,37 +1,56 @@
 """
-RTMP output via FFmpeg: raw H.264 on stdin, silent audio; outputs FLV to RTMP URL.
+RTMP output via FFmpeg: MPEG-TS (H.264 + AAC, see stream_workers.ts_mux) on stdin, copied into FLV for the RTMP URL;
+raw H.264 input (the demo scripts) gets a silent AAC track from FFmpeg instead.
+FanOut delivers one encoded packet stream to N destinations, each with its own bounded buffer, writer thread,
+reconnect backoff and keyframe-aligned resync, so a slow destination never blocks the encoder or the others.
+Per-destination stats (lag, backlog, time blocked in writes) are the backpressure signal for the encoder's adaptive
+bitrate (stream_workers.bitrate).
 """
 
 import logging
+import os
+import random
+import select
+import socket
 import subprocess
+import threading
+import time
+import urllib.parse
+from collections import deque
+from dataclasses import dataclass
+from typing import IO, Protocol
+
+from config.settings import get_settings
+from stream_workers import metrics
+from stream_workers.urls import mask_url
 
 logger = logging.getLogger(__name__)
 
+BITRATE_WINDOW_SECONDS = 5.0
+
 
-def start_rtmp_process(rtmp_url: str) -> subprocess.Popen[bytes] | None:
-    """Start FFmpeg: -f h264 pipe, anullsrc, -c:v copy -c:a aac -f flv rtmp_url. Returns process or None."""
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-loglevel",
-        "error",
-        "-f",
-        "h264",
-        "-i",
-        "pipe:0",
-        "-f",
-        "lavfi",
-        "-i",
-        "anullsrc=r=44100:cl=stereo",
-        "-c:v",
-        "copy",
-        "-c:a",
-        "aac",
-        "-shortest",
-        "-f",
-        "flv",
-        rtmp_url,
-    ]
+def start_rtmp_process(rtmp_url: str, input_format: str = "h264") -> subprocess.Popen[bytes] | None:
+    """Start FFmpeg publishing stdin to rtmp_url as FLV. input_format "mpegts": -c copy (video and audio);
+    "h264": raw video plus anullsrc encoded to AAC. Returns process or None."""
+    if input_format == "mpegts":
+        streams = ["-f", "mpegts", "-i", "pipe:0", "-c", "copy"]
+    else:
+        streams = [
+            "-f",
+            "h264",
+            "-i",
+            "pipe:0",
+            "-f",
+            "lavfi",
+            "-i",
+            "anullsrc=r=44100:cl=stereo",
+            "-c:v",
+            "copy",
+            "-c:a",
+            "aac",
+            "-shortest",
+        ]
+    cmd = ["ffmpeg", "-y", "-loglevel", "error", *streams, "-f", "flv", rtmp_url]
     try:
         proc = subprocess.Popen(
             cmd,
@@ -59,3 +78,361 @@ def write_packet(proc: subprocess.Popen[bytes], data: bytes) -> bool:
     except (BrokenPipeError, OSError) as e:
         logger.debug("RTMP write failed: %s", e)
         return False
+
+
+@dataclass(frozen=True)
+class OutputPacket:
+    """One encoded H.264 access unit (Annex B), or a chunk of MPEG-TS, as handed to the output stage.
+    keyframe: the data starts at a keyframe (a destination may start or resume there). data may be a memoryview over
+    the encoder's or muxer's buffer (handed to the sinks without copying); it must not be modified once sent."""
+
+    data: bytes | memoryview
+    keyframe: bool
+
+
+@dataclass(frozen=True)
+class DestinationStats:
+    url: str
+    connected: bool
+    bitrate_kbps: float
+    lag_seconds: float
+    backlog_bytes: int
+    backlog_packets: int
+    bytes_sent: int
+    packets_sent: int
+    packets_dropped: int
+    reconnects: int
+    write_seconds: float  # total time the writer spent blocked in writes (including one in progress)
+
+
+class Sink(Protocol):
+    def write(self, data: bytes | memoryview) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class _ProcessSink:
+    """FFmpeg publishing to an RTMP URL; stderr is drained to the log so the pipe never fills.
+    stdin is written non-blocking: a write that cannot complete within write_timeout (FFmpeg stalled on a dead RTMP
+    connection) kills the process and raises TimeoutError, so the destination reconnects with a fresh FFmpeg."""
+
+    def __init__(self, url: str, input_format: str, write_timeout: float = 10.0) -> None:
+        proc = start_rtmp_process(url, input_format)
+        if proc is None or proc.stdin is None:
+            raise OSError(f"ffmpeg could not be started for {url}")
+        self._proc = proc
+        self._stdin: IO[bytes] = proc.stdin
+        self._fd = proc.stdin.fileno()
+        os.set_blocking(self._fd, False)
+        self.write_timeout = write_timeout
+        if proc.stderr is not None:
+            threading.Thread(target=self._drain_stderr, args=(proc.stderr,), daemon=True).start()
+
+    @staticmethod
+    def _drain_stderr(stream: IO[bytes]) -> None:
+        for line in stream:
+            logger.warning("ffmpeg: %s", line.decode(errors="replace").rstrip())
+
+    def write(self, data: bytes | memoryview) -> None:
+        if self._proc.poll() is not None:
+            raise BrokenPipeError(f"ffmpeg exited with {self._proc.returncode}")
+        view = memoryview(data)
+        deadline = time.monotonic() + self.write_timeout
+        while view:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([], [self._fd], [], remaining)[1]:
+                self._proc.kill()
+                raise TimeoutError(f"ffmpeg stdin blocked for {self.write_timeout}s")
+            try:
+                view = view[os.write(self._fd, view) :]
+            except BlockingIOError:
+                continue
+
+    def close(self) -> None:
+        try:
+            self._stdin.close()
+        except OSError:
+            pass
+        try:
+            self._proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+
+
+class _SocketSink:
+    """The raw stream (MPEG-TS or H.264) over TCP (tcp://host:port), e.g. a local ffmpeg listener or a test sink."""
+
+    def __init__(self, url: str, timeout: float, send_buffer_bytes: int = 0) -> None:
+        parsed = urllib.parse.urlsplit(url)
+        if not parsed.hostname or not parsed.port:
+            raise OSError(f"invalid tcp url: {url}")
+        self._sock = socket.create_connection((parsed.hostname, parsed.port), timeout=timeout)
+        self._sock.settimeout(timeout)
+        if send_buffer_bytes > 0:
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer_bytes)
+
+    def write(self, data: bytes | memoryview) -> None:
+        self._sock.sendall(data)
+
+    def close(self) -> None:
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+
+
+def open_sink(url: str, timeout: float = 10.0, input_format: str = "h264", send_buffer_bytes: int = 0) -> Sink:
+    """Open a destination: tcp://host:port writes the raw stream to a socket (send_buffer_bytes > 0 bounds its kernel
+    send buffer); anything else goes through FFmpeg. A write blocked for longer than timeout raises an OSError."""
+    if url.startswith("tcp://"):
+        return _SocketSink(url, timeout, send_buffer_bytes)
+    return _ProcessSink(url, input_format, timeout)
+
+
+class _Destination:
+    """Bounded buffer + writer thread for one URL. On overflow the oldest GOPs are dropped (never blocking the
+    caller); if that is not enough, delivery resumes at the next keyframe. Each new connection starts at a keyframe."""
+
+    def __init__(
+        self,
+        url: str,
+        max_buffer_bytes: int,
+        write_timeout: float,
+        backoff_initial: float,
+        backoff_max: float,
+        stream: str = "",
+        input_format: str = "h264",
+        send_buffer_bytes: int = 0,
+    ) -> None:
+        self.url = url
+        self.input_format = input_format
+        self.send_buffer_bytes = send_buffer_bytes
+        self.max_buffer_bytes = max_buffer_bytes
+        self.write_timeout = write_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._buffer: deque[tuple[float, OutputPacket]] = deque()
+        self._buffer_bytes = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._waiting_keyframe = True
+        self._connected = False
+        self.bytes_sent = 0
+        self.packets_sent = 0
+        self.packets_dropped = 0
+        self.reconnects = 0
+        self.write_seconds = 0.0
+        self._write_started: float | None = None
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._bitrate_kbps = 0.0
+        self._write_histogram = metrics.OUTPUT_WRITE_SECONDS.labels(stream, mask_url(url))
+        self._thread = threading.Thread(target=self._run, name=f"fanout-{url[:32]}", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def offer(self, packet: OutputPacket) -> None:
+        """Enqueue without blocking; drop and schedule keyframe resync if the buffer would overflow."""
+        with self._cond:
+            if self._closed:
+                return
+            if self._buffer_bytes + len(packet.data) > self.max_buffer_bytes:
+                self._drop_to_latest_keyframe()
+            if self._buffer_bytes + len(packet.data) > self.max_buffer_bytes:
+                self.packets_dropped += len(self._buffer)
+                self._buffer.clear()
+                self._buffer_bytes = 0
+                if not self._waiting_keyframe:
+                    logger.warning("Output %s stalled; dropping until next keyframe", mask_url(self.url))
+                self._waiting_keyframe = True
+            if self._waiting_keyframe:
+                if not packet.keyframe:
+                    self.packets_dropped += 1
+                    return
+                self._waiting_keyframe = False
+            self._buffer.append((time.monotonic(), packet))
+            self._buffer_bytes += len(packet.data)
+            self._cond.notify()
+
+    def _drop_to_latest_keyframe(self) -> None:
+        """Discard buffered GOPs older than the newest buffered keyframe (caller holds the lock)."""
+        latest = max((i for i, (_, p) in enumerate(self._buffer) if p.keyframe), default=0)
+        for _ in range(latest):
+            _, old = self._buffer.popleft()
+            self._buffer_bytes -= len(old.data)
+            self.packets_dropped += 1
+
+    def close(self) -> None:
+        """Stop accepting packets; the writer drains what is buffered (bounded by write_timeout) and exits."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=self.write_timeout + 1)
+
+    def stats(self) -> DestinationStats:
+        now = time.monotonic()
+        with self._cond:
+            lag = now - self._buffer[0][0] if self._buffer else 0.0
+            elapsed = now - self._window_start
+            bitrate = self._bitrate_kbps if elapsed < BITRATE_WINDOW_SECONDS else self._window_bytes * 8 / 1000 / elapsed
+            writing = now - self._write_started if self._write_started is not None else 0.0
+            return DestinationStats(
+                url=self.url,
+                connected=self._connected,
+                bitrate_kbps=bitrate,
+                lag_seconds=lag,
+                backlog_bytes=self._buffer_bytes,
+                backlog_packets=len(self._buffer),
+                bytes_sent=self.bytes_sent,
+                packets_sent=self.packets_sent,
+                packets_dropped=self.packets_dropped,
+                reconnects=self.reconnects,
+                write_seconds=self.write_seconds + writing,
+            )
+
+    def _next(self) -> OutputPacket | None:
+        with self._cond:
+            while not self._buffer and not self._closed:
+                self._cond.wait()
+            if not self._buffer:
+                return None
+            _, packet = self._buffer.popleft()
+            self._buffer_bytes -= len(packet.data)
+            self._write_started = time.monotonic()
+            return packet
+
+    def _account(self, nbytes: int) -> None:
+        now = time.monotonic()
+        with self._cond:
+            if self._write_started is not None:
+                self._write_histogram.observe(now - self._write_started)
+                self.write_seconds += now - self._write_started
+                self._write_started = None
+            self.bytes_sent += nbytes
+            self.packets_sent += 1
+            self._window_bytes += nbytes
+            elapsed = now - self._window_start
+            if elapsed >= BITRATE_WINDOW_SECONDS:
+                self._bitrate_kbps = self._window_bytes * 8 / 1000 / elapsed
+                self._window_start = now
+                self._window_bytes = 0
+
+    def _reset_after_disconnect(self) -> None:
+        with self._cond:
+            self._connected = False
+            self._write_started = None
+            self.reconnects += 1
+            self.packets_dropped += len(self._buffer)
+            self._buffer.clear()
+            self._buffer_bytes = 0
+            self._waiting_keyframe = True
+
+    def _run(self) -> None:
+        backoff = self.backoff_initial
+        while not self._closed:
+            try:
+                sink = open_sink(self.url, self.write_timeout, self.input_format, self.send_buffer_bytes)
+            except OSError as e:
+                logger.warning("Output %s connect failed: %s (retry in %.1fs)", mask_url(self.url), e, backoff)
+                time.sleep(backoff * random.uniform(0.8, 1.2))
+                backoff = min(self.backoff_max, backoff * 2)
+                continue
+            with self._cond:
+                self._connected = True
+            try:
+                while True:
+                    packet = self._next()
+                    if packet is None:
+                        return
+                    sink.write(packet.data)
+                    self._account(len(packet.data))
+                    backoff = self.backoff_initial
+            except OSError as e:
+                logger.warning("Output %s write failed: %s; reconnecting", mask_url(self.url), e)
+                self._reset_after_disconnect()
+            finally:
+                sink.close()
+            time.sleep(backoff * random.uniform(0.8, 1.2))
+            backoff = min(self.backoff_max, backoff * 2)
+
+
+class FanOut:
+    """Deliver one encoded packet stream to N destinations with per-destination isolation."""
+
+    def __init__(
+        self,
+        urls: list[str],
+        max_buffer_bytes: int = 4_000_000,
+        write_timeout: float = 10.0,
+        backoff_initial: float = 0.5,
+        backoff_max: float = 30.0,
+        stream: str = "",
+        input_format: str = "h264",
+        send_buffer_bytes: int = 0,
+    ) -> None:
+        self.stream = stream
+        self._destinations = [
+            _Destination(url, max_buffer_bytes, write_timeout, backoff_initial, backoff_max, stream, input_format, send_buffer_bytes)
+            for url in dict.fromkeys(urls)
+        ]
+        for dest in self._destinations:
+            dest.start()
+
+    @property
+    def urls(self) -> list[str]:
+        return [d.url for d in self._destinations]
+
+    def send(self, packet: OutputPacket) -> None:
+        """Hand one packet to every destination; never blocks on a destination."""
+        for dest in self._destinations:
+            dest.offer(packet)
+
+    def stats(self) -> list[DestinationStats]:
+        return [d.stats() for d in self._destinations]
+
+    def export_metrics(self) -> None:
+        """Copy per-destination stats into the worker_output_* metrics (labels: stream, masked destination)."""
+        for st in self.stats():
+            labels = (self.stream, mask_url(st.url))
+            metrics.OUTPUT_CONNECTED.labels(*labels).set(1.0 if st.connected else 0.0)
+            metrics.OUTPUT_BACKLOG_BYTES.labels(*labels).set(st.backlog_bytes)
+            metrics.OUTPUT_BACKLOG_PACKETS.labels(*labels).set(st.backlog_packets)
+            metrics.OUTPUT_LAG_SECONDS.labels(*labels).set(st.lag_seconds)
+            metrics.OUTPUT_BYTES.labels(*labels).value = st.bytes_sent
+            metrics.OUTPUT_PACKETS_DROPPED.labels(*labels).value = st.packets_dropped
+            metrics.OUTPUT_RECONNECTS.labels(*labels).value = st.reconnects
+
+    def close(self) -> None:
+        for dest in self._destinations:
+            dest.close()
+
+
+def create_fanout(urls: list[str], stream: str = "", input_format: str = "h264") -> FanOut:
+    """FanOut configured from WorkerSettings (buffer size, write timeout, reconnect cap, socket buffer); input_format is what the
+    packets carry ("mpegts" from the pipeline, raw "h264" from the demo scripts)."""
+    w = get_settings().worker
+    return FanOut(
+        urls,
+        stream=stream,
+        input_format=input_format,
+        max_buffer_bytes=w.output_buffer_bytes,
+        write_timeout=w.output_write_timeout_seconds,
+        backoff_max=w.output_reconnect_max_seconds,
+        send_buffer_bytes=w.output_socket_buffer_bytes,
+    )
+
+
+def log_stats(fanout: FanOut) -> None:
+    """Log one line per destination: bitrate, lag, backlog, drops, reconnects."""
+    for st in fanout.stats():
+        logger.info(
+            "Output %s connected=%s bitrate=%.0fkbps lag=%.2fs backlog=%dB dropped=%d reconnects=%d",
+            mask_url(st.url),
+            st.connected,
+            st.bitrate_kbps,
+            st.lag_seconds,
+            st.backlog_bytes,
+            st.packets_dropped,
+            st.reconnects,
+        )
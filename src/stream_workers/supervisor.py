@@ -0,0 +1,387 @@
+"""
+Multi-stream supervisor: runs one Pipeline per StreamDefinition (WORKER__STREAMS or WORKER__STREAMS_FILE), each in
+its own process pinned to CPUs. A single overlay fetcher in the supervisor polls the DB and hands snapshots to the
+overlay renderer process (stream_workers.overlay_renderer), which publishes one tile per overlay profile to shared
+memory that every pipeline blends from, so DB queries and overlay rasterization do not grow with the number of streams.
+A pipeline process that exits is restarted with backoff without touching the others; per-stream fps and lag are
+logged every WORKER__SUPERVISOR_STATUS_LOG_SECONDS. Pipelines report their metrics with their stats; the supervisor
+serves them all (plus its own) on the admin /metrics endpoint. /debug/profile?stream=<name> and
+/debug/frames?stream=<name> ask that pipeline's process (over its control queue) to write a profile or frame trace
+to WORKER__PROFILE_DIR. Pipelines send their latest output preview with their stats; /preview?stream=<name> serves it.
+Run with: python -m stream_workers.supervisor
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from multiprocessing.process import BaseProcess
+from typing import Any
+
+from config.settings import StreamDefinition, get_settings
+from stream_workers import metrics, profiling
+from stream_workers.admin import RouteHandler, metrics_route, start_admin_server
+from stream_workers.overlay_renderer import OverlayRenderer, OverlaySnapshot
+from stream_workers.overlay_shm import OverlaySegment
+from stream_workers.pipeline import Pipeline, PipelineStats
+from stream_workers.preview import Preview, preview_response
+
+logger = logging.getLogger(__name__)
+
+_CTX = multiprocessing.get_context("spawn")
+
+STATUS_REPORT_SECONDS = 1.0
+STATUS_QUEUE_REPORTS_PER_STREAM = 2  # reports queued per pipeline before new ones are dropped (supervisor behind)
+RESTART_BACKOFF_INITIAL_SECONDS = 1.0
+STABLE_RUN_SECONDS = 60.0  # a pipeline that ran this long restarts with the initial backoff again
+
+
+def assign_cpus(definitions: list[StreamDefinition], available: list[int]) -> list[list[int]]:
+    """CPUs per definition: its own cpus if set, otherwise one available CPU round-robin."""
+    if not available:
+        return [list(d.cpus) for d in definitions]
+    return [list(d.cpus) if d.cpus else [available[i % len(available)]] for i, d in enumerate(definitions)]
+
+
+def _available_cpus() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _report_status(pipeline: Pipeline, status_queue: Any) -> None:
+    sent: Preview | None = None
+    while not pipeline.stopping:
+        time.sleep(STATUS_REPORT_SECONDS)
+        latest = pipeline.preview.latest if pipeline.preview is not None else None
+        try:
+            status_queue.put_nowait((pipeline.stats(), metrics.REGISTRY.collect(), latest if latest is not sent else None))
+            sent = latest
+        except queue.Full:
+            pass
+
+
+def _control_loop(pipeline: Pipeline, control_queue: Any) -> None:
+    """Run diagnostics requested by the supervisor: ("profile", path, seconds) or ("frames", path, last)."""
+    while True:
+        command, path, amount = control_queue.get()
+        try:
+            if command == "profile":
+                if profiling.profile_to_file(path, amount, thread_ids=pipeline.thread_ids) is None:
+                    logger.warning("Profile %s skipped: a profile is already running", path)
+            elif command == "frames":
+                profiling.write_frame_timings(path, pipeline.frame_timings, int(amount))
+        except Exception as e:
+            logger.warning("Diagnostics %s failed: %s", command, e)
+
+
+def _pipeline_main(definition: StreamDefinition, cpus: list[int], segment_name: str | None, status_queue: Any, control_queue: Any) -> None:
+    """Entry point of one pipeline process."""
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [{definition.name}] %(levelname)s %(name)s: %(message)s")
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    segment = OverlaySegment.attach(segment_name) if segment_name else None
+    pipeline = Pipeline(
+        definition.name,
+        definition.input_url,
+        definition.output_urls,
+        encoding=definition.encoding_settings(get_settings().encoding),
+        overlay_profile=definition.overlay_profile,
+        encoder_threads=len(cpus),
+        overlay_segment=segment,
+        backup_urls=definition.backup_input_urls,
+    )
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: pipeline.stop())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    profiling.install_signal_handlers(definition.name, pipeline.frame_timings, pipeline.thread_ids)
+    threading.Thread(target=_report_status, args=(pipeline, status_queue), daemon=True).start()
+    threading.Thread(target=_control_loop, args=(pipeline, control_queue), name="diagnostics", daemon=True).start()
+    pipeline.run()
+
+
+@dataclass
+class _Slot:
+    definition: StreamDefinition
+    cpus: list[int]
+    process: BaseProcess | None = None
+    control: Any = None  # queue of diagnostics commands to the running process
+    started_at: float = 0.0
+    next_start: float = 0.0
+    backoff: float = RESTART_BACKOFF_INITIAL_SECONDS
+    restarts: int = 0
+    stats: PipelineStats | None = None
+    families: list[metrics.MetricFamily] | None = None
+    preview: Preview | None = None
+
+
+class Supervisor:
+    """Start, watch and restart one process per stream definition. pipeline_main is the entry point of each process
+    (called with definition, cpus, segment name, status queue and control queue; must be importable for spawn)."""
+
+    def __init__(
+        self,
+        definitions: list[StreamDefinition],
+        restart_max_seconds: float = 60.0,
+        available_cpus: list[int] | None = None,
+        pipeline_main: Callable[[StreamDefinition, list[int], str | None, Any, Any], None] = _pipeline_main,
+    ) -> None:
+        names = [d.name for d in definitions]
+        if len(set(names)) != len(names):
+            raise ValueError(f"stream names must be unique: {names}")
+        cpus = assign_cpus(definitions, available_cpus if available_cpus is not None else _available_cpus())
+        self._slots = [_Slot(d, c) for d, c in zip(definitions, cpus, strict=True)]
+        self.restart_max_seconds = restart_max_seconds
+        self._pipeline_main = pipeline_main
+        # Bounded: each report carries a registry collect and maybe a preview JPEG, so a slow supervisor drops reports
+        # (the next one supersedes them) instead of letting the pipe backlog grow
+        self._status_queue: Any = _CTX.Queue(maxsize=STATUS_QUEUE_REPORTS_PER_STREAM * len(definitions))
+        self._stop = threading.Event()
+        w = get_settings().worker
+        self._renderer = OverlayRenderer((d.overlay_profile for d in definitions), w.overlay_tile_max_width, w.overlay_tile_max_height)
+
+    def _start(self, slot: _Slot) -> None:
+        segment = self._renderer.segment(slot.definition.overlay_profile)
+        slot.control = _CTX.Queue()
+        process = _CTX.Process(
+            target=self._pipeline_main,
+            args=(slot.definition, slot.cpus, segment.name if segment else None, self._status_queue, slot.control),
+            name=f"pipeline-{slot.definition.name}",
+            daemon=True,
+        )
+        process.start()
+        slot.process = process
+        slot.started_at = time.monotonic()
+        logger.info("Started pipeline %s pid=%s cpus=%s", slot.definition.name, process.pid, slot.cpus)
+
+    def start(self) -> None:
+        self._renderer.start()
+        for slot in self._slots:
+            self._start(slot)
+
+    def broadcast_overlay(self, snapshot: OverlaySnapshot) -> None:
+        """Hand a snapshot to the renderer; pipelines pick up the tiles once published (never blocks)."""
+        self._renderer.submit(snapshot)
+
+    def _drain_status(self) -> None:
+        by_name = {slot.definition.name: slot for slot in self._slots}
+        while True:
+            try:
+                stats, families, preview = self._status_queue.get_nowait()
+            except queue.Empty:
+                return
+            slot = by_name.get(stats.name)
+            if slot is not None:
+                slot.stats = stats
+                slot.families = families
+                if preview is not None:
+                    slot.preview = preview
+
+    def export_metrics(self) -> None:
+        """Registry collector: pipeline up/restart metrics."""
+        for slot in self._slots:
+            process = slot.process
+            metrics.PIPELINE_UP.labels(slot.definition.name).set(1.0 if process is not None and process.exitcode is None else 0.0)
+            metrics.PIPELINE_RESTARTS.labels(slot.definition.name).value = slot.restarts
+
+    def request_diagnostics(self, stream: str, command: str, amount: float) -> dict[str, Any]:
+        """Ask a running pipeline to write a profile ("profile", seconds) or frame trace ("frames", last frames)."""
+        slot = next((s for s in self._slots if s.definition.name == stream), None)
+        if slot is None:
+            raise KeyError(stream)
+        process = slot.process
+        if process is None or process.exitcode is not None:
+            raise RuntimeError(f"pipeline {stream} is not running")
+        path = profiling.output_path(stream, "collapsed" if command == "profile" else "frames.csv", pid=process.pid)
+        slot.control.put_nowait((command, path, amount))
+        return {"stream": stream, "pid": process.pid, "command": command, "path": path}
+
+    def _diagnostics_route(self, command: str, param: str, default: float) -> RouteHandler:
+        """Admin route: ?stream=<name>&<param>=N -> 202 with the file the pipeline will write."""
+
+        def handle(params: dict[str, list[str]]) -> tuple[int, str, bytes]:
+            stream = (params.get("stream") or [""])[0]
+            values = params.get(param)
+            amount = float(values[0]) if values else default
+            try:
+                body = self.request_diagnostics(stream, command, amount)
+            except KeyError:
+                return 404, "application/json", json.dumps({"error": f"unknown stream {stream!r}"}).encode()
+            except RuntimeError as e:
+                return 409, "application/json", json.dumps({"error": str(e)}).encode()
+            return 202, "application/json", json.dumps(body).encode()
+
+        return handle
+
+    def _preview_route(self) -> RouteHandler:
+        """Admin route: ?stream=<name> -> that pipeline's latest preview image."""
+
+        def handle(params: dict[str, list[str]]) -> tuple[int, str, bytes]:
+            stream = (params.get("stream") or [""])[0]
+            slot = next((s for s in self._slots if s.definition.name == stream), None)
+            if slot is None:
+                return 404, "application/json", json.dumps({"error": f"unknown stream {stream!r}"}).encode()
+            return preview_response(slot.preview)
+
+        return handle
+
+    def pipeline_metric_families(self) -> list[metrics.MetricFamily]:
+        """Latest families reported by each running pipeline process."""
+        return [family for slot in self._slots for family in slot.families or []]
+
+    def poll(self) -> None:
+        """Collect pipeline stats and restart pipelines whose process exited (backoff doubles up to restart_max)."""
+        self._drain_status()
+        self._renderer.ensure_running()
+        now = time.monotonic()
+        for slot in self._slots:
+            process = slot.process
+            if process is not None and process.exitcode is None:
+                continue
+            if process is not None:
+                ran = now - slot.started_at
+                if ran >= STABLE_RUN_SECONDS:
+                    slot.backoff = RESTART_BACKOFF_INITIAL_SECONDS
+                logger.warning(
+                    "Pipeline %s exited (code %s after %.0fs); restarting in %.1fs",
+                    slot.definition.name,
+                    process.exitcode,
+                    ran,
+                    slot.backoff,
+                )
+                process.close()
+                slot.process = None
+                slot.stats = None
+                slot.families = None
+                slot.restarts += 1
+                slot.next_start = now + slot.backoff
+                slot.backoff = min(self.restart_max_seconds, slot.backoff * 2)
+            if now >= slot.next_start and not self._stop.is_set():
+                self._start(slot)
+
+    def status(self) -> list[dict[str, Any]]:
+        """Per-stream status: pid, alive, restarts, cpus, frames, fps, output lag and connected outputs."""
+        rows = []
+        for slot in self._slots:
+            process = slot.process
+            stats = slot.stats
+            rows.append(
+                {
+                    "name": slot.definition.name,
+                    "pid": process.pid if process is not None else None,
+                    "alive": process is not None and process.exitcode is None,
+                    "restarts": slot.restarts,
+                    "cpus": slot.cpus,
+                    "frames": stats.frames if stats else 0,
+                    "fps": round(stats.fps, 1) if stats else 0.0,
+                    "lag_seconds": round(stats.lag_seconds, 2) if stats else 0.0,
+                    "outputs_connected": stats.outputs_connected if stats else 0,
+                    "outputs": stats.outputs if stats else len(slot.definition.output_urls),
+                }
+            )
+        return rows
+
+    def log_status(self) -> None:
+        for row in self.status():
+            logger.info(
+                "Stream %s alive=%s fps=%.1f lag=%.2fs outputs=%d/%d frames=%d restarts=%d",
+                row["name"],
+                row["alive"],
+                row["fps"],
+                row["lag_seconds"],
+                row["outputs_connected"],
+                row["outputs"],
+                row["frames"],
+                row["restarts"],
+            )
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """SIGTERM every pipeline (it closes its outputs and exits), kill those still running after timeout."""
+        self._stop.set()
+        processes = [slot.process for slot in self._slots if slot.process is not None]
+        for process in processes:
+            if process.exitcode is None:
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.exitcode is None:
+                process.kill()
+                process.join()
+        self._renderer.close()
+
+    def _overlay_fetch_loop(self) -> None:
+        """The only DB poller: one snapshot per interval for all pipelines; on failure keep last known."""
+        try:
+            from stream_workers import db as db_module
+        except ImportError:
+            return
+        refresh_seconds = metrics.OVERLAY_REFRESH_SECONDS.labels()
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            try:
+                self.broadcast_overlay(db_module.get_overlay_snapshot())
+            except Exception as e:
+                metrics.OVERLAY_DB_FAILURES.labels().inc()
+                logger.debug("Overlay DB unreachable, keeping last known: %s", e)
+            refresh_seconds.observe(time.perf_counter() - started)
+            self._stop.wait(get_settings().worker.overlay_refresh_interval_seconds)
+
+    def run(self) -> None:
+        """Start pipelines and the overlay fetcher, then supervise until request_stop()."""
+        self.start()
+        threading.Thread(target=self._overlay_fetch_loop, daemon=True).start()
+        metrics.REGISTRY.add_collector(self.export_metrics)
+        w = get_settings().worker
+        admin = start_admin_server(
+            {
+                "/metrics": metrics_route(self.pipeline_metric_families),
+                "/debug/profile": self._diagnostics_route("profile", "seconds", w.profile_seconds),
+                "/debug/frames": self._diagnostics_route("frames", "last", w.frame_trace_size),
+                "/preview": self._preview_route(),
+            }
+        )
+        interval = w.supervisor_status_log_seconds
+        next_status_log = time.monotonic() + interval
+        try:
+            while not self._stop.wait(0.5):
+                self.poll()
+                if time.monotonic() >= next_status_log:
+                    self.log_status()
+                    next_status_log = time.monotonic() + interval
+        finally:
+            if admin is not None:
+                admin.close()
+            metrics.REGISTRY.remove_collector(self.export_metrics)
+            self.stop()
+
+    def request_stop(self) -> None:
+        self._stop.set()
+
+
+def run() -> int:
+    logging.basicConfig(level=logging.INFO)
+    w = get_settings().worker
+    definitions = w.stream_definitions()
+    if not definitions:
+        logger.error("No streams defined; set WORKER__STREAMS (JSON list) or WORKER__STREAMS_FILE")
+        return 1
+    supervisor = Supervisor(definitions, restart_max_seconds=w.supervisor_restart_max_seconds)
+
+    def on_signal(_signum: int, _frame: object) -> None:
+        supervisor.request_stop()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    supervisor.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,98 @@
+"""
+Mux the encoded video and the audio track into one MPEG-TS byte stream for the FanOut (FFmpeg copies both into
+FLV per destination, so no audio is encoded there). The muxer interleaves by timestamp and therefore writes a
+packet's bytes during a later mux() call; the output is cut by parsing the TS packets instead: a chunk starts at
+each video keyframe (its random-access PES together with the SDT/PAT/PMT FFmpeg writes right before it), so
+FanOut's keyframe resync and GOP dropping work as they did on raw H.264. Chunks are memoryviews into the buffer the
+muxer wrote (which then starts a new one), so the bytes reach the sinks without a copy.
+"""
+
+from itertools import pairwise
+
+import av
+
+from stream_workers.audio import AudioFormat
+from stream_workers.rtmp_out import OutputPacket
+
+TS_PACKET_SIZE = 188
+PMT_PID = 0x1000
+VIDEO_PID = 0x100  # first stream added
+TABLE_PIDS = (0x0000, 0x0011, PMT_PID)  # PAT, SDT, PMT
+
+
+class _Buffer:
+    def __init__(self) -> None:
+        self.data = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self.data += data
+        return len(data)
+
+
+def _pid(ts: bytearray, offset: int) -> int:
+    return (ts[offset + 1] & 0x1F) << 8 | ts[offset + 2]
+
+
+def _keyframe_start(ts: bytearray, offset: int) -> bool:
+    """TS packet at offset starts a video PES with the random-access indicator (a keyframe)."""
+    unit_start = ts[offset + 1] & 0x40
+    adaptation = ts[offset + 3] & 0x20 and ts[offset + 4] > 0
+    return _pid(ts, offset) == VIDEO_PID and bool(unit_start and adaptation and ts[offset + 5] & 0x40)
+
+
+class TsMuxer:
+    """H.264 (encoder time base) plus optional AAC track -> OutputPackets of MPEG-TS bytes."""
+
+    def __init__(self, width: int, height: int, fps: int, audio: AudioFormat | None = None) -> None:
+        self._buffer = _Buffer()
+        self._container = av.open(
+            self._buffer,
+            "w",
+            format="mpegts",
+            options={"flush_packets": "1", "mpegts_start_pid": str(VIDEO_PID), "mpegts_pmt_start_pid": str(PMT_PID)},
+        )
+        self.video = self._container.add_stream("h264", rate=fps)
+        self.video.width = width
+        self.video.height = height
+        self.video.pix_fmt = "yuv420p"
+        self.audio: av.AudioStream | None = None
+        if audio is not None:
+            self.audio = self._container.add_stream("aac", rate=audio.sample_rate)
+            self.audio.layout = audio.layout
+            if audio.extradata is not None:
+                self.audio.codec_context.extradata = audio.extradata
+
+    def mux_video(self, packet: av.Packet) -> list[OutputPacket]:
+        packet.stream = self.video
+        self._container.mux(packet)
+        return self._cut()
+
+    def mux_audio(self, packet: av.Packet) -> list[OutputPacket]:
+        if self.audio is None:
+            return []
+        packet.stream = self.audio
+        self._container.mux(packet)
+        return self._cut()
+
+    def close(self) -> list[OutputPacket]:
+        """Flush the interleaving queue; returns the last chunks."""
+        self._container.close()
+        return self._cut()
+
+    def _cut(self) -> list[OutputPacket]:
+        """Whole TS packets written so far, cut before every keyframe (and the tables preceding it)."""
+        data = self._buffer.data
+        size = len(data) - len(data) % TS_PACKET_SIZE
+        cuts: list[int] = []
+        for offset in range(0, size, TS_PACKET_SIZE):
+            if _keyframe_start(data, offset):
+                start = offset
+                while start >= TS_PACKET_SIZE and _pid(data, start - TS_PACKET_SIZE) in TABLE_PIDS:
+                    start -= TS_PACKET_SIZE
+                cuts.append(start)
+        if not size:
+            return []
+        bounds = sorted({0, *cuts, size})
+        view = memoryview(data)
+        self._buffer.data = bytearray(view[size:])  # a partial TS packet; the chunks' views keep the old buffer alive
+        return [OutputPacket(view[start:end], start in cuts) for start, end in pairwise(bounds)]
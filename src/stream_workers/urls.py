@@ -0,0 +1,16 @@
+"""
+Stream URLs as they appear in logs and metric labels: credentials, query and most of the stream key hidden.
+"""
+
+import urllib.parse
+
+
+def mask_url(url: str) -> str:
+    """URL without credentials or query and with its last path segment (the stream key) cut to 4 characters.
+    Local file paths are returned unchanged."""
+    parts = urllib.parse.urlsplit(url)
+    if not parts.netloc:
+        return url
+    base, _, key = parts.path.rpartition("/")
+    path = f"{base}/{key[:4]}…" if key else parts.path
+    return urllib.parse.urlunsplit(parts._replace(netloc=parts.netloc.rpartition("@")[2], path=path, query="", fragment=""))
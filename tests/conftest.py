@@ -0,0 +1,28 @@
+"""Shared fixtures: the overlay API against a fresh SQLite database in a temporary directory."""
+
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from flask.testing import FlaskClient
+
+from config.settings import get_settings
+from overlay_api import cache
+from overlay_api.app import app
+from stream_workers import db
+
+
+@pytest.fixture
+def api_client(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[FlaskClient]:
+    """Test client with SQLite at tmp_path/overlay.db and API__RUNTIME_DIR under tmp_path; set env before using it."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("API__RUNTIME_DIR", str(tmp_path / "runtime"))
+    get_settings.cache_clear()
+    previous_engine, previous_cache = db._engine_holder[0], cache._cache_holder[0]
+    db._engine_holder[0] = None
+    cache._cache_holder[0] = None
+    db.Base.metadata.create_all(db.get_engine())
+    yield app.test_client()
+    db.get_engine().dispose()
+    db._engine_holder[0], cache._cache_holder[0] = previous_engine, previous_cache
+    get_settings.cache_clear()
@@ -0,0 +1,83 @@
+"""Overlay API request/DB instrumentation and GET /metrics (overlay_api.metrics)."""
+
+import json
+import re
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from flask.testing import FlaskClient
+
+from config.settings import get_settings
+from overlay_api import metrics as api_metrics
+from overlay_api.app import app, ensure_schema
+from stream_workers import db, metrics
+
+
+@pytest.fixture
+def client(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[FlaskClient]:
+    monkeypatch.chdir(tmp_path)  # SQLite at ./overlay.db
+    monkeypatch.setenv("API__RUNTIME_DIR", str(tmp_path / "runtime"))
+    monkeypatch.setenv("API__SLOW_REQUEST_MS", "1")
+    get_settings.cache_clear()
+    previous = db._engine_holder[0]
+    db._engine_holder[0] = None
+    db.Base.metadata.create_all(db.get_engine())
+    ensure_schema()  # instruments the engine, as at startup
+    yield app.test_client()
+    db.get_engine().dispose()
+    db._engine_holder[0] = previous
+    get_settings.cache_clear()
+
+
+def _value(body: str, series: str) -> float:
+    match = re.search(rf"^{re.escape(series)} (\S+)$", body, re.MULTILINE)
+    assert match, f"{series} not in /metrics"
+    return float(match.group(1))
+
+
+def test_metrics_cover_requests_db_and_other_workers(client: FlaskClient, tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+    before = client.get("/metrics").get_data(as_text=True)
+    for amount in (10, 20):
+        assert client.post("/donors", json={"identifier": "d", "amount": amount}).status_code == 201
+    assert client.post("/donors", json={}).status_code == 400
+    # Another live worker's dump (pid 1 always exists) is summed into the response
+    other = metrics.Registry()
+    metrics.Counter("api_stripe_events_total", "", ("outcome",), registry=other).labels("duplicate").inc(3)
+    (tmp_path / "runtime" / "metrics" / "1.json").write_text(metrics.dumps(other.collect()))
+
+    response = client.get("/metrics")
+    body = response.get_data(as_text=True)
+
+    assert response.content_type == metrics.CONTENT_TYPE
+
+    def delta(series: str) -> float:
+        return _value(body, series) - (_value(before, series) if series in before else 0.0)
+
+    assert delta('api_request_seconds_count{route="/donors",method="POST",status="201"}') == 2
+    assert delta('api_request_seconds_count{route="/donors",method="POST",status="400"}') == 1
+    assert delta('api_db_seconds_count{statement="INSERT"}') == 2
+    assert delta('api_db_seconds_count{statement="COMMIT"}') == 2
+    assert delta("api_db_flush_seconds_count") == 2
+    assert _value(body, "api_db_pool_wait_seconds_count") >= 2
+    assert _value(body, 'api_stripe_events_total{outcome="duplicate"}') >= 3
+    assert any("Slow request POST /donors" in r.getMessage() for r in caplog.records)
+    assert json.loads((tmp_path / "runtime" / "metrics" / "1.json").read_text())
+
+
+def test_requests_do_not_instrument_the_engine(client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: list[object] = []
+    monkeypatch.setattr(api_metrics, "instrument_engine", calls.append)
+    assert client.post("/donors", json={"identifier": "d", "amount": 5}).status_code == 201
+    assert calls == []  # attached once by ensure_schema at startup, not on the request path
+
+
+def test_metrics_are_served_when_the_runtime_dir_is_unwritable(
+    client: FlaskClient, tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    (tmp_path / "runtime").write_text("not a directory")  # makedirs / mkstemp / listdir all fail
+    assert client.post("/donors", json={"identifier": "d", "amount": 5}).status_code == 201
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert _value(response.get_data(as_text=True), 'api_request_seconds_count{route="/donors",method="POST",status="201"}') >= 1
+    assert any("Metrics flush to" in r.getMessage() for r in caplog.records)
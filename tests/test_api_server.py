@@ -0,0 +1,115 @@
+"""Overlay API serving: leader lock (overlay_api.leader), gunicorn options (overlay_api.server), Stripe webhook
+dedupe through processed_stripe_events and its retention (overlay_api.app)."""
+
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import pytest
+from flask.testing import FlaskClient
+from sqlalchemy.orm import Session
+
+from config.settings import get_settings
+from overlay_api import app as app_module
+from overlay_api import leader, server
+from overlay_api import metrics as api_metrics
+from stream_workers.db import Donor, ProcessedStripeEvent, get_engine
+
+SECRET = "whsec_test"
+
+
+def test_leader_lock_is_exclusive_and_taken_over_after_release(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("API__LEADER_POLL_SECONDS", "0.5")
+    get_settings.cache_clear()
+    path = str(tmp_path / "runtime" / leader.LOCK_FILE_NAME)
+    first, second = leader.LeaderLock(path), leader.LeaderLock(path)
+    assert first.try_acquire() and first.held
+    assert not second.try_acquire() and not second.held
+    assert first.try_acquire()  # re-entrant for the holder
+
+    started = threading.Event()
+    leader._leader_lock_holder[0] = second
+    try:
+        leader.start_leader_election([started.set])
+        time.sleep(0.2)
+        assert not started.is_set()  # waiting for the lock
+        first.release()
+        assert started.wait(timeout=5) and second.held
+        assert Path(path).read_text().strip().isdigit()  # the holder's pid
+    finally:
+        second.release()
+        leader._leader_lock_holder[0] = None
+        get_settings.cache_clear()
+
+
+def test_gunicorn_options_follow_api_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+    for key, value in {"PORT": "6001", "WORKERS": "4", "THREADS": "16", "KEEPALIVE_SECONDS": "7", "GRACEFUL_TIMEOUT_SECONDS": "12"}.items():
+        monkeypatch.setenv(f"API__{key}", value)
+    monkeypatch.setenv("API__MAX_REQUESTS", "1000")
+    get_settings.cache_clear()
+    try:
+        options = server.gunicorn_options()
+    finally:
+        get_settings.cache_clear()
+    assert options["bind"] == "0.0.0.0:6001"
+    assert (options["worker_class"], options["workers"], options["threads"]) == ("gthread", 4, 16)
+    assert (options["keepalive"], options["graceful_timeout"]) == (7, 12)
+    assert (options["max_requests"], options["max_requests_jitter"]) == (1000, 100)
+    assert options["post_worker_init"] is server._post_worker_init
+
+
+def _post_event(client: FlaskClient, event: dict[str, Any]) -> int:
+    payload = json.dumps(event).encode()
+    ts = int(time.time())
+    signature = hmac.new(SECRET.encode(), f"{ts}.".encode() + payload, hashlib.sha256).hexdigest()
+    response = client.post("/stripe-webhook", data=payload, headers={"Stripe-Signature": f"t={ts},v1={signature}"})
+    return response.status_code
+
+
+def _checkout(event_id: str) -> dict[str, Any]:
+    session = {"id": "cs_1", "object": "checkout.session", "amount_total": 2500, "customer_email": "a@example.com"}
+    return {"id": event_id, "object": "event", "type": "checkout.session.completed", "data": {"object": session}}
+
+
+def _donors() -> int:
+    with Session(get_engine()) as session:
+        return session.query(Donor).count()
+
+
+def test_webhook_events_are_processed_once_even_when_deliveries_race(api_client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("STRIPE__WEBHOOK_SECRET", SECRET)
+    get_settings.cache_clear()
+    assert _post_event(api_client, _checkout("evt_1")) == 200
+    assert _post_event(api_client, _checkout("evt_1")) == 200  # redelivery: seen in processed_stripe_events
+    assert _donors() == 1
+
+    # Another worker commits the same event between this worker's check and its commit: the insert conflicts
+    class RacingSession(Session):
+        def get(self, entity: Any, ident: Any, **kwargs: Any) -> Any:
+            return None if entity is ProcessedStripeEvent else super().get(entity, ident, **kwargs)
+
+    monkeypatch.setattr(app_module, "Session", RacingSession)
+    raced = api_metrics.STRIPE_EVENTS.labels("duplicate_concurrent")
+    before = raced.value
+    assert _post_event(api_client, _checkout("evt_1")) == 200
+    assert _donors() == 1 and raced.value == before + 1
+    assert _post_event(api_client, _checkout("evt_2")) == 200
+    assert _donors() == 2
+
+
+def test_retention_prunes_only_expired_processed_events(api_client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("API__RETENTION_DAYS", "3")
+    get_settings.cache_clear()
+    now = datetime.now(UTC)
+    with Session(get_engine()) as session:
+        session.add(ProcessedStripeEvent(event_id="evt_old", created_at=now - timedelta(days=4)))
+        session.add(ProcessedStripeEvent(event_id="evt_new", created_at=now - timedelta(days=2)))
+        session.commit()
+    assert app_module.prune_processed_stripe_events() == 1
+    with Session(get_engine()) as session:
+        assert [e.event_id for e in session.query(ProcessedStripeEvent)] == ["evt_new"]
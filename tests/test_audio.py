@@ -0,0 +1,116 @@
+"""Output audio track: AAC passthrough, silence, A/V re-anchoring (stream_workers.audio); MPEG-TS output (ts_mux); the pipeline."""
+
+import io
+import math
+from fractions import Fraction
+from pathlib import Path
+
+import av
+from PIL import Image
+
+from stream_workers import encode
+from stream_workers.audio import AAC_FRAME_SAMPLES, AudioFormat, AudioTrack, audio_format, output_format
+from stream_workers.pipeline import Pipeline
+from stream_workers.rtmp_out import OutputPacket
+from stream_workers.ts_mux import TsMuxer
+
+FPS = 30
+
+
+def _write_clip(path: Path, frames: int, audio_codec: str = "aac", sample_rate: int = 48000) -> None:
+    """Static video plus a 440 Hz tone."""
+    with av.open(str(path), "w") as container:
+        video = container.add_stream("libx264", rate=FPS, options={"g": "30", "sc_threshold": "0"})
+        video.width, video.height, video.pix_fmt = 160, 96, "yuv420p"
+        audio = container.add_stream(audio_codec, rate=sample_rate)
+        audio.layout = "stereo"
+        resampler = av.AudioResampler(format=audio.codec_context.format.name, layout="stereo", rate=sample_rate)
+        image = Image.new("RGB", (160, 96), (90, 120, 200))
+        samples = 0
+        for i in range(frames):
+            frame = av.VideoFrame.from_image(image).reformat(format="yuv420p")
+            frame.pts = i
+            container.mux(video.encode(frame))
+            count = (i + 1) * sample_rate // FPS - samples
+            values = [int(8000 * math.sin(2 * math.pi * 440 * (samples + k) / sample_rate)) for k in range(count)]
+            tone = av.AudioFrame(format="s16", layout="stereo", samples=count)
+            tone.planes[0].update(b"".join(v.to_bytes(2, "little", signed=True) * 2 for v in values))
+            tone.sample_rate, tone.pts, tone.time_base = sample_rate, samples, Fraction(1, sample_rate)
+            samples += count
+            for resampled in resampler.resample(tone):
+                container.mux(audio.encode(resampled))
+        container.mux(video.encode(None))
+        container.mux(audio.encode(None))
+
+
+def _source_packets(path: Path) -> tuple[AudioFormat, list[av.Packet]]:
+    with av.open(str(path)) as container:
+        fmt = audio_format(container.streams.audio[0])
+        packets = [p for p in container.demux(audio=0) if p.size]
+    assert fmt is not None
+    return fmt, packets
+
+
+def test_passthrough_stays_contiguous_and_reanchors_on_a_source_jump(tmp_path: Path) -> None:
+    clip = tmp_path / "aac.mp4"
+    _write_clip(clip, 30)
+    fmt, packets = _source_packets(clip)
+    track = AudioTrack(output_format(fmt, 48000, "stereo", 128))
+    assert track.passthrough(fmt)
+
+    out = track.feed(packets, fmt, 0.0, 1.0)
+    assert [bytes(p) for p in out] == [bytes(p) for p in packets]  # untouched, only retimed
+    # The same audio again, as after a switch to a source whose clock restarts at 0: re-anchored to the video at 1 s
+    out += track.feed(packets, fmt, 1.0, 2.0)
+    assert len(out) == 2 * len(packets)
+    assert all(b.pts == a.pts + a.duration for a, b in zip(out, out[1:], strict=False))  # contiguous, nothing overlaps
+    assert abs(track.next_pts / 48000 - 2.0) < 0.1
+
+
+def test_silence_covers_video_without_source_audio() -> None:
+    track = AudioTrack(output_format(None, 48000, "stereo", 128))
+    out = [p for i in range(FPS) for p in track.feed((), None, None, (i + 1) / FPS)]
+    assert len({bytes(p) for p in out}) == 1  # one cached frame, repeated
+    assert 1.0 - AAC_FRAME_SAMPLES / 48000 <= track.next_pts / 48000 <= 1.0
+
+
+def test_pipeline_passes_aac_through_and_transcodes_other_audio(tmp_path: Path) -> None:
+    for codec, sample_rate, passthrough in (("aac", 48000, True), ("mp2", 44100, False)):
+        clip, output = tmp_path / f"in-{codec}.mkv", tmp_path / f"out-{codec}.mkv"
+        _write_clip(clip, 30, codec, sample_rate)
+        pipeline = Pipeline("audio-test", str(clip), [], overlay_profile="none", output_file=str(output), max_frames=75)
+        pipeline.run()
+
+        with av.open(str(output)) as container:
+            assert container.streams.audio[0].codec_context.name == "aac"
+            ends = {}
+            for packet in container.demux():
+                if packet.pts is not None:
+                    ends[packet.stream.type] = float((packet.pts + (packet.duration or 0)) * packet.time_base)
+        assert abs(ends["audio"] - ends["video"]) < 0.25  # both tracks cover the 2.5 s across the input loops
+        assert pipeline.audio_track is not None and pipeline.audio_track.passthrough(_source_packets(clip)[0]) is passthrough
+
+
+def test_ts_muxer_chunks_start_at_keyframes_and_decode_from_there() -> None:
+    enc = encode.create_video_encoder(width=160, height=96, fps=FPS)
+    enc.gop_size = 15
+    track = AudioTrack(output_format(None, 48000, "stereo", 128))
+    muxer = TsMuxer(160, 96, FPS, track.output)
+    image = Image.new("RGB", (160, 96), (90, 120, 200))
+    chunks: list[OutputPacket] = []
+    for i in range(45):
+        frame = av.VideoFrame.from_image(image).reformat(format="yuv420p")
+        frame.pts, frame.time_base = i, enc.time_base
+        for packet in enc.encode(frame):
+            chunks += muxer.mux_video(packet)
+        for packet in track.feed((), None, None, (i + 1) / FPS):
+            chunks += muxer.mux_audio(packet)
+    chunks += muxer.close()
+
+    keyframes = [i for i, chunk in enumerate(chunks) if chunk.keyframe]
+    assert len(keyframes) == 3 and keyframes[0] == 0
+    joined = b"".join(chunk.data for chunk in chunks[keyframes[1] :])  # a destination resyncing at the second keyframe
+    with av.open(io.BytesIO(joined), format="mpegts") as container:
+        packets = [p for p in container.demux(video=0) if p.size]
+        assert packets[0].is_keyframe
+        assert len([f for p in packets for f in p.decode()]) == 30
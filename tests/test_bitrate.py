@@ -0,0 +1,85 @@
+"""Congestion-aware bitrate (stream_workers.bitrate): steps from output backpressure, and the pipeline against a
+throttled local TCP destination."""
+
+from pathlib import Path
+
+import av
+import pytest
+from PIL import Image
+
+from config.settings import EncodingSettings, get_settings
+from stream_workers.bitrate import AdaptiveBitrate
+from stream_workers.pipeline import Pipeline
+from stream_workers.rtmp_out import DestinationStats
+from tests.test_fanout import TcpSink
+
+
+def _stats(write_seconds: float, lag: float = 0.0, backlog_bytes: int = 0) -> DestinationStats:
+    return DestinationStats("tcp://sink:1", True, 0.0, lag, backlog_bytes, 0, 0, 0, 0, 0, write_seconds)
+
+
+def test_steps_down_while_congested_and_probes_back_up_once_drained() -> None:
+    abr = AdaptiveBitrate(4000, floor_k=1000, ceiling_k=4000, congestion_lag_seconds=1.0, probe_seconds=4.0)
+    abr.measure([_stats(0.0)], 0.0)
+    # Writer blocked the whole GOP and the backlog growing: one step down per GOP, never below the floor
+    steps = [abr.update(abr.measure([_stats(2.0 * i, lag=0.5 * i)], 2.0 * i), 2.0 * i) for i in range(1, 7)]
+    assert steps == [3000, 2250, 1687, 1265, 1000, None]
+    # Still congested but the backlog shrinks after the last step: hold
+    assert abr.update(abr.measure([_stats(14.0, lag=2.0)], 14.0), 14.0) is None
+    # Drained (writer mostly idle, nothing queued): up one step after probe_seconds, then again after as long
+    ups = [abr.update(abr.measure([_stats(14.0 + 0.1 * i)], 14.0 + 2.0 * i), 14.0 + 2.0 * i) for i in range(1, 8)]
+    assert ups == [None, None, 1100, None, 1210, None, 1331]
+
+
+def _write_clip(path: Path, frames: int) -> None:
+    """Noisy but temporally coherent video, so the encoder uses whatever bitrate it gets (no scene cuts)."""
+    base = Image.effect_noise((320, 180), 60).convert("RGB")
+    with av.open(str(path), "w") as container:
+        stream = container.add_stream("libx264", rate=30, options={"crf": "10"})
+        stream.width, stream.height, stream.pix_fmt = 320, 180, "yuv420p"
+        for i in range(frames):
+            image = Image.blend(base, Image.effect_noise((320, 180), 60).convert("RGB"), 0.3)
+            frame = av.VideoFrame.from_image(image).reformat(format="yuv420p")
+            frame.pts = i
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode(None))
+
+
+def test_throttled_tcp_output_degrades_bitrate_instead_of_disconnecting(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("WORKER__OUTPUT_SOCKET_BUFFER_BYTES", "16384")  # congestion reaches the FanOut, not the kernel
+    monkeypatch.setenv("WORKER__OUTPUT_WRITE_TIMEOUT_SECONDS", "1")
+    get_settings.cache_clear()
+    clip, recording = tmp_path / "in.mp4", tmp_path / "out.ts"
+    _write_clip(clip, 30)
+    sink = TcpSink(read_delay=0.05)  # ~650 kbit/s for a 2000 kbit/s stream
+    encoding = EncodingSettings(
+        cbr_bitrate_k=2000, gop_frames=10, adaptive_bitrate=True, bitrate_floor_k=200, congestion_lag_seconds=0.5, bitrate_probe_seconds=30
+    )
+    pipeline = Pipeline(
+        "abr-test",
+        str(clip),
+        [sink.url],
+        overlay_profile="none",
+        encoding=encoding,
+        output_file=str(recording),
+        realtime=True,
+        max_seconds=3,
+    )
+    try:
+        pipeline.run()
+        assert pipeline.fanout is not None and pipeline.bitrate is not None
+        stats = pipeline.fanout.stats()[0]
+        assert (stats.connected, stats.reconnects, stats.packets_dropped, sink.connections) == (True, 0, 0, 1)
+        assert 200 <= pipeline.bitrate.bitrate_k <= 1000
+    finally:
+        sink.close()
+        get_settings.cache_clear()
+    # The same encoded stream, recorded locally: continuous, with GOPs shrinking as the bitrate steps down
+    with av.open(str(recording)) as container:
+        gops: list[int] = []
+        for packet in container.demux(video=0):
+            if packet.size:
+                if packet.is_keyframe or not gops:
+                    gops.append(0)
+                gops[-1] += packet.size
+    assert len(gops) == 9 and gops[-1] < gops[0] / 3
@@ -0,0 +1,137 @@
+"""Write coalescing (overlay_api.coalesce): one transaction per burst, shared results, per-request errors and
+window ordering; the coalesced /ranking and PUT /payment-link routes."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import pytest
+from flask.testing import FlaskClient
+from sqlalchemy.orm import Session
+
+from config.settings import get_settings
+from overlay_api import app as app_module
+from overlay_api.coalesce import PendingWrites, WriteCoalescer
+from stream_workers.db import RankingEntry, get_engine
+
+
+def _burst(calls: list[Any], stagger: float = 0.01) -> list[Any]:
+    """Run calls concurrently, started stagger apart; return their results (or exceptions) in call order."""
+
+    def run(call: Any) -> Any:
+        try:
+            return call()
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(len(calls)) as pool:
+        futures = []
+        for call in calls:
+            futures.append(pool.submit(run, call))
+            time.sleep(stagger)
+        return [f.result() for f in futures]
+
+
+def test_burst_is_flushed_once_with_the_latest_state_and_shared_result() -> None:
+    flushed: list[tuple[Any, list[dict[str, Any]], int]] = []
+
+    def flush(pending: PendingWrites) -> dict[str, Any]:
+        flushed.append((pending.ranking, list(pending.payment_link_patches), pending.requests))
+        return {"flush": len(flushed)}
+
+    coalescer = WriteCoalescer(0.2, flush)
+    results = _burst(
+        [
+            lambda: coalescer.submit_ranking([{"position": 1}]),
+            lambda: coalescer.submit_payment_link({"url": "a"}),
+            lambda: coalescer.submit_ranking([{"position": 2}]),
+            lambda: coalescer.submit_payment_link({"url": "b"}),
+        ]
+    )
+    assert flushed == [([{"position": 2}], [{"url": "a"}, {"url": "b"}], 4)]
+    assert results == [{"flush": 1}] * 4
+    assert (coalescer.flushes, coalescer.coalesced_requests) == (1, 4)
+
+
+def test_failing_request_does_not_fail_the_rest_of_its_window() -> None:
+    written: list[Any] = []
+
+    def flush(pending: PendingWrites) -> dict[str, Any]:
+        if any(patch.get("bad") for patch in pending.payment_link_patches):
+            raise ValueError("bad patch")
+        written.append((pending.ranking, pending.payment_link_patches))
+        return {"requests": pending.requests}
+
+    coalescer = WriteCoalescer(0.2, flush)
+    results = _burst(
+        [
+            lambda: coalescer.submit_ranking([{"position": 1}]),
+            lambda: coalescer.submit_payment_link({"bad": True}),
+            lambda: coalescer.submit_payment_link({"url": "ok"}),
+        ]
+    )
+    assert results[0] == {"requests": 1} and results[2] == {"requests": 1}
+    assert isinstance(results[1], ValueError)
+    assert written == [([{"position": 1}], []), (None, [{"url": "ok"}])]  # replayed one by one, in arrival order
+
+
+def test_windows_flush_in_order_even_when_an_earlier_flush_is_slow() -> None:
+    first_flushing = threading.Event()
+    committed: list[Any] = []
+
+    def flush(pending: PendingWrites) -> dict[str, Any]:
+        if not first_flushing.is_set():
+            first_flushing.set()
+            time.sleep(0.3)  # the second window closes while this one is still writing
+        committed.append(pending.ranking)
+        return {}
+
+    coalescer = WriteCoalescer(0.05, flush)
+    with ThreadPoolExecutor(2) as pool:
+        older = pool.submit(coalescer.submit_ranking, [{"position": 1, "v": "old"}])
+        assert first_flushing.wait(timeout=5)
+        newer = pool.submit(coalescer.submit_ranking, [{"position": 1, "v": "new"}])
+        older.result(timeout=5)
+        newer.result(timeout=5)
+    assert committed == [[{"position": 1, "v": "old"}], [{"position": 1, "v": "new"}]]
+
+
+@pytest.fixture
+def coalescing_client(api_client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> FlaskClient:
+    monkeypatch.setenv("API__WRITE_COALESCE_WINDOW_MS", "200")
+    monkeypatch.setenv("API__WORKERS", "1")
+    get_settings.cache_clear()
+    monkeypatch.setattr(app_module, "_coalescer_holder", [None])
+    return api_client
+
+
+def _entry(position: int, name: str) -> dict[str, Any]:
+    return {"position": position, "donor_id": position, "amount": 10.0 * position, "identifier": name}
+
+
+def test_coalesced_routes_validate_each_request_and_write_the_rest(coalescing_client: FlaskClient) -> None:
+    client = coalescing_client
+    results = _burst(
+        [
+            lambda: client.post("/ranking", json={"entries": [_entry(1, "Ana")]}),
+            lambda: client.post("/ranking", json={"entries": [{"position": 1}]}),  # missing fields: rejected up front
+            lambda: client.put("/payment-link", json={"url": "https://pay.example/x", "label": "Pix"}),
+            lambda: client.post("/ranking", json={"entries": [_entry(1, "Bia"), _entry(2, "Caio")]}),
+        ]
+    )
+    assert [r.status_code for r in results] == [200, 400, 200, 200]
+    assert results[2].json == {"url": "https://pay.example/x", "label": "Pix", "active": True}
+    with Session(get_engine()) as session:
+        assert [e.identifier for e in session.query(RankingEntry).order_by(RankingEntry.position)] == ["Bia", "Caio"]
+    coalescer = app_module._coalescer_holder[0]
+    assert coalescer is not None and (coalescer.flushes, coalescer.coalesced_requests) == (1, 3)
+
+
+def test_coalescing_is_refused_with_several_workers(api_client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("API__WRITE_COALESCE_WINDOW_MS", "200")
+    monkeypatch.setenv("API__WORKERS", "4")
+    get_settings.cache_clear()
+    monkeypatch.setattr(app_module, "_coalescer_holder", [None])
+    assert app_module._get_coalescer() is None
+    assert api_client.post("/ranking", json={"entries": [_entry(1, "Ana")]}).status_code == 200
@@ -0,0 +1,189 @@
+"""Fan-out output stage (stream_workers.rtmp_out.FanOut) against local TCP sinks and a stalled FFmpeg stand-in."""
+
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Iterator
+
+import pytest
+
+from stream_workers import rtmp_out
+from stream_workers.rtmp_out import FanOut, OutputPacket
+
+
+class TcpSink:
+    """Local TCP listener; read_delay throttles how fast it consumes."""
+
+    def __init__(self, read_delay: float = 0.0, rcvbuf: int = 4096) -> None:
+        self.read_delay = read_delay
+        self.received = bytearray()
+        self.connections = 0
+        self.paused = threading.Event()
+        self._server = socket.socket()
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self._server.bind(("127.0.0.1", 0))
+        self._server.listen()
+        self.url = f"tcp://127.0.0.1:{self._server.getsockname()[1]}"
+        self._conn: socket.socket | None = None
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            self._conn = conn
+            self.connections += 1
+            while True:
+                while self.paused.is_set():
+                    time.sleep(0.01)
+                try:
+                    chunk = conn.recv(4096)
+                except OSError:
+                    break
+                if not chunk:
+                    break
+                self.received.extend(chunk)
+                if self.read_delay:
+                    time.sleep(self.read_delay)
+
+    def drop_connection(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._conn.close()
+
+    def close(self) -> None:
+        self._server.close()
+        self.drop_connection()
+
+
+@pytest.fixture
+def sinks() -> Iterator[list[TcpSink]]:
+    created: list[TcpSink] = []
+    yield created
+    for sink in created:
+        sink.close()
+
+
+# Large enough that a paused reader stalls the writer after a few dozen packets despite loopback socket buffers
+PACKET_SIZE = 20_000
+
+
+def _packet(i: int) -> OutputPacket:
+    return OutputPacket(data=i.to_bytes(4, "big") * (PACKET_SIZE // 4), keyframe=i % 30 == 0)
+
+
+def _wait_for(cond: object, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():  # type: ignore[operator]
+            return
+        time.sleep(0.02)
+    raise AssertionError("condition not met")
+
+
+def test_slow_destination_does_not_block_sender_or_others(sinks: list[TcpSink]) -> None:
+    fast = TcpSink()
+    slow = TcpSink()
+    slow.paused.set()
+    sinks += [fast, slow]
+    fanout = FanOut([fast.url, slow.url], max_buffer_bytes=200_000, write_timeout=1.0, backoff_initial=0.05)
+    try:
+        _wait_for(lambda: all(s.connected for s in fanout.stats()))
+        blocked = 0.0
+        for i in range(300):
+            start = time.monotonic()
+            fanout.send(_packet(i))
+            blocked = max(blocked, time.monotonic() - start)
+            time.sleep(0.002)
+        assert blocked < 0.05
+        _wait_for(lambda: len(fast.received) == 300 * PACKET_SIZE, timeout=10)
+        fast_stats, slow_stats = fanout.stats()
+        assert fast_stats.packets_dropped == 0
+        assert slow_stats.packets_dropped > 0
+        assert slow_stats.backlog_bytes <= 200_000
+    finally:
+        fanout.close()
+
+
+def test_resync_after_stall_starts_at_keyframe(sinks: list[TcpSink]) -> None:
+    sink = TcpSink()
+    sink.paused.set()
+    sinks.append(sink)
+    fanout = FanOut([sink.url], max_buffer_bytes=100_000, write_timeout=2.0, backoff_initial=0.05)
+    try:
+        _wait_for(lambda: fanout.stats()[0].connected)
+        for i in range(400):
+            fanout.send(_packet(i))
+            time.sleep(0.001)
+        sink.paused.clear()
+        _wait_for(lambda: fanout.stats()[0].backlog_bytes == 0, timeout=10)
+        time.sleep(0.1)
+        data = bytes(sink.received)
+        # Everything delivered after the stall resumes on packet boundaries at a keyframe (i % 30 == 0)
+        ids = [int.from_bytes(data[o : o + 4], "big") for o in range(0, len(data), PACKET_SIZE)]
+        gaps = [b for a, b in zip(ids, ids[1:], strict=False) if b != a + 1]
+        assert gaps and all(b % 30 == 0 for b in gaps)
+    finally:
+        fanout.close()
+
+
+def test_reconnects_after_destination_drops(sinks: list[TcpSink]) -> None:
+    sink = TcpSink()
+    sinks.append(sink)
+    fanout = FanOut([sink.url], backoff_initial=0.05, write_timeout=1.0)
+    try:
+        _wait_for(lambda: fanout.stats()[0].connected and sink.connections == 1)
+        sink.drop_connection()
+        for i in range(1, 200):
+            fanout.send(_packet(i))
+            time.sleep(0.005)
+        _wait_for(lambda: sink.connections >= 2 and fanout.stats()[0].reconnects >= 1)
+        before = len(sink.received)
+        fanout.send(_packet(300))
+        _wait_for(lambda: len(sink.received) > before)
+    finally:
+        fanout.close()
+
+
+def _stalled_ffmpeg(started: list[subprocess.Popen[bytes]]) -> object:
+    """start_rtmp_process stand-in: a process that never reads stdin, like FFmpeg stuck on a dead RTMP server."""
+
+    def start(rtmp_url: str, input_format: str = "h264") -> subprocess.Popen[bytes]:
+        proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"], stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        started.append(proc)
+        return proc
+
+    return start
+
+
+def test_stalled_ffmpeg_is_killed_after_write_timeout_and_reconnected(monkeypatch: pytest.MonkeyPatch) -> None:
+    started: list[subprocess.Popen[bytes]] = []
+    monkeypatch.setattr(rtmp_out, "start_rtmp_process", _stalled_ffmpeg(started))
+    sink = rtmp_out.open_sink("rtmp://live/key", timeout=0.3)
+    began = time.monotonic()
+    with pytest.raises(TimeoutError):
+        for _ in range(100):  # fills the pipe buffer, then blocks
+            sink.write(bytes(PACKET_SIZE))
+    assert time.monotonic() - began < 2.0
+    assert started[0].wait(timeout=5) is not None
+    sink.close()
+
+    fanout = FanOut(["rtmp://live/key"], backoff_initial=0.05, write_timeout=0.3)
+    try:
+        for i in range(200):
+            fanout.send(_packet(i))
+            time.sleep(0.005)
+        _wait_for(lambda: fanout.stats()[0].reconnects >= 1 and len(started) >= 3)
+        assert started[1].wait(timeout=5) is not None  # the stalled process was killed, not leaked
+    finally:
+        fanout.close()
+        for proc in started:
+            proc.kill()
+            proc.wait()
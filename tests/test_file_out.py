@@ -0,0 +1,43 @@
+"""Headless output: Pipeline into a local file with a frame limit (stream_workers.file_out)."""
+
+from pathlib import Path
+
+import av
+from PIL import Image
+
+from stream_workers.file_out import summarize_run
+from stream_workers.pipeline import Pipeline
+
+
+def _write_clip(path: Path, frames: int) -> None:
+    with av.open(str(path), "w") as container:
+        stream = container.add_stream("libx264", rate=30)
+        stream.width, stream.height, stream.pix_fmt = 160, 96, "yuv420p"
+        image = Image.new("RGB", (160, 96), (90, 120, 200))  # static content: no scene cuts for x264 to key on
+        for i in range(frames):
+            frame = av.VideoFrame.from_image(image).reformat(format="yuv420p")
+            frame.pts = i
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode(None))
+
+
+def test_pipeline_writes_frame_limited_file_across_input_loops(tmp_path: Path) -> None:
+    clip, output = tmp_path / "in.mp4", tmp_path / "out.mp4"
+    _write_clip(clip, 20)
+    pipeline = Pipeline("file-test", str(clip), [], overlay_profile="none", output_file=str(output), max_frames=45)
+    pipeline.run()
+
+    with av.open(str(output)) as container:
+        keyframes = sum(1 for packet in container.demux(video=0) if packet.is_keyframe)
+    with av.open(str(output)) as container:
+        pts = [frame.pts for frame in container.decode(video=0)]
+    assert pipeline.frames == 45
+    assert keyframes == 1  # one encoder across the input loops, source I frames not forwarded: no IDR per loop
+    assert len(pts) == 45
+    assert pts == sorted(pts) and len(set(pts)) == 45
+    assert pipeline.file_output is not None and pipeline.file_output.packets == 45
+
+
+def test_run_summary_ratios() -> None:
+    summary = summarize_run(frames=300, fps=30, wall_seconds=5.0, cpu_seconds=4.0, frames_dropped=1, packets_dropped=2, bytes_written=10)
+    assert (summary.output_seconds, summary.fps, summary.speed, summary.cpu_per_output_second) == (10.0, 60.0, 2.0, 0.4)
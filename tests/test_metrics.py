@@ -0,0 +1,77 @@
+"""Worker metrics (stream_workers.metrics) and the admin /metrics endpoint (stream_workers.admin)."""
+
+import threading
+import urllib.request
+
+from stream_workers import metrics
+from stream_workers.admin import PROMETHEUS_CONTENT_TYPE, AdminServer, metrics_route
+
+
+def test_histogram_renders_cumulative_buckets_and_sums_series_reported_twice() -> None:
+    registry = metrics.Registry()
+    latency = metrics.Histogram("test_seconds", "Test latency.", ("stage",), buckets=(0.01, 0.1), registry=registry)
+    latency.labels("encode").observe(0.005)
+    latency.labels("encode").observe(0.05)
+    latency.labels("encode").observe(3.0)
+    other = metrics.Registry()
+    frames = metrics.Counter("test_frames_total", "Frames.", ("stream",), registry=other)
+    frames.labels('a"b').inc(2)
+    queued = metrics.Gauge("test_queue_frames", "Queued.", registry=other)
+    queued.labels().set(3)
+    earlier = other.collect()
+    queued.labels().set(1)
+
+    text = metrics.render(registry.collect() + earlier + other.collect())
+
+    assert text.splitlines() == [
+        "# HELP test_seconds Test latency.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="encode",le="0.01"} 1',
+        'test_seconds_bucket{stage="encode",le="0.1"} 2',
+        'test_seconds_bucket{stage="encode",le="+Inf"} 3',
+        'test_seconds_sum{stage="encode"} 3.055',
+        'test_seconds_count{stage="encode"} 3',
+        "# HELP test_frames_total Frames.",
+        "# TYPE test_frames_total counter",
+        'test_frames_total{stream="a\\"b"} 4',
+        "# HELP test_queue_frames Queued.",
+        "# TYPE test_queue_frames gauge",
+        "test_queue_frames 1",
+    ]
+
+
+def test_child_updates_and_collect_share_the_metric_lock() -> None:
+    registry = metrics.Registry()
+    family = metrics.Histogram("test_seconds", "Latency.", buckets=(0.5,), registry=registry)
+    latency = family.labels()
+    with family._lock:  # what collect() holds while it reads buckets, sum and count
+        observer = threading.Thread(target=latency.observe, args=(1.0,))
+        observer.start()
+        observer.join(timeout=0.1)
+        assert observer.is_alive() and latency.count == 0  # a request thread's update waits for the snapshot
+    observer.join(timeout=5)
+    samples = {s.suffix: s.value for s in registry.collect()[0].samples if "le" not in dict(s.labels)}
+    assert samples == {"_sum": 1.0, "_count": 1}
+
+
+def test_admin_server_serves_metrics_with_collectors_and_extra_families() -> None:
+    metrics.FPS.labels("admin-test").set(0.0)
+
+    def collector() -> None:
+        metrics.FPS.labels("admin-test").set(29.5)
+
+    extra = metrics.MetricFamily("test_child_up", "gauge", "From a child process.", (metrics.Sample("", (), 1.0),))
+    metrics.REGISTRY.add_collector(collector)
+    server = AdminServer("127.0.0.1", 0, {"/metrics": metrics_route(lambda: [extra])})
+    server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"] == PROMETHEUS_CONTENT_TYPE
+            body = response.read().decode()
+    finally:
+        server.close()
+        metrics.REGISTRY.remove_collector(collector)
+        metrics.FPS.remove("admin-test")
+    assert 'worker_fps{stream="admin-test"} 29.5' in body
+    assert "# TYPE worker_stage_seconds histogram" in body
+    assert "test_child_up 1" in body
@@ -0,0 +1,41 @@
+"""Overlay read cache (overlay_api.cache): ETag / 304 on the read routes, invalidation on writes and across workers."""
+
+from pathlib import Path
+
+from flask.testing import FlaskClient
+
+from overlay_api.cache import OverlayStateCache, get_overlay_cache
+
+
+def test_read_routes_answer_304_until_a_write_changes_the_state(api_client: FlaskClient) -> None:
+    first = api_client.get("/overlay")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and first.json is not None and first.json["ranking"] == []
+    assert api_client.get("/overlay", headers={"If-None-Match": etag}).status_code == 304
+    link = api_client.get("/payment-link")
+    assert api_client.get("/payment-link", headers={"If-None-Match": link.headers["ETag"]}).status_code == 304
+
+    assert api_client.put("/payment-link", json={"url": "https://pay.example/x", "label": "Pix"}).status_code == 200
+    changed = api_client.get("/overlay", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert changed.json is not None and changed.json["payment_link"]["url"] == "https://pay.example/x"
+    assert api_client.get("/payment-link", headers={"If-None-Match": link.headers["ETag"]}).status_code == 200
+
+    ranking = [{"position": 1, "donor_id": 1, "amount": 10.0, "identifier": "Ana"}]
+    assert api_client.post("/ranking", json={"entries": ranking}).status_code == 200
+    after = api_client.get("/overlay", headers={"If-None-Match": changed.headers["ETag"]})
+    assert after.status_code == 200 and after.json is not None and after.json["ranking"][0]["identifier"] == "Ana"
+
+
+def test_invalidation_reaches_other_workers_through_a_monotonic_generation(api_client: FlaskClient, tmp_path: Path) -> None:
+    this_worker = get_overlay_cache()
+    other_worker = OverlayStateCache(str(tmp_path / "runtime"))
+    other_worker.get()
+    other_worker.get()
+    assert (other_worker.misses, other_worker.hits) == (1, 1)
+
+    for expected in (1, 2, 3):
+        this_worker.invalidate()
+        assert (tmp_path / "runtime" / "overlay.generation").read_text().strip() == str(expected)
+        other_worker.get()
+        assert other_worker.misses == 1 + expected  # every write is seen, even when the file is replaced in the same tick
@@ -0,0 +1,71 @@
+"""Overlay renderer process (stream_workers.overlay_renderer.OverlayRenderer)."""
+
+import os
+import signal
+import time
+from collections.abc import Iterator
+
+import pytest
+
+from stream_workers import overlay
+from stream_workers.overlay_renderer import OverlayRenderer, OverlaySnapshot
+from stream_workers.overlay_shm import OverlaySegment
+
+
+@pytest.fixture
+def renderer() -> Iterator[OverlayRenderer]:
+    r = OverlayRenderer(["full", "alerts", "none"], 320, 240)
+    r.start()
+    yield r
+    r.close()
+
+
+def _snapshot(n: int) -> OverlaySnapshot:
+    return ([{"position": 1, "identifier": f"Donor{n}", "amount": n}], [{"message": f"alert {n}"}], None)
+
+
+def _tile_bytes(segment: OverlaySegment) -> tuple[int, bytes | None]:
+    return segment.read(lambda tile, version: (version, tile.tobytes() if tile is not None else None))
+
+
+def _wait_for_tile(segment: OverlaySegment, expected: bytes, timeout: float = 10.0) -> int:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        version, data = _tile_bytes(segment)
+        if data == expected:
+            return version
+        time.sleep(0.01)
+    raise AssertionError("renderer did not publish the expected tile")
+
+
+def _expected(snapshot: OverlaySnapshot, profile: str) -> bytes:
+    state = overlay.OverlayState()
+    state.update(*snapshot)
+    layer = overlay.render_overlay_layer(state, profile)
+    assert layer is not None
+    return layer.tobytes()
+
+
+def test_renders_latest_snapshot_per_profile(renderer: OverlayRenderer) -> None:
+    full, alerts = renderer.segment("full"), renderer.segment("alerts")
+    assert full is not None and alerts is not None and renderer.segment("none") is None
+    for n in range(5):
+        renderer.submit(_snapshot(n))
+    _wait_for_tile(full, _expected(_snapshot(4), "full"))
+    _wait_for_tile(alerts, _expected(_snapshot(4), "alerts"))
+
+
+def test_restarts_and_republishes_after_crash(renderer: OverlayRenderer) -> None:
+    segment = renderer.segment("full")
+    assert segment is not None
+    renderer.submit(_snapshot(1))
+    version = _wait_for_tile(segment, _expected(_snapshot(1), "full"))
+    pid = renderer._process.pid  # type: ignore[union-attr]
+    assert pid is not None
+    os.kill(pid, signal.SIGKILL)
+    deadline = time.monotonic() + 10
+    while segment.version == version and time.monotonic() < deadline:
+        renderer.ensure_running()
+        time.sleep(0.05)
+    assert segment.version > version
+    assert _tile_bytes(segment)[1] == _expected(_snapshot(1), "full")
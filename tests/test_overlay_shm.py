@@ -0,0 +1,118 @@
+"""Shared-memory overlay tile (stream_workers.overlay_shm.OverlaySegment) and how the pipeline blends from it."""
+
+import os
+from collections.abc import Callable, Iterator
+from typing import TypeVar
+
+import av
+import pytest
+from PIL import Image
+
+from stream_workers.frame_pool import YuvTile, plane_view
+from stream_workers.overlay_shm import READ_ATTEMPTS, OverlaySegment, TornRead
+from stream_workers.pipeline import Pipeline
+
+T = TypeVar("T")
+
+
+@pytest.fixture
+def segment() -> Iterator[OverlaySegment]:
+    seg = OverlaySegment.create(f"overlay-test-{os.getpid()}", 64, 32)
+    yield seg
+    seg.close()
+
+
+def test_reader_sees_latest_tile_cropped_to_capacity(segment: OverlaySegment) -> None:
+    reader = OverlaySegment.attach(segment.name)
+    try:
+        assert reader.read(lambda tile, version: (tile, version)) == (None, 0)
+        segment.publish(Image.new("RGBA", (100, 10), (255, 0, 0, 200)))
+        size, pixel, version = reader.read(lambda tile, version: (tile.size, tile.getpixel((0, 0)), version))  # type: ignore[union-attr]
+        assert (size, pixel, version) == ((64, 10), (255, 0, 0, 200), 1)
+        segment.publish(None)
+        assert reader.read(lambda tile, version: (tile, version)) == (None, 2)
+    finally:
+        reader.close()
+
+
+def test_read_retries_when_its_buffer_is_overwritten(segment: OverlaySegment) -> None:
+    segment.publish(Image.new("RGBA", (8, 8), (1, 1, 1, 255)))
+    seen: list[int] = []
+
+    def consume(tile: Image.Image | None, version: int) -> int:
+        seen.append(version)
+        if len(seen) == 1:
+            # Two publishes while the reader holds buffer 1: the second one rewrites it
+            segment.publish(Image.new("RGBA", (8, 8), (2, 2, 2, 255)))
+            segment.publish(Image.new("RGBA", (8, 8), (3, 3, 3, 255)))
+        assert tile is not None
+        return int(tile.getpixel((0, 0))[0])  # type: ignore[index]
+
+    assert segment.read(consume) == 3
+    assert seen == [1, 3]
+
+
+WHITE_HALF = (255, 255, 255, 128)
+
+
+class RacingSegment(OverlaySegment):
+    """Reader whose first `torn` read attempts each see two publishes (the second into the buffer being read)."""
+
+    def __init__(self, owner: OverlaySegment, torn: int) -> None:
+        super().__init__(owner._shm, owner=False)
+        self.owner = owner
+        self.torn = torn
+        self.attempts = 0
+
+    def read(self, consume: Callable[[Image.Image | None, int], T]) -> T:
+        def racing(tile: Image.Image | None, version: int) -> T:
+            self.attempts += 1
+            result = consume(tile, version)
+            if self.attempts <= self.torn:
+                for _ in range(2):
+                    self.owner.publish(Image.new("RGBA", (8, 8), WHITE_HALF))
+            return result
+
+        return super().read(racing)
+
+
+def test_read_gives_up_after_read_attempts_torn_reads(segment: OverlaySegment) -> None:
+    segment.publish(Image.new("RGBA", (8, 8), (1, 1, 1, 255)))
+    reader = RacingSegment(segment, torn=READ_ATTEMPTS)
+    with pytest.raises(TornRead):
+        reader.read(lambda tile, version: version)
+    assert reader.attempts == READ_ATTEMPTS
+
+
+def _black_frame() -> av.VideoFrame:
+    frame = av.VideoFrame(32, 16, "yuv420p")
+    for plane, value in zip(frame.planes, (0, 128, 128), strict=True):
+        plane_view(plane).paste(value, (0, 0, plane.width, plane.height))
+    return frame
+
+
+def _luma(frame: av.VideoFrame) -> int:
+    return int(plane_view(frame.planes[0]).getpixel((0, 0)))  # type: ignore[arg-type]
+
+
+def test_pipeline_blends_once_per_frame_and_never_caches_a_torn_tile(segment: OverlaySegment) -> None:
+    once = _black_frame()
+    YuvTile.from_image(Image.new("RGBA", (8, 8), WHITE_HALF)).blend([plane_view(plane) for plane in once.planes])
+    segment.publish(Image.new("RGBA", (8, 8), (0, 0, 0, 255)))
+    # One torn attempt: the retry converts the newer tile; the frame is blended once, with that tile
+    reader = RacingSegment(segment, torn=1)
+    pipeline = Pipeline("shm-test", "unused", [], overlay_segment=reader)
+    frame = pipeline._apply_overlay(_black_frame(), writable=True)
+    assert reader.attempts == 2 and _luma(frame) == _luma(once) > 16  # half-white pasted once, not twice
+    assert pipeline._tiles.version == segment.version == 3
+
+    # Every attempt torn: the frame gets the last good tile and the cache keeps its version
+    reader.attempts, reader.torn = 0, READ_ATTEMPTS
+    segment.publish(Image.new("RGBA", (8, 8), (0, 0, 0, 255)))
+    frame = pipeline._apply_overlay(_black_frame(), writable=True)
+    assert reader.attempts == READ_ATTEMPTS and _luma(frame) == _luma(once)
+    assert pipeline._tiles.version == 3
+
+    reader.torn = 0  # the renderer settles: the next frame picks up the latest tile
+    frame = pipeline._apply_overlay(_black_frame(), writable=True)
+    assert pipeline._tiles.version == segment.version == 10 and _luma(frame) == _luma(once)
@@ -0,0 +1,65 @@
+"""Pipeline frame path: frames from a source with another geometry are rescaled to the encoder's; the overlay is
+blended on pooled frames without per-frame Python allocations; per-frame stage timers add up."""
+
+import time
+import tracemalloc
+from fractions import Fraction
+
+import av
+from PIL import Image
+
+from stream_workers import overlay
+from stream_workers.pipeline import Pipeline
+
+
+def test_frames_are_rescaled_to_the_established_encoder_geometry() -> None:
+    pipeline = Pipeline("rescale-test", "unused.mp4", [], overlay_profile="none")
+    enc = pipeline._open_encoder(160, 96)
+    frame = av.VideoFrame(320, 180, "yuvj420p")
+    frame.pts, frame.time_base = 7, Fraction(1, 30)
+
+    out = pipeline._fit(frame, enc)
+    same = pipeline._fit(out, enc)
+
+    assert (out.width, out.height, out.format.name, out.pts) == (160, 96, "yuv420p", 7)
+    assert same is out
+
+
+def test_overlay_is_blended_on_pooled_frames_without_per_frame_allocations() -> None:
+    state = overlay.OverlayState()
+    state.update([{"identifier": "Donor", "amount": 10}], [])
+    pipeline = Pipeline("pool-test", "unused.mp4", [], overlay_state=state)
+    enc = pipeline._open_encoder(640, 360)
+    source = av.VideoFrame.from_image(Image.new("RGB", (640, 360), (90, 120, 200))).reformat(format="yuv420p")
+    decoded = bytes(source.planes[0])
+    outputs = {id(pipeline._apply_overlay(source)) for _ in range(4)}
+
+    for _ in range(10):  # warm up: tile conversion, encoder lookahead
+        pipeline._process_frame(enc, source, time.perf_counter(), 0.0, 0.0)
+    deadline = time.monotonic() + 5
+    while pipeline.preview is not None and pipeline.preview.latest is None and time.monotonic() < deadline:
+        time.sleep(0.01)  # the preview thread's first encode imports Pillow's image plugins (process-wide allocations)
+    tracemalloc.start()
+    peaks = []
+    for _ in range(30):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        pipeline._process_frame(enc, source, time.perf_counter(), 0.0, 0.0)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    assert bytes(source.planes[0]) == decoded  # the decoder's frame is never drawn on
+    assert bytes(pipeline._apply_overlay(source).planes[0]) != decoded
+    assert pipeline.frame_pool is not None and len(outputs) == 2  # the pool's frames, reused
+    assert max(peaks) < 16 * 1024  # a 640x360 frame copy alone would be 345 KB
+
+
+def test_stage_timers_accumulate_over_a_frame() -> None:
+    state = overlay.OverlayState()
+    state.update([{"identifier": "Donor", "amount": 10}], [])
+    pipeline = Pipeline("timer-test", "unused.mp4", [], overlay_state=state)
+    source = av.VideoFrame.from_image(Image.new("RGB", (640, 360), (90, 120, 200))).reformat(format="yuv420p")
+    pipeline._apply_overlay(source)  # converts the tile once
+    pipeline._scale_seconds = pipeline._overlay_seconds = 1.0  # time spent earlier in the same frame
+    pipeline._apply_overlay(source)
+    assert pipeline._scale_seconds > 1.0 and pipeline._overlay_seconds > 1.0  # added to, like every stage total
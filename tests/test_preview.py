@@ -0,0 +1,80 @@
+"""Output preview (stream_workers.preview): taken from the pipeline off the frame path, served on the admin endpoint
+and proxied by the overlay API."""
+
+import io
+import time
+from pathlib import Path
+
+import av
+import pytest
+from PIL import Image
+
+from config.settings import get_settings
+from overlay_api.app import app
+from stream_workers import file_out, overlay
+from stream_workers.admin import AdminServer
+from stream_workers.frame_pool import FramePool
+from stream_workers.pipeline import Pipeline
+from stream_workers.preview import PreviewEncoder, preview_route
+
+
+def _write_clip(path: Path, frames: int) -> None:
+    with av.open(str(path), "w") as container:
+        stream = container.add_stream("libx264", rate=30)
+        stream.width, stream.height, stream.pix_fmt = 640, 360, "yuv420p"
+        image = Image.new("RGB", (640, 360), (90, 120, 200))
+        for i in range(frames):
+            frame = av.VideoFrame.from_image(image).reformat(format="yuv420p")
+            frame.pts = i
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode(None))
+
+
+def test_pipeline_publishes_downscaled_previews_of_the_composited_output(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("WORKER__PREVIEW_INTERVAL_SECONDS", "0.01")
+    get_settings.cache_clear()
+    clip = tmp_path / "in.mp4"
+    _write_clip(clip, 30)
+    state = overlay.OverlayState()
+    state.update([{"identifier": "Donor", "amount": 10}], [])
+    pipeline = Pipeline("preview-test", str(clip), [], overlay_state=state, output_file=file_out.NULL_OUTPUT, max_frames=60)
+    pipeline.run()
+    get_settings.cache_clear()
+
+    assert pipeline.preview is not None and pipeline.preview.latest is not None
+    preview = pipeline.preview.latest
+    image = Image.open(io.BytesIO(preview.data))
+    assert (image.format, image.size, preview.content_type) == ("JPEG", (320, 180), "image/jpeg")
+    assert image.getpixel((5, 5)) != image.getpixel((300, 170))  # overlay corner vs plain background
+
+
+def test_detached_pool_frames_are_never_handed_out_again() -> None:
+    pool = FramePool(64, 32)
+    taken, _ = pool.acquire()
+    pool.detach(taken)
+    assert all(pool.acquire()[0] is not taken for _ in range(4))
+
+
+def test_admin_preview_is_proxied_by_the_overlay_api(monkeypatch: pytest.MonkeyPatch) -> None:
+    encoder = PreviewEncoder(1.0, width=64)
+    frame = av.VideoFrame.from_image(Image.new("RGB", (128, 72), (200, 30, 30))).reformat(format="yuv420p")
+    server = AdminServer("127.0.0.1", 0, {"/preview": preview_route(encoder)})
+    server.start()
+    try:
+        monkeypatch.setenv("API__WORKER_ADMIN_URL", f"http://127.0.0.1:{server.port}")
+        get_settings.cache_clear()
+        client = app.test_client()
+        assert client.get("/preview").status_code == 404  # nothing taken yet
+
+        encoder.submit(frame, 1)
+        deadline = time.monotonic() + 5
+        while encoder.latest is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        response = client.get("/preview")
+        assert response.status_code == 200 and response.content_type == "image/jpeg"
+        assert encoder.latest is not None and response.data == encoder.latest.data
+        assert Image.open(io.BytesIO(response.data)).size == (64, 36)
+    finally:
+        encoder.close()
+        server.close()
+        get_settings.cache_clear()
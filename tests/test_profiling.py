@@ -0,0 +1,73 @@
+"""On-demand diagnostics (stream_workers.profiling): frame-timing ring buffer and stack sampling."""
+
+import threading
+import time
+from pathlib import Path
+
+from stream_workers.pipeline import Pipeline
+from stream_workers.profiling import FRAME_FIELDS, FrameTimings, collapsed, profile_to_file, sample_stacks
+from tests.test_file_out import _write_clip
+
+
+def test_frame_timings_keep_the_last_frames_oldest_first() -> None:
+    timings = FrameTimings(3)
+    for i in range(5):
+        timings.record(*(float(i),) * len(FRAME_FIELDS))
+    assert len(timings) == 3
+    assert [row[0] for row in timings.rows()] == [2.0, 3.0, 4.0]
+    assert [row[0] for row in timings.rows(last=2)] == [3.0, 4.0]
+    lines = timings.csv(last=1).splitlines()
+    assert lines[0] == ",".join(FRAME_FIELDS) and lines[1].startswith("4.000000,")
+
+
+def _busy_encode(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sample_stacks_collapses_the_other_threads() -> None:
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_encode, args=(stop,), name="pipeline-test")
+    worker.start()
+    try:
+        counts = sample_stacks(0.2, 0.005)
+    finally:
+        stop.set()
+        worker.join()
+    busy = {stack: n for stack, n in counts.items() if stack.startswith("pipeline-test;")}
+    assert busy and all("test_profiling.py:_busy_encode" in stack for stack in busy)
+    assert collapsed(counts).splitlines()[0].rsplit(" ", 1)[1].isdigit()
+
+
+def test_profile_samples_only_the_given_threads(tmp_path: Path) -> None:
+    stop = threading.Event()
+    workers = [threading.Thread(target=_busy_encode, args=(stop,), name=name) for name in ("pipeline-test", "admin-test")]
+    for worker in workers:
+        worker.start()
+    try:
+        counts = profile_to_file(str(tmp_path / "p.collapsed"), 0.2, 0.005, thread_ids=lambda: {workers[0].ident or 0})
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+    assert counts and {stack.split(";", 1)[0] for stack in counts} == {"pipeline-test"}
+    assert (tmp_path / "p.collapsed").read_text() == collapsed(counts)
+
+
+def test_pipeline_reports_its_frame_loop_and_input_reader_threads(tmp_path: Path) -> None:
+    clip = tmp_path / "in.mp4"
+    _write_clip(clip, 10)
+    pipeline = Pipeline("profile-test", str(clip), [], overlay_profile="none", realtime=True)
+    assert pipeline.thread_ids() == set()
+    runner = threading.Thread(target=pipeline.run, name="pipeline-run")
+    runner.start()
+    try:
+        deadline = time.monotonic() + 10
+        while pipeline.frames == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        names = {t.ident: t.name for t in threading.enumerate()}
+        assert {names.get(ident) for ident in pipeline.thread_ids()} == {"pipeline-run", "input-0"}
+    finally:
+        pipeline.stop()
+        runner.join(timeout=10)
+    assert pipeline.thread_ids() == set()
@@ -0,0 +1,83 @@
+"""Diff-based Nginx push config updates (overlay_api.youtube.apply_push_urls)."""
+
+import threading
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from config.settings import get_settings
+from overlay_api import youtube
+
+
+@pytest.fixture
+def push_conf(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Path]:
+    path = tmp_path / "youtube_push.conf"
+    monkeypatch.setenv("YOUTUBE__PUSH_CONF_PATH", str(path))
+    get_settings.cache_clear()
+    yield path
+    get_settings.cache_clear()
+
+
+@pytest.fixture
+def reloads(monkeypatch: pytest.MonkeyPatch) -> list[int]:
+    calls: list[int] = []
+    monkeypatch.setattr(youtube, "reload_nginx", lambda: calls.append(1))
+    return calls
+
+
+def test_reload_only_when_url_set_changes(push_conf: Path, reloads: list[int]) -> None:
+    diff = youtube.apply_push_urls(["rtmp://a/1", "rtmp://b/2"])
+    assert diff.added == ("rtmp://a/1", "rtmp://b/2") and len(reloads) == 1
+    assert youtube.read_push_conf() == ["rtmp://a/1", "rtmp://b/2"]
+
+    diff = youtube.apply_push_urls(["rtmp://b/2", "rtmp://a/1"])
+    assert not diff.changed and len(reloads) == 1
+
+    diff = youtube.apply_push_urls(["rtmp://a/1", "rtmp://c/3"])
+    assert diff.added == ("rtmp://c/3",) and diff.removed == ("rtmp://b/2",)
+    assert len(reloads) == 2
+    assert list(push_conf.parent.iterdir()) == [push_conf]
+
+
+def test_control_mode_adds_and_drops_without_reload(push_conf: Path, reloads: list[int], monkeypatch: pytest.MonkeyPatch) -> None:
+    requests: list[str] = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            requests.append(self.path)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args: object) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        push_conf.write_text("push rtmp://a/1;\npush rtmp://b/2;\n")
+        monkeypatch.setenv("YOUTUBE__PUSH_CONTROL_URL", f"http://127.0.0.1:{server.server_port}/control")
+        get_settings.cache_clear()
+
+        diff = youtube.apply_push_urls(["rtmp://a/1", "rtmp://c/3"])
+
+        assert diff.applied and reloads == []
+        assert requests == [
+            "/control/push/drop?app=out&url=rtmp%3A%2F%2Fb%2F2",
+            "/control/push/add?app=out&url=rtmp%3A%2F%2Fc%2F3",
+        ]
+        assert youtube.read_push_conf() == ["rtmp://a/1", "rtmp://c/3"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_control_failure_falls_back_to_reload(push_conf: Path, reloads: list[int], monkeypatch: pytest.MonkeyPatch) -> None:
+    push_conf.write_text("push rtmp://a/1;\n")
+    monkeypatch.setenv("YOUTUBE__PUSH_CONTROL_URL", "http://127.0.0.1:9/control")
+    get_settings.cache_clear()
+
+    youtube.apply_push_urls(["rtmp://b/2"])
+
+    assert len(reloads) == 1
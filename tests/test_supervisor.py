@@ -0,0 +1,120 @@
+"""Multi-stream supervisor: CPU assignment, per-stream encoding overrides, and supervising stand-in pipeline processes
+(restart with backoff, status and metrics through the queue, clean shutdown)."""
+
+import queue
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from config.settings import EncodingSettings, StreamDefinition, WorkerSettings
+from stream_workers import metrics
+from stream_workers.pipeline import PipelineStats
+from stream_workers.supervisor import Supervisor, assign_cpus
+
+
+def _stream(name: str, cpus: list[int] | None = None) -> StreamDefinition:
+    return StreamDefinition(name=name, input_url=f"/media/{name}.mp4", cpus=cpus or [])
+
+
+def test_assign_cpus_round_robin_keeps_explicit_pins() -> None:
+    definitions = [_stream("a"), _stream("b", [6, 7]), _stream("c"), _stream("d")]
+    assert assign_cpus(definitions, [0, 1, 2]) == [[0], [6, 7], [2], [0]]
+
+
+def test_encoding_overrides_apply_on_top_of_defaults() -> None:
+    stream = StreamDefinition(name="a", input_url="x", encoding={"cbr_bitrate_k": 2500, "fps": 60})
+    enc = stream.encoding_settings(EncodingSettings())
+    assert (enc.cbr_bitrate_k, enc.fps, enc.gop_frames) == (2500, 60, 60)
+
+
+def test_streams_file_is_read_when_streams_unset(tmp_path: Path) -> None:
+    path = tmp_path / "streams.json"
+    path.write_text('[{"name": "a", "input_url": "rtsp://cam/a", "output_urls": ["rtmp://x/out/a"]}]')
+    assert [d.name for d in WorkerSettings(streams_file=str(path)).stream_definitions()] == ["a"]
+
+
+def _stand_in_pipeline(definition: StreamDefinition, cpus: list[int], segment_name: str | None, status_queue: Any, control: Any) -> None:
+    """Pipeline process stand-in: "crash" exits with code 3 at once; others report stats every 50 ms until SIGTERM."""
+    if definition.name == "crash":
+        sys.exit(3)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: stopping.set())
+    frames = metrics.FRAMES.labels(definition.name)
+    while not stopping.wait(0.05):
+        frames.inc(30)
+        stats = PipelineStats(definition.name, int(frames.value), 30.0, 0.25, len(definition.output_urls), 1)
+        try:
+            status_queue.put_nowait((stats, metrics.REGISTRY.collect(), None))
+        except queue.Full:
+            pass
+
+
+def _supervisor(*names: str, restart_max_seconds: float = 60.0) -> Supervisor:
+    definitions = [StreamDefinition(name=n, input_url="x", output_urls=["rtmp://a/1", "rtmp://b/2"], overlay_profile="none") for n in names]
+    return Supervisor(definitions, restart_max_seconds=restart_max_seconds, available_cpus=[0], pipeline_main=_stand_in_pipeline)
+
+
+def _poll_until(supervisor: Supervisor, cond: Any, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "condition not met"
+        supervisor.poll()
+        time.sleep(0.05)
+
+
+def test_crashed_pipeline_is_restarted_with_growing_backoff_without_touching_others() -> None:
+    supervisor = _supervisor("crash", "steady", restart_max_seconds=1.5)
+    crash, steady = supervisor._slots
+    waits: list[float] = []
+    supervisor.start()
+    try:
+        steady_pid = steady.process.pid if steady.process is not None else None
+        deadline = time.monotonic() + 30
+        while crash.restarts < 3:
+            assert time.monotonic() < deadline
+            backoff, restarts = crash.backoff, crash.restarts
+            supervisor.poll()
+            if crash.restarts > restarts:
+                waits.append(backoff)
+                exited_at = time.monotonic()
+                _poll_until(supervisor, lambda: crash.process is not None)
+                assert crash.started_at >= crash.next_start and crash.started_at - exited_at >= backoff - 0.1
+            time.sleep(0.02)
+        assert waits == [1.0, 1.5, 1.5]  # doubles, capped at restart_max_seconds
+        rows = {row["name"]: row for row in supervisor.status()}
+        assert rows["crash"]["restarts"] == 3
+        assert rows["steady"]["restarts"] == 0 and rows["steady"]["alive"] and rows["steady"]["pid"] == steady_pid
+    finally:
+        supervisor.stop(timeout=5)
+
+
+def test_status_and_metrics_arrive_through_the_queue_and_stop_is_clean() -> None:
+    supervisor = _supervisor("a", "b")
+    supervisor.start()
+    try:
+        _poll_until(supervisor, lambda: all(row["frames"] > 0 for row in supervisor.status()))
+        for row in supervisor.status():
+            assert row["alive"] and row["restarts"] == 0
+            assert (row["fps"], row["lag_seconds"], row["outputs_connected"], row["outputs"]) == (30.0, 0.25, 1, 2)
+        frames = [f for f in supervisor.pipeline_metric_families() if f.name == "worker_frames_total"]
+        streams = {dict(sample.labels)["stream"] for family in frames for sample in family.samples}
+        assert streams == {"a", "b"}  # one family per process, each with its own stream's counter
+    finally:
+        processes = [slot.process for slot in supervisor._slots]
+        supervisor.stop(timeout=5)
+    assert [p.exitcode for p in processes if p is not None] == [0, 0]  # exited on SIGTERM, not killed
+    assert not any(row["alive"] for row in supervisor.status())
+
+
+def test_status_queue_stays_bounded_while_the_supervisor_is_not_draining() -> None:
+    supervisor = _supervisor("a", "b")
+    supervisor.start()
+    try:
+        time.sleep(1.0)  # ~20 reports per stand-in, none drained
+        assert supervisor._status_queue.qsize() <= 4
+        _poll_until(supervisor, lambda: all(row["frames"] > 0 for row in supervisor.status()))
+    finally:
+        supervisor.stop(timeout=5)
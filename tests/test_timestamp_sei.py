@@ -0,0 +1,39 @@
+"""Timestamp SEI (stream_workers.encode): written per encoded frame, readable after remuxing to FLV, decodable."""
+
+from pathlib import Path
+
+import av
+from PIL import Image
+
+from stream_workers import encode
+
+
+def test_timestamp_sei_survives_flv_remux_and_keeps_the_stream_decodable(tmp_path: Path) -> None:
+    enc = encode.create_video_encoder(width=160, height=96, fps=30)
+    stamper = encode.TimestampStamper()
+    output = tmp_path / "out.flv"
+    with av.open(str(output), "w") as container:
+        stream = container.add_stream("h264", rate=30)
+        stream.width, stream.height, stream.pix_fmt = 160, 96, "yuv420p"
+        for i in range(40):
+            frame = av.VideoFrame.from_image(Image.new("RGB", (160, 96), (i * 6, 120, 200))).reformat(format="yuv420p")
+            frame.pts, frame.time_base = i, enc.time_base
+            stamper.ingested(i, 1000.0 + i)
+            for packet in encode.encode_frame(enc, frame, stamper=stamper):
+                packet.stream = stream
+                container.mux(packet)
+
+    with av.open(str(output)) as container:
+        stamps = [encode.read_timestamp_sei(bytes(p)) for p in container.demux(video=0) if p.size]
+    with av.open(str(output)) as container:
+        decoded = sum(1 for _ in container.decode(video=0))
+    assert [s.frame for s in stamps if s is not None] == list(range(40))
+    assert all(s is not None and s.ingest_time == 1000.0 + s.frame and s.processing_seconds > 0 for s in stamps)
+    assert decoded == 40
+
+
+def test_timestamp_sei_escapes_start_code_emulation() -> None:
+    stamp = encode.FrameTimestamp(0, 0.0, 0.0)  # all-zero payload: would contain 00 00 00 unescaped
+    nal = encode.timestamp_sei(stamp)
+    assert b"\x00\x00\x00" not in nal[4:] and b"\x00\x00\x01" not in nal[4:]
+    assert encode.read_timestamp_sei(nal) == stamp
@@ -0,0 +1,311 @@
+"""YouTube API helpers (overlay_api.youtube): access-token cache against a fake token endpoint and clock; ingestion
+provisioning with per-channel timeouts, last known URLs and the channel cache."""
+
+import json
+import threading
+import time
+import urllib.parse
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from config.settings import get_settings
+from overlay_api import youtube
+
+
+class TokenEndpoint:
+    """Local stand-in for Google's token endpoint: answers at-<n> with expires_in, after delay seconds."""
+
+    def __init__(self, expires_in: float = 1000.0, delay: float = 0.0) -> None:
+        self.grants: list[str] = []
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                form = urllib.parse.parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+                endpoint.grants.append(form["refresh_token"][0])
+                time.sleep(delay)
+                body = json.dumps({"access_token": f"at-{len(endpoint.grants)}", "expires_in": expires_in}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: object) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.handle_error = lambda request, client_address: None  # type: ignore[method-assign]  # timed-out clients
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/token"
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def oauth_client(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    monkeypatch.setenv("YOUTUBE__CLIENT_ID", "client")
+    monkeypatch.setenv("YOUTUBE__CLIENT_SECRET", "secret")
+    get_settings.cache_clear()
+    yield
+    get_settings.cache_clear()
+
+
+def _token_manager(monkeypatch: pytest.MonkeyPatch, endpoint: TokenEndpoint, **kwargs: Any) -> tuple[youtube.AccessTokenManager, FakeClock]:
+    monkeypatch.setattr(youtube, "TOKEN_URL", endpoint.url)
+    clock = FakeClock()
+    return youtube.AccessTokenManager(youtube._request_access_token, clock=clock, **kwargs), clock
+
+
+def test_token_is_refreshed_expiry_margin_early(oauth_client: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    endpoint = TokenEndpoint(expires_in=1000)
+    try:
+        manager, clock = _token_manager(monkeypatch, endpoint, expiry_margin_seconds=60, early_refresh_seconds=0)
+        assert manager.get("rt") == "at-1"
+        clock.now = 939.0
+        assert manager.get("rt") == "at-1" and endpoint.grants == ["rt"]
+        clock.now = 940.0  # 60 s before expiry: treated as expired, refreshed before returning
+        assert manager.get("rt") == "at-2" and endpoint.grants == ["rt", "rt"]
+    finally:
+        endpoint.close()
+
+
+def test_token_is_refreshed_in_background_before_the_margin(oauth_client: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    endpoint = TokenEndpoint(expires_in=1000, delay=0.2)
+    try:
+        manager, clock = _token_manager(monkeypatch, endpoint, expiry_margin_seconds=60, early_refresh_seconds=300)
+        assert manager.get("rt") == "at-1"
+        clock.now = 699.0
+        assert manager.get("rt") == "at-1" and manager.refreshes == 1
+        clock.now = 700.0  # within early_refresh_seconds: the cached token comes back at once, one refresh starts
+        started = time.monotonic()
+        assert [manager.get("rt") for _ in range(3)] == ["at-1"] * 3
+        assert time.monotonic() - started < 0.2
+        deadline = time.monotonic() + 5
+        while manager.refreshes < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert manager.get("rt") == "at-2" and endpoint.grants == ["rt", "rt"]
+    finally:
+        endpoint.close()
+
+
+def test_concurrent_refreshes_collapse_into_one_request(oauth_client: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    endpoint = TokenEndpoint(delay=0.2)
+    try:
+        manager, _ = _token_manager(monkeypatch, endpoint)
+        results: list[str | None] = []
+        threads = [threading.Thread(target=lambda: results.append(manager.get("rt"))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == ["at-1"] * 8 and endpoint.grants == ["rt"]
+        assert manager.get("other") == "at-2"  # other refresh tokens refresh on their own
+    finally:
+        endpoint.close()
+
+
+def test_hung_token_request_times_out(oauth_client: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    endpoint = TokenEndpoint(delay=0.5)
+    try:
+        monkeypatch.setattr(youtube, "GOOGLE_HTTP_TIMEOUT_SECONDS", 0.1)
+        manager, _ = _token_manager(monkeypatch, endpoint)
+        started = time.monotonic()
+        assert manager.get("rt") is None
+        assert time.monotonic() - started < 0.4
+    finally:
+        endpoint.close()
+
+
+def test_waiters_on_a_hung_refresh_give_up_with_the_still_valid_token() -> None:
+    release = threading.Event()
+    answers = iter([("at-1", 100.0)])
+
+    def fetch(refresh_token: str) -> tuple[str, float] | None:
+        answer = next(answers, None)
+        if answer is None:
+            release.wait(timeout=10)
+        return answer
+
+    clock = FakeClock()
+    manager = youtube.AccessTokenManager(fetch, expiry_margin_seconds=60, early_refresh_seconds=0, clock=clock, wait_timeout_seconds=0.1)
+    try:
+        assert manager.get("rt") == "at-1"
+        clock.now = 50.0  # inside the margin: the next get() refreshes, and that refresh hangs
+        threading.Thread(target=manager.get, args=("rt",), daemon=True).start()
+        while "rt" not in manager._inflight:
+            time.sleep(0.01)
+        assert manager.get("rt") == "at-1"  # gave up waiting; at-1 has not expired yet
+        clock.now = 100.0
+        assert manager.get("rt") is None
+    finally:
+        release.set()
+
+
+def test_401_from_youtube_invalidates_the_cached_token(oauth_client: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    endpoint = TokenEndpoint()
+    try:
+        manager, _ = _token_manager(monkeypatch, endpoint)
+        monkeypatch.setattr(youtube, "_token_manager_holder", [manager])
+        status = [401]
+
+        def provision_once(channel_id: str, refresh_token: str) -> str | None:
+            youtube.refresh_access_token(refresh_token)
+            raise HttpError(httplib2.Response({"status": status[0]}), b"{}")
+
+        monkeypatch.setattr(youtube, "_provision_channel_once", provision_once)
+        with pytest.raises(HttpError):
+            youtube._provision_channel("chan", "rt")
+        assert manager.get("rt") == "at-2"  # the rejected at-1 was dropped
+        status[0] = 403
+        with pytest.raises(HttpError):
+            youtube._provision_channel("chan", "rt")
+        assert manager.get("rt") == "at-2" and len(endpoint.grants) == 2  # other errors keep the token
+    finally:
+        endpoint.close()
+
+
+def test_parallel_first_use_creates_one_token_manager(oauth_client: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(youtube, "_token_manager_holder", [None])
+    created: list[object] = []
+    init = youtube.AccessTokenManager.__init__
+
+    def slow_init(self: youtube.AccessTokenManager, *args: Any, **kwargs: Any) -> None:
+        created.append(self)
+        time.sleep(0.05)  # widen the window between the holder check and the assignment
+        init(self, *args, **kwargs)
+
+    monkeypatch.setattr(youtube.AccessTokenManager, "__init__", slow_init)
+    with ThreadPoolExecutor(4) as pool:
+        managers = list(pool.map(lambda _: youtube.get_token_manager(), range(4)))
+    assert len(created) == 1 and all(m is created[0] for m in managers)
+
+
+@pytest.fixture
+def channels(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[threading.Event]:
+    """Channels a..d on two workers with a 0.3 s timeout; a, c and d take 0.2 s each, b hangs until the event is set."""
+    monkeypatch.setenv("YOUTUBE__CLIENT_ID", "client")
+    monkeypatch.setenv("YOUTUBE__CLIENT_SECRET", "secret")
+    monkeypatch.setenv("YOUTUBE__REFRESH_TOKENS", json.dumps({c: f"token-{c}" for c in "abcd"}))
+    monkeypatch.setenv("YOUTUBE__PROVISION_MAX_WORKERS", "2")
+    monkeypatch.setenv("YOUTUBE__PROVISION_TIMEOUT_SECONDS", "0.3")
+    monkeypatch.setenv("YOUTUBE__PUSH_CONF_PATH", str(tmp_path / "youtube_push.conf"))
+    get_settings.cache_clear()
+    monkeypatch.setattr(youtube, "_channel_cache", {})
+    monkeypatch.setattr(youtube, "_running_provisions", {})
+    monkeypatch.setattr(youtube, "reload_nginx", lambda: None)
+    release = threading.Event()
+
+    def provision(channel_id: str, refresh_token: str) -> str | None:
+        if channel_id == "b":
+            release.wait(timeout=10)
+            return "rtmp://yt/b-late"
+        time.sleep(0.2)
+        return f"rtmp://yt/{channel_id}"
+
+    monkeypatch.setattr(youtube, "_provision_channel", provision)
+    yield release
+    release.set()
+    get_settings.cache_clear()
+
+
+def test_timeout_is_per_channel_and_keeps_the_push_of_a_channel_without_url(channels: threading.Event) -> None:
+    youtube.write_push_conf(["rtmp://yt/a", "rtmp://yt/b-old"])
+    started = time.monotonic()
+    result = youtube.provision_ingestion_urls()
+    # c and d start once a finishes and get their own 0.3 s: the run takes longer than one timeout
+    assert result == youtube.IngestionUrls(("rtmp://yt/a", "rtmp://yt/c", "rtmp://yt/d"), ("b",))
+    assert time.monotonic() - started < 1.0
+
+    diff = youtube.apply_push_urls(list(result.urls), keep_deployed=bool(result.unresolved))
+    assert diff.removed == () and diff.added == ("rtmp://yt/c", "rtmp://yt/d")
+    assert youtube.read_push_conf() == ["rtmp://yt/a", "rtmp://yt/b-old", "rtmp://yt/c", "rtmp://yt/d"]
+
+
+def test_timed_out_channel_falls_back_to_its_cached_url(channels: threading.Event) -> None:
+    youtube._channel_cache["b"] = youtube.ChannelIngest(stream_id="s-b", rtmp_url="rtmp://yt/b-cached", broadcast_id=None)
+    result = youtube.provision_ingestion_urls()
+    assert result.unresolved == ()
+    assert set(result.urls) == {"rtmp://yt/a", "rtmp://yt/b-cached", "rtmp://yt/c", "rtmp://yt/d"}
+    assert youtube.get_ingestion_urls() == list(youtube.provision_ingestion_urls().urls)
+
+
+def test_channel_still_provisioning_from_an_earlier_run_is_not_submitted_again(
+    channels: threading.Event, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    youtube._channel_cache["b"] = youtube.ChannelIngest(stream_id="s-b", rtmp_url="rtmp://yt/b-cached", broadcast_id=None)
+    provision = youtube._provision_channel
+    submitted: list[str] = []
+
+    def record(channel_id: str, refresh_token: str) -> str | None:
+        submitted.append(channel_id)
+        return provision(channel_id, refresh_token)
+
+    monkeypatch.setattr(youtube, "_provision_channel", record)
+    first = youtube.provision_ingestion_urls()  # b times out and keeps running
+    second = youtube.provision_ingestion_urls()
+    assert sorted(submitted) == ["a", "a", "b", "c", "c", "d", "d"]
+    assert first == second and "rtmp://yt/b-cached" in second.urls
+    channels.set()
+    youtube._running_provisions["b"].result(timeout=5)
+    youtube.provision_ingestion_urls()
+    assert submitted.count("b") == 2  # submitted again once the earlier run finished
+
+
+def test_youtube_client_requests_time_out() -> None:
+    assert youtube._youtube_client("access")._http.http.timeout == youtube.GOOGLE_HTTP_TIMEOUT_SECONDS
+
+
+STREAM = {"id": "s1", "cdn": {"ingestionInfo": {"ingestionAddress": "a.rtmp.youtube.com/live2", "streamName": "key1"}}}
+
+
+class FakeYouTube:
+    """liveStreams.list returns STREAM; every liveBroadcasts call fails, so no broadcast can be bound."""
+
+    def __init__(self) -> None:
+        self.stream_lists: list[dict[str, Any]] = []
+
+    def liveStreams(self) -> "FakeYouTube":
+        return self
+
+    def list(self, **kwargs: Any) -> "FakeYouTube":
+        self.stream_lists.append(kwargs)
+        return self
+
+    def execute(self) -> dict[str, Any]:
+        return {"items": [STREAM]}
+
+    def liveBroadcasts(self) -> Any:
+        raise RuntimeError("liveBroadcasts quota exceeded")
+
+
+def test_stream_is_cached_even_when_no_broadcast_is_bound(monkeypatch: pytest.MonkeyPatch) -> None:
+    fake = FakeYouTube()
+    monkeypatch.setattr(youtube, "_channel_cache", {})
+    monkeypatch.setattr(youtube, "refresh_access_token", lambda refresh_token: "access")
+    monkeypatch.setattr(youtube, "_youtube_client", lambda access_token: fake)
+
+    url = youtube._provision_channel_once("chan", "refresh")
+    assert url == "rtmp://a.rtmp.youtube.com/live2/key1"
+    assert youtube._channel_cache["chan"] == youtube.ChannelIngest(stream_id="s1", rtmp_url=url, broadcast_id=None)
+
+    # Without a bound broadcast the next run provisions again (to bind one) instead of only re-checking the stream
+    assert youtube._provision_channel_once("chan", "refresh") == url
+    assert fake.stream_lists == [{"part": "id,cdn", "mine": True}, {"part": "id,cdn", "mine": True}]